@@ -21,6 +21,10 @@ import time
 # Image extensions that can be sent to vision-capable models
 _IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
 
+# get_messages page sizes
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
 
 # ─── System Prompts (dynamic — fetches company context at runtime) ────
 
@@ -243,9 +247,10 @@ Safety Rules:
 
 # Legacy compat: SYSTEM_PROMPTS dict still importable but now uses dynamic values
 class _DynamicPrompts:
-	"""Lazy dict-like object that generates prompts dynamically."""
+	"""Lazy dict-like object serving prompts from the per-worker prompt registry."""
 	def __getitem__(self, key):
-		return get_system_prompt(key)
+		from oly_ai.core.prompt_registry import get_prompt
+		return get_prompt(key)
 	def get(self, key, default=None):
 		try:
 			return self[key]
@@ -254,6 +259,55 @@ class _DynamicPrompts:
 
 SYSTEM_PROMPTS = _DynamicPrompts()
 
+
+def _build_llm_messages(mode, conversation, ctx):
+	"""Assemble provider messages as a stable prefix followed by a volatile suffix.
+
+	The compiled system prompt (instructions + company context) opens the list and
+	is marked as the prompt-cache breakpoint. Conversation history follows — between
+	turns it only grows, so OpenAI keeps reusing it too. Per-request context (RAG,
+	memories, @mentions, page, attachments) is folded into the final user message,
+	ahead of the question: it never breaks the prefix, and no system message trails
+	the conversation (several OpenAI-compatible chat templates reject that).
+
+	Args:
+		mode: chat mode (ask/agent/execute/research)
+		conversation: history messages, ending with the current user message
+		ctx: result of context_assembly.assemble_context
+	"""
+	from oly_ai.core.prompt_registry import get_compiled_prompt
+	from oly_ai.core.provider import CACHE_BREAKPOINT
+
+	prompt = get_compiled_prompt(mode)
+	llm_messages = [{"role": "system", "content": prompt.text, CACHE_BREAKPOINT: prompt.prefix_hash}]
+	llm_messages.extend(dict(m) for m in conversation)
+
+	blocks = []
+	if ctx.rag_context:
+		blocks.append(f"Relevant company documents:\n\n{ctx.rag_context}")
+	# Cross-session memory — remembered facts/preferences
+	if ctx.user_memories:
+		blocks.append(ctx.user_memories)
+	# @ Mention context — doctype schemas and referenced document data
+	blocks.extend(ctx.mention_blocks)
+	# Page context — current document data if the user is viewing a specific page
+	if ctx.page_context:
+		blocks.append(ctx.page_context)
+	# Non-image file attachments (PDF, Excel, CSV, etc.) for AI analysis
+	if ctx.file_context:
+		blocks.append(f"The user has attached the following file(s) for analysis:\n{ctx.file_context}")
+	if not blocks:
+		return llm_messages
+
+	context = "\n\n".join(blocks)
+	last = llm_messages[-1]
+	if last.get("role") == "user" and isinstance(last.get("content"), str):
+		last["content"] = f"{context}\n\n---\n\n{last['content']}"
+	else:
+		llm_messages.append({"role": "system", "content": context})
+	return llm_messages
+
+
 def _file_url_to_base64(file_url):
 	"""Convert a Frappe file URL to a base64 data URI for the vision API."""
 	try:
@@ -446,11 +500,25 @@ def create_session(title=None):
 
 
 @frappe.whitelist()
-def get_messages(session_name):
-	"""Get all messages for a chat session. User-scoped or shared.
+def get_messages(session_name, before_idx=None, limit=MESSAGE_PAGE_SIZE):
+	"""Get one page of a chat session's messages, newest first. User-scoped or shared.
+
+	Keyset pagination on idx: pass the returned next_before_idx as before_idx to
+	fetch the next (older) page.
+
+	Args:
+		session_name: AI Chat Session name
+		before_idx: (optional) only return messages with idx below this
+		limit: page size (capped at MAX_MESSAGE_PAGE_SIZE)
 
 	Returns:
-		list: [{"role", "content", "model", "cost", "tokens_input", "tokens_output", "creation"}]
+		dict: {
+			"messages": [{"idx", "role", "content", "model", "tokens_input", "tokens_output",
+			              "cost", "response_time", "creation"}],  # newest first
+			"has_more": bool,
+			"next_before_idx": int or None,
+			"total": int,
+		}
 	"""
 	user = frappe.session.user
 
@@ -462,17 +530,34 @@ def get_messages(session_name):
 		if not _is_shared_with(session_name, user):
 			frappe.throw(_("Access denied"), frappe.PermissionError)
 
+	limit = max(1, min(cint(limit) or MESSAGE_PAGE_SIZE, MAX_MESSAGE_PAGE_SIZE))
+	before_idx = cint(before_idx) if before_idx else None
+
+	# One extra row tells us whether an older page exists
 	messages = frappe.db.sql(
 		"""SELECT idx, role, content, model, tokens_input, tokens_output,
 		          cost, response_time, creation
 		FROM `tabAI Chat Message`
-		WHERE parent=%s
-		ORDER BY idx ASC""",
-		session_name,
+		WHERE parent=%(session)s AND parenttype='AI Chat Session' AND parentfield='messages'
+		{before}
+		ORDER BY idx DESC
+		LIMIT %(limit)s""".format(before="AND idx < %(before_idx)s" if before_idx else ""),
+		{"session": session_name, "before_idx": before_idx, "limit": limit + 1},
 		as_dict=True,
 	)
 
-	return messages
+	has_more = len(messages) > limit
+	messages = messages[:limit]
+
+	return {
+		"messages": messages,
+		"has_more": has_more,
+		"next_before_idx": messages[-1].idx if has_more else None,
+		"total": frappe.db.count(
+			"AI Chat Message",
+			{"parent": session_name, "parenttype": "AI Chat Session", "parentfield": "messages"},
+		),
+	}
 
 
 @frappe.whitelist()
@@ -613,8 +698,9 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 	if not rate_ok:
 		frappe.throw(_("Rate limit exceeded. Please wait {0} seconds.").format(retry_after))
 
-	# Load the session
-	session = frappe.get_doc("AI Chat Session", session_name)
+	# Load the session — summary plus the recent message window only
+	from oly_ai.core.memory import load_session_window
+	session = load_session_window(session_name)
 
 	# Auto-detect image generation requests BEFORE adding user message
 	# (to avoid duplicate messages when routing to image generation)
@@ -648,8 +734,7 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 			if session.title == "New Chat":
 				session.title = message[:60] + ("..." if len(message) > 60 else "")
 
-			session.flags.ignore_permissions = True
-			session.save()
+			session.save_new_messages(title=session.title)
 			frappe.db.commit()
 
 			return {
@@ -689,77 +774,17 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 		frappe.logger("oly_ai").debug(f"Access control check failed: {e}")
 		access = {"can_query_data": True, "can_execute_actions": False}
 
-	system_prompt = SYSTEM_PROMPTS.get(mode, SYSTEM_PROMPTS["ask"])
-
-	# Try RAG for context
-	rag_context = ""
-	sources = []
-	try:
-		from oly_ai.core.rag.retriever import build_rag_context
-		rag_context, sources = build_rag_context(message, top_k=5, min_score=0.7)
-	except Exception as e:
-		frappe.logger("oly_ai").debug(f"RAG context failed: {e}")
-
-	# Build messages for the LLM
-	llm_messages = [{"role": "system", "content": system_prompt}]
-	if rag_context:
-		llm_messages.append({
-			"role": "system",
-			"content": f"Relevant company documents:\n\n{rag_context}",
-		})
-
-	# Cross-session memory — inject remembered facts/preferences
-	try:
-		from oly_ai.core.long_term_memory import get_user_memories
-		user_memories = get_user_memories(user, message_context=message)
-		if user_memories:
-			llm_messages.append({
-				"role": "system",
-				"content": user_memories,
-			})
-	except Exception as e:
-		frappe.logger("oly_ai").debug(f"Long-term memory failed: {e}")
-
-	# @ Mention context — inject doctype schemas and/or specific document data
-	try:
-		doctype_only, specific_docs = _extract_doctype_mentions(message)
-		if doctype_only:
-			doctype_ctx = _build_doctype_context(doctype_only)
-			if doctype_ctx:
-				llm_messages.append({
-					"role": "system",
-					"content": doctype_ctx,
-				})
-		if specific_docs:
-			# Also inject the schema for referenced doctypes
-			ref_doctypes = list({dt for dt, _ in specific_docs})
-			schema_ctx = _build_doctype_context(ref_doctypes)
-			if schema_ctx:
-				llm_messages.append({
-					"role": "system",
-					"content": schema_ctx,
-				})
-			doc_ctx = _build_specific_document_context(specific_docs)
-			if doc_ctx:
-				llm_messages.append({
-					"role": "system",
-					"content": doc_ctx,
-				})
-	except Exception as e:
-		frappe.logger("oly_ai").debug(f"Mention context failed: {e}")
-
-	# Page context — inject current document data if user is viewing a specific page
-	try:
-		page_ctx = _build_page_context(page_doctype, page_docname, list_doctype, page_trail)
-		if page_ctx:
-			llm_messages.append({
-				"role": "system",
-				"content": page_ctx,
-			})
-	except Exception as e:
-		frappe.logger("oly_ai").debug(f"Page context failed: {e}")
+	# RAG, memories, @mentions, page and attachment context — gathered concurrently
+	from oly_ai.core.context_assembly import assemble_context
+	ctx = assemble_context(
+		message, user,
+		page_doctype=page_doctype, page_docname=page_docname,
+		list_doctype=list_doctype, page_trail=page_trail, file_urls=file_urls,
+	)
+	sources = ctx.sources
 
-	llm_messages.extend(conversation)
+	# Build messages for the LLM — cacheable system prompt first, per-request context last
+	llm_messages = _build_llm_messages(mode, conversation, ctx)
 
 	# Resolve file uploads for vision
 	parsed_files = []
@@ -770,34 +795,13 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 			frappe.logger("oly_ai").debug(f"File URL parse failed: {e}")
 			parsed_files = []
 
-	# If images are attached, replace the last user message content with multipart
+	# If images are attached, turn the last user message (context + question) into multipart
 	if parsed_files:
-		last_user_content = _build_multipart_content(message, parsed_files)
-		# Replace the last user message in llm_messages
 		for i in range(len(llm_messages) - 1, -1, -1):
 			if llm_messages[i].get("role") == "user":
-				llm_messages[i]["content"] = last_user_content
+				llm_messages[i]["content"] = _build_multipart_content(llm_messages[i]["content"], parsed_files)
 				break
 
-	# Parse non-image file attachments (PDF, Excel, CSV, etc.) for AI analysis
-	if parsed_files:
-		try:
-			from oly_ai.core.file_parser import parse_files_for_context, SUPPORTED_EXTENSIONS
-			non_image_files = [
-				f for f in parsed_files
-				if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
-				and os.path.splitext(f)[1].lower() not in _IMAGE_EXTS
-			]
-			if non_image_files:
-				file_context = parse_files_for_context(non_image_files)
-				if file_context:
-					llm_messages.append({
-						"role": "system",
-						"content": f"The user has attached the following file(s) for analysis:\n{file_context}",
-					})
-		except Exception as e:
-			frappe.logger("oly_ai").debug(f"File parsing failed: {e}")
-
 	# Determine model: use per-request override, else session/settings default
 	model = model or settings.default_model
 	requested_model = model
@@ -835,6 +839,8 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 		# Max 5 iterations to prevent infinite loops.
 		total_input_tokens = 0
 		total_output_tokens = 0
+		total_cached_tokens = 0
+		total_cache_write_tokens = 0
 		try:
 			MAX_TOOL_ROUNDS = min(max(cint(frappe.db.get_single_value("AI Settings", "max_tool_rounds")) or 10, 1), 25)
 		except Exception:
@@ -853,6 +859,8 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 				raise
 			total_input_tokens += result.get("tokens_input", 0)
 			total_output_tokens += result.get("tokens_output", 0)
+			total_cached_tokens += result.get("tokens_cached", 0)
+			total_cache_write_tokens += result.get("tokens_cache_write", 0)
 
 			tool_calls = result.get("tool_calls")
 
@@ -906,7 +914,10 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 				f"Used '{result.get('model') or model}' instead.\n\n" + final_content
 			)
 
-		cost = track_usage(result.get("model") or model, total_input_tokens, total_output_tokens, user)
+		cost = track_usage(
+			result.get("model") or model, total_input_tokens, total_output_tokens, user,
+			tokens_cached=total_cached_tokens, tokens_cache_write=total_cache_write_tokens,
+		)
 
 		# Add assistant response to session
 		session.append("messages", {
@@ -919,16 +930,14 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 			"response_time": result["response_time"],
 		})
 
-		# Update session totals
-		session.total_tokens = (session.total_tokens or 0) + total_input_tokens + total_output_tokens
-		session.total_cost = (session.total_cost or 0) + cost
-
 		# Auto-title from first user message
 		if session.title == "New Chat" and len([m for m in session.messages if m.role == "user"]) == 1:
 			session.title = message[:60] + ("..." if len(message) > 60 else "")
 
-		session.flags.ignore_permissions = True
-		session.save()
+		# Insert only the new rows; session totals are bumped atomically
+		session.save_new_messages(
+			tokens=total_input_tokens + total_output_tokens, cost=cost, title=session.title
+		)
 		frappe.db.commit()
 
 		# Summarize session if it's getting long
@@ -966,12 +975,12 @@ def send_message(session_name, message, model=None, mode=None, file_urls=None,
 			"sources": sources,
 			"session_title": session.title,
 			"pending_actions": pending_actions if pending_actions else None,
+			"timings": {"context": ctx.timings},
 		}
 
 	except Exception as e:
 		# Still save the user message even on error
-		session.flags.ignore_permissions = True
-		session.save()
+		session.save_new_messages()
 		frappe.db.commit()
 		raise
 
@@ -1399,13 +1408,10 @@ def _do_generate_image(session, prompt, user, settings, size="1024x1024", qualit
 		"response_time": response_time,
 	})
 
-	session.total_cost = (session.total_cost or 0) + estimated_cost
-
 	if session.title == "New Chat":
 		session.title = prompt[:60] + ("..." if len(prompt) > 60 else "")
 
-	session.flags.ignore_permissions = True
-	session.save()
+	session.save_new_messages(cost=estimated_cost, title=session.title)
 	frappe.db.commit()
 
 	return {
@@ -1469,7 +1475,8 @@ def generate_image(session_name, prompt, size="1024x1024", quality="standard"):
 	if not allowed:
 		frappe.throw(_(reason))
 
-	session = frappe.get_doc("AI Chat Session", session_name)
+	from oly_ai.core.memory import load_session_window
+	session = load_session_window(session_name, window=0)
 
 	# Add user message
 	session.append("messages", {"role": "user", "content": prompt})
@@ -1478,8 +1485,7 @@ def generate_image(session_name, prompt, size="1024x1024", quality="standard"):
 		return _do_generate_image(session, prompt, user, settings, size=size, quality=quality)
 
 	except Exception as e:
-		session.flags.ignore_permissions = True
-		session.save()
+		session.save_new_messages()
 		frappe.db.commit()
 		raise
 
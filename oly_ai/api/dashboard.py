@@ -5,6 +5,11 @@ import frappe
 from frappe import _
 from frappe.utils import nowdate, getdate, add_days, add_months, get_first_day, get_last_day
 
+from oly_ai.core.cache import get_embedding_cache_stats
+from oly_ai.core.context import get_context_cache_stats
+from oly_ai.core.cost_tracker import get_prompt_cache_stats
+from oly_ai.core.http_pool import get_pool_stats
+
 
 @frappe.whitelist()
 def get_dashboard_data(from_date=None, to_date=None):
@@ -61,6 +66,19 @@ def get_dashboard_data(from_date=None, to_date=None):
 	""", (month_start, period_end + " 23:59:59"))[0][0]
 	cache_rate = round((cached_count / month_requests * 100) if month_requests > 0 else 0, 1)
 
+	# Semantic cache hits and the ones users reported as wrong answers
+	semantic = frappe.db.sql("""
+		SELECT COUNT(*) as hits, COALESCE(SUM(cache_false_hit), 0) as false_hits
+		FROM `tabAI Audit Log`
+		WHERE cached = 1 AND cache_similarity > 0 AND creation >= %s AND creation <= %s
+	""", (month_start, period_end + " 23:59:59"), as_dict=True)[0]
+
+	# RAG query-embedding cache (counters live in Redis, not the audit log)
+	embedding_cache = get_embedding_cache_stats(month_start, period_end)
+	context_cache = get_context_cache_stats(month_start, period_end)
+	# Provider-side prompt caching (cached input tokens and what they saved)
+	prompt_cache = get_prompt_cache_stats(month_start, period_end)
+
 	# Error rate
 	error_count = frappe.db.sql("""
 		SELECT COUNT(*) FROM `tabAI Audit Log`
@@ -144,6 +162,14 @@ def get_dashboard_data(from_date=None, to_date=None):
 			"input_tokens": int(month_tokens.input_tokens),
 			"output_tokens": int(month_tokens.output_tokens),
 			"cache_rate": cache_rate,
+			"embedding_cache_rate": embedding_cache["hit_rate"],
+			"embedding_cache_lookups": embedding_cache["hits"] + embedding_cache["misses"],
+			"context_cache_rate": context_cache["hit_rate"],
+			"context_cache_lookups": context_cache["hits"] + context_cache["misses"],
+			"prompt_cache_rate": prompt_cache["cached_rate"],
+			"prompt_cache_saved": prompt_cache["saved_usd"],
+			"semantic_cache_hits": int(semantic.hits),
+			"semantic_cache_false_hits": int(semantic.false_hits),
 			"error_rate": error_rate,
 			"avg_response_time": round(float(avg_time), 2),
 			"provider": settings.provider_type,
@@ -157,4 +183,5 @@ def get_dashboard_data(from_date=None, to_date=None):
 		"top_doctypes": top_doctypes,
 		"daily_trend": daily_trend,
 		"recent_logs": recent_logs,
+		"provider_connections": get_pool_stats(),
 	}
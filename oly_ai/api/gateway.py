@@ -6,16 +6,20 @@ import frappe
 from frappe import _
 
 from oly_ai.core.provider import LLMProvider
-from oly_ai.core.cache import get_cached_response, set_cached_response
+from oly_ai.core.cache import doc_tag, get_cached_response, set_cached_response
+from oly_ai.core import semantic_cache
 from oly_ai.core.cost_tracker import check_budget, track_usage, estimate_cost
 from oly_ai.core.context import get_document_context, build_messages
 
 
-def _log_audit(user, feature, doctype, name, model, prompt, response_text, tokens_in, tokens_out, cost, response_time, status, error="", cached=False):
-	"""Create an audit log entry."""
+def _log_audit(user, feature, doctype, name, model, prompt, response_text, tokens_in, tokens_out, cost, response_time, status, error="", cached=False, semantic_hit=None):
+	"""Create an audit log entry. Returns its name (None when audit logging is off).
+
+	semantic_hit: the semantic_cache.lookup() result when serving a similar-query hit.
+	"""
 	settings = frappe.get_cached_doc("AI Settings")
 	if not settings.enable_audit_logging:
-		return
+		return None
 
 	try:
 		log = frappe.new_doc("AI Audit Log")
@@ -30,6 +34,9 @@ def _log_audit(user, feature, doctype, name, model, prompt, response_text, token
 		log.estimated_cost_usd = cost
 		log.response_time = response_time
 		log.cached = cached
+		if semantic_hit:
+			log.cache_similarity = semantic_hit.similarity
+			log.cache_entry = semantic_hit.entry
 
 		if settings.log_prompts:
 			log.prompt_text = prompt
@@ -41,6 +48,7 @@ def _log_audit(user, feature, doctype, name, model, prompt, response_text, token
 		log.flags.ignore_permissions = True
 		log.insert()
 		frappe.db.commit()
+		return log.name
 	except Exception as e:
 		frappe.logger("oly_ai").error(f"Failed to log audit: {e}")
 
@@ -104,6 +112,23 @@ def ai_assist(doctype, name, feature, custom_prompt=None):
 			"cost": 0,
 		}
 
+	# 6b. Semantic cache — a similar request on this same document version
+	scope = semantic_cache.get_scope(feature, model, user, doctype, name, context=context)
+	hit = semantic_cache.lookup(user_prompt, scope, settings)
+	if hit:
+		audit_log = _log_audit(
+			user, feature, doctype, name, model, user_prompt, hit.response.get("content", ""),
+			0, 0, 0, 0, "Cached", cached=True, semantic_hit=hit,
+		)
+		return {
+			"content": hit.response.get("content", ""),
+			"model": model,
+			"cached": True,
+			"cost": 0,
+			"cache_similarity": hit.similarity,
+			"audit_log": audit_log,
+		}
+
 	# 7. Call LLM
 	try:
 		provider = LLMProvider(settings)
@@ -116,10 +141,15 @@ def ai_assist(doctype, name, feature, custom_prompt=None):
 		result = provider.chat(messages, model=model, temperature=temperature, max_tokens=max_tokens)
 
 		# 8. Track cost
-		cost = track_usage(model, result["tokens_input"], result["tokens_output"], user)
+		cost = track_usage(
+			model, result["tokens_input"], result["tokens_output"], user,
+			tokens_cached=result.get("tokens_cached", 0),
+			tokens_cache_write=result.get("tokens_cache_write", 0),
+		)
 
 		# 9. Cache response
-		set_cached_response(messages, model, result, feature)
+		set_cached_response(messages, model, result, feature, tags=[doc_tag(doctype, name)])
+		semantic_cache.store(user_prompt, scope, result, settings)
 
 		# 10. Audit log
 		_log_audit(
@@ -173,6 +203,26 @@ def ask_erp(question):
 
 	model = settings.default_model
 
+	# Semantic cache — a similar question already answered for the same roles.
+	# Checked before the exact-key cache on purpose: that key covers the RAG context,
+	# so reaching it means paying for retrieval first.
+	scope = semantic_cache.get_scope("Ask AI", model, user)
+	hit = semantic_cache.lookup(question, scope, settings)
+	if hit:
+		audit_log = _log_audit(
+			user, "Ask AI", "", "", model, question, hit.response.get("content", ""),
+			0, 0, 0, 0, "Cached", cached=True, semantic_hit=hit,
+		)
+		return {
+			"content": hit.response.get("content", ""),
+			"model": model,
+			"cached": True,
+			"cost": 0,
+			"sources": hit.response.get("sources") or [],
+			"cache_similarity": hit.similarity,
+			"audit_log": audit_log,
+		}
+
 	# Try RAG retrieval for relevant context
 	rag_context = ""
 	sources = []
@@ -238,8 +288,13 @@ Rules:
 	try:
 		provider = LLMProvider(settings)
 		result = provider.chat(messages, model=model)
-		cost = track_usage(model, result["tokens_input"], result["tokens_output"], user)
+		cost = track_usage(
+			model, result["tokens_input"], result["tokens_output"], user,
+			tokens_cached=result.get("tokens_cached", 0),
+			tokens_cache_write=result.get("tokens_cache_write", 0),
+		)
 		set_cached_response(messages, model, result, "Ask AI")
+		semantic_cache.store(question, scope, dict(result, sources=sources), settings)
 		_log_audit(user, "Ask AI", "", "", model, question, result["content"], result["tokens_input"], result["tokens_output"], cost, result["response_time"], "Success")
 
 		return {
@@ -254,6 +309,33 @@ Rules:
 		raise
 
 
+@frappe.whitelist()
+def report_cache_false_hit(audit_log):
+	"""Flag a semantic cache hit as wrong for the question asked, and evict the entry.
+
+	Args:
+		audit_log: AI Audit Log name returned with the cached response
+
+	Returns:
+		dict: {"success": True}
+	"""
+	user = frappe.session.user
+	log = frappe.db.get_value(
+		"AI Audit Log", audit_log, ["user", "cache_entry", "cache_false_hit"], as_dict=True
+	)
+	if not log or not log.cache_entry:
+		frappe.throw(_("Not a semantic cache hit"))
+	if log.user != user and "System Manager" not in frappe.get_roles(user):
+		frappe.throw(_("Access denied"), frappe.PermissionError)
+
+	if not log.cache_false_hit:
+		semantic_cache.evict(log.cache_entry)
+		frappe.db.set_value("AI Audit Log", audit_log, "cache_false_hit", 1, update_modified=False)
+		frappe.db.commit()
+
+	return {"success": True}
+
+
 @frappe.whitelist()
 def get_ai_status():
 	"""Get current AI status — budget, usage, provider info. For the settings dashboard."""
@@ -3,6 +3,7 @@
 # Uses frappe.publish_realtime to push tokens to the client as they arrive.
 
 import json
+import re
 import time
 import uuid
 
@@ -10,10 +11,21 @@ import frappe
 from frappe import _
 from frappe.utils import cint
 
-from oly_ai.core.provider import LLMProvider
+from oly_ai.core.provider import LLMProvider, cache_usage
 from oly_ai.core.cost_tracker import check_budget, track_usage
 from oly_ai.core.utils import is_model_unavailable_error, get_fallback_model
 
+# ai_chunk coalescing: publish when this much time has passed since the last
+# publish, when the buffer reaches FLUSH_MAX_CHARS, or at a sentence boundary
+FLUSH_INTERVAL_MS = 40
+FLUSH_MAX_CHARS = 256
+_SENTENCE_END_RE = re.compile(r"[.!?:\n]\s*$")
+
+# Per-task replay buffer (Redis stream) for clients that reconnect mid-stream
+STREAM_BUFFER_KEY = "oly_ai:stream:"
+STREAM_BUFFER_TTL_SEC = 600
+STREAM_BUFFER_MAXLEN = 5000
+
 
 @frappe.whitelist()
 def send_message_stream(session_name, message, model=None, mode=None, file_urls=None,
@@ -24,10 +36,13 @@ def send_message_stream(session_name, message, model=None, mode=None, file_urls=
 	The actual LLM call runs in the background, streaming tokens via frappe.publish_realtime.
 
 	Client should listen for:
-	  - "ai_chunk"  → {"task_id", "chunk"}    — each token/chunk of text
+	  - "ai_chunk"  → {"task_id", "chunk"}    — coalesced text since the last chunk
 	  - "ai_done"   → {"task_id", "content", "model", "cost", ...}  — final result
 	  - "ai_error"  → {"task_id", "error"}    — error occurred
 
+	Every event carries a "seq"; after a reconnect, resume_stream(task_id, after_seq)
+	replays whatever the client missed.
+
 	Returns:
 		dict: {"task_id", "session_name"}
 	"""
@@ -67,18 +82,25 @@ def send_message_stream(session_name, message, model=None, mode=None, file_urls=
 	if model and not _is_valid_model_name(model):
 		frappe.throw(_("Invalid model name: {0}").format(model))
 
-	# Add user message to session first
-	session = frappe.get_doc("AI Chat Session", session_name)
+	# Add user message to session first (only the recent window is loaded)
+	from oly_ai.core.memory import load_session_window
+	session = load_session_window(session_name)
 	session.append("messages", {"role": "user", "content": message})
 
 	# Auto-title from first user message
 	if session.title == "New Chat" and len([m for m in session.messages if m.role == "user"]) == 1:
 		session.title = message[:60] + ("..." if len(message) > 60 else "")
 
-	session.flags.ignore_permissions = True
-	session.save()
+	session.save_new_messages(title=session.title)
 	frappe.db.commit()
 
+	# Let this user resume the stream from its replay buffer
+	try:
+		cache = frappe.cache()
+		cache.set(cache.make_key(f"{STREAM_BUFFER_KEY}{task_id}:owner"), user, ex=STREAM_BUFFER_TTL_SEC)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Stream buffer owner write failed: {e}")
+
 	# Enqueue the streaming job
 	frappe.enqueue(
 		"oly_ai.api.stream._process_stream",
@@ -104,19 +126,68 @@ def send_message_stream(session_name, message, model=None, mode=None, file_urls=
 	}
 
 
+@frappe.whitelist()
+def resume_stream(task_id, after_seq=0):
+	"""Replay a stream's buffered events after `after_seq` for a reconnecting client.
+
+	Each event's "data" is the payload that was published for it.
+
+	Returns:
+		dict: {"events": [{"seq", "event", "data"}, ...], "last_seq": int,
+		       "expired": bool — True when the buffer is gone (stream too old)}
+	"""
+	after_seq = cint(after_seq)
+	cache = frappe.cache()
+	owner = cache.get(cache.make_key(f"{STREAM_BUFFER_KEY}{task_id}:owner"))
+	if not owner:
+		return {"events": [], "last_seq": after_seq, "expired": True}
+	if isinstance(owner, bytes):
+		owner = owner.decode()
+	if owner != frappe.session.user:
+		frappe.throw(_("Access denied"), frappe.PermissionError)
+
+	entries = cache.xrange(
+		cache.make_key(f"{STREAM_BUFFER_KEY}{task_id}"),
+		min=f"{after_seq + 1}-0", max="+",
+	)
+	events = []
+	for entry_id, fields in entries:
+		fields = {
+			(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+			for k, v in fields.items()
+		}
+		entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+		seq = int(entry_id.split("-")[0])
+		if fields.get("event") == "chunk":
+			events.append({
+				"seq": seq,
+				"event": "ai_chunk",
+				"data": {"task_id": task_id, "chunk": fields.get("data", ""), "seq": seq},
+			})
+		else:
+			events.append({"seq": seq, "event": fields.get("event"), "data": json.loads(fields.get("data") or "{}")})
+
+	return {
+		"events": events,
+		"last_seq": events[-1]["seq"] if events else after_seq,
+		"expired": False,
+	}
+
+
 def _process_stream(task_id, session_name, message, model, mode, user, file_urls=None,
 					page_doctype=None, page_docname=None, list_doctype=None, page_trail=None):
 	"""Background job: stream LLM response via realtime events."""
-	import os
-	import base64
-	import mimetypes
+	job_start = time.perf_counter()
+	# Publishes every event for this task and buffers it for resume_stream
+	publisher = ChunkPublisher(task_id, user)
 
 	try:
 		frappe.set_user(user)
 		settings = frappe.get_cached_doc("AI Settings")
-		session = frappe.get_doc("AI Chat Session", session_name)
+		from oly_ai.core.memory import load_session_window
+		session = load_session_window(session_name)
 
-		# Build conversation history (last 20 messages)
+		# Build conversation history (recent window)
 		conversation = []
 		for msg in session.messages[-20:]:
 			conversation.append({"role": msg.role, "content": msg.content})
@@ -126,88 +197,40 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 			from oly_ai.core.access_control import check_mode_access
 			check_mode_access(user, mode)
 		except frappe.PermissionError:
-			frappe.publish_realtime(
+			publisher.emit(
 				"ai_error",
 				{"task_id": task_id, "error": "Access denied for this mode"},
-				user=user,
 			)
 			return
 		except Exception as e:
 			frappe.log_error(f"Access control error for {user}/{mode}: {e}", "AI Stream Access")
-			frappe.publish_realtime(
+			publisher.emit(
 				"ai_error",
 				{"task_id": task_id, "error": "Access check failed. Please try again."},
-				user=user,
 			)
 			return
 
-		# System prompt
-		from oly_ai.api.chat import SYSTEM_PROMPTS
-		system_prompt = SYSTEM_PROMPTS.get(mode, SYSTEM_PROMPTS["ask"])
-
-		# RAG context
-		rag_context = ""
-		sources = []
-		try:
-			from oly_ai.core.rag.retriever import build_rag_context
-			rag_context, sources = build_rag_context(message, top_k=5, min_score=0.7)
-		except Exception as e:
-			frappe.logger("oly_ai").debug(f"RAG context failed: {e}")
-
-		# Build LLM messages
-		llm_messages = [{"role": "system", "content": system_prompt}]
-		if rag_context:
-			llm_messages.append({
-				"role": "system",
-				"content": f"Relevant company documents:\n\n{rag_context}",
-			})
-
-		# Cross-session memory — inject remembered facts/preferences
-		try:
-			from oly_ai.core.long_term_memory import get_user_memories
-			user_memories = get_user_memories(user, message_context=message)
-			if user_memories:
-				llm_messages.append({
-					"role": "system",
-					"content": user_memories,
-				})
-		except Exception as e:
-			frappe.logger("oly_ai").debug(f"Long-term memory failed: {e}")
+		# RAG, memories, @mentions, page and attachment context — gathered concurrently
+		from oly_ai.core.context_assembly import assemble_context
+		ctx = assemble_context(
+			message, user,
+			page_doctype=page_doctype, page_docname=page_docname,
+			list_doctype=list_doctype, page_trail=page_trail, file_urls=file_urls,
+		)
+		sources = ctx.sources
+		# Per-stage latency (ms since the job started), sent with ai_done
+		timings = {"context_ms": ctx.timings.pop("total", None), "context": ctx.timings}
 
 		# Memory: include conversation summary if available
 		try:
 			from oly_ai.core.memory import get_session_context
-			memory_messages = get_session_context(session)
-			llm_messages.extend(memory_messages)
+			conversation = get_session_context(session)
 		except Exception as e:
 			frappe.logger("oly_ai").debug(f"Session memory failed: {e}")
-			llm_messages.extend(conversation)
 
-		# @ Mention context — inject doctype schemas if user referenced @DocType
-		try:
-			from oly_ai.api.chat import _extract_doctype_mentions, _build_doctype_context
-			mentioned_doctypes = _extract_doctype_mentions(message)
-			if mentioned_doctypes:
-				doctype_ctx = _build_doctype_context(mentioned_doctypes)
-				if doctype_ctx:
-					llm_messages.append({
-						"role": "system",
-						"content": doctype_ctx,
-					})
-		except Exception as e:
-			frappe.logger("oly_ai").debug(f"Mention context failed: {e}")
-
-		# Page context — inject current document data if user is viewing a specific document
-		try:
-			from oly_ai.api.chat import _build_page_context
-			page_ctx = _build_page_context(page_doctype, page_docname, list_doctype, page_trail)
-			if page_ctx:
-				llm_messages.append({
-					"role": "system",
-					"content": page_ctx,
-				})
-		except Exception as e:
-			frappe.logger("oly_ai").debug(f"Page context failed: {e}")
+		# Build LLM messages — cacheable system prompt first, per-request context last
+		from oly_ai.api.chat import _build_llm_messages
+		llm_messages = _build_llm_messages(mode, conversation, ctx)
 
 		# Handle file uploads for vision
 		if file_urls:
@@ -215,36 +238,16 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 				parsed_files = json.loads(file_urls) if isinstance(file_urls, str) else file_urls
 				if parsed_files:
 					from oly_ai.api.chat import _build_multipart_content
-					last_user_content = _build_multipart_content(message, parsed_files)
+					# The last user message carries the folded context + question
 					for i in range(len(llm_messages) - 1, -1, -1):
 						if llm_messages[i].get("role") == "user":
-							llm_messages[i]["content"] = last_user_content
+							llm_messages[i]["content"] = _build_multipart_content(
+								llm_messages[i]["content"], parsed_files
+							)
 							break
 			except Exception as e:
 				frappe.logger("oly_ai").debug(f"File upload vision parse failed: {e}")
 
-		# Parse non-image file attachments (PDF, Excel, CSV, etc.) for AI analysis
-		if file_urls:
-			try:
-				import os
-				parsed_file_list = json.loads(file_urls) if isinstance(file_urls, str) else file_urls
-				from oly_ai.core.file_parser import parse_files_for_context, SUPPORTED_EXTENSIONS
-				from oly_ai.api.chat import _IMAGE_EXTS
-				non_image_files = [
-					f for f in (parsed_file_list or [])
-					if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
-					and os.path.splitext(f)[1].lower() not in _IMAGE_EXTS
-				]
-				if non_image_files:
-					file_context = parse_files_for_context(non_image_files)
-					if file_context:
-						llm_messages.append({
-							"role": "system",
-							"content": f"The user has attached the following file(s) for analysis:\n{file_context}",
-						})
-			except Exception as e:
-				frappe.logger("oly_ai").debug(f"File parsing failed: {e}")
-
 		# Get tools for agent/execute modes
 		tools = None
 		try:
@@ -269,72 +272,80 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 		except Exception as e:
 			frappe.logger("oly_ai").debug(f"PII filter skipped: {e}")
 
-		# If tools are available, we can't stream the tool-calling loop easily.
-		# Fall back to non-streaming for tool calling rounds, stream the final response.
+		# If tools are available, every round is streamed: text goes to the client as it
+		# arrives and tool calls are assembled from the stream's deltas.
 		if tools:
+			# Falling back is only safe while nothing has reached the client or run: the
+			# first attempt works on a copy of the messages, and any event it published
+			# (text, tool calls) rules the retry out
+			published = (publisher.seq, publisher.deltas)
 			try:
 				_process_with_tools(
-					task_id, provider, llm_messages, model, tools,
+					task_id, provider, list(llm_messages), model, tools,
 					user, session, session_name, sources, start_time, mode,
+					timings=timings, job_start=job_start, publisher=publisher,
 				)
 				return
 			except Exception as e:
 				fallback = get_fallback_model(model, settings)
-				if fallback and is_model_unavailable_error(e):
+				started = (publisher.seq, publisher.deltas) != published
+				if fallback and not started and is_model_unavailable_error(e):
 					_process_with_tools(
 						task_id, provider, llm_messages, fallback, tools,
 						user, session, session_name, sources, start_time, mode,
-						requested_model=requested_model,
+						requested_model=requested_model, timings=timings, job_start=job_start, publisher=publisher,
 					)
 					return
 				raise
 
 		# Stream the response
 		full_content = ""
-		tokens_input = 0
-		tokens_output = 0
+		usage = {}
 
 		def _run_stream(cur_model):
 			full = ""
-			t_in = 0
-			t_out = 0
+			usage = {}
+			timings["request_ms"] = _elapsed_ms(job_start)
 			for event in provider.chat_stream(llm_messages, model=cur_model):
 				if event["type"] == "chunk":
+					timings.setdefault("first_token_ms", _elapsed_ms(job_start))
 					full += event["content"]
-					frappe.publish_realtime(
-						"ai_chunk",
-						{"task_id": task_id, "chunk": event["content"]},
-						user=user,
-					)
+					publisher.add(event["content"])
 				elif event["type"] == "usage":
-					t_in = event["usage"].get("prompt_tokens", 0)
-					t_out = event["usage"].get("completion_tokens", 0)
-			return full, t_in, t_out
+					usage = event["usage"]
+			publisher.flush()
+			return full, usage
 
+		published = publisher.deltas
 		try:
-			full_content, tokens_input, tokens_output = _run_stream(model)
+			full_content, usage = _run_stream(model)
 		except Exception as e:
 			fallback = get_fallback_model(model, settings)
-			if fallback and is_model_unavailable_error(e):
+			# Only retry on another model if no text was streamed yet
+			if fallback and publisher.deltas == published and is_model_unavailable_error(e):
 				model = fallback
-				full_content, tokens_input, tokens_output = _run_stream(model)
+				full_content, usage = _run_stream(model)
 				full_content = (
 					f"⚠️ Requested model '{requested_model}' is not available for this API key/provider. "
 					f"Used '{model}' instead.\n\n" + full_content
 				)
 			else:
-				frappe.publish_realtime(
+				publisher.emit(
 					"ai_error",
 					{"task_id": task_id, "error": str(e)},
-					user=user,
 				)
 				return
 
 		response_time = round(time.time() - start_time, 2)
-		cost = track_usage(model, tokens_input, tokens_output, user)
+		tokens_input = usage.get("prompt_tokens", 0)
+		tokens_output = usage.get("completion_tokens", 0)
+		tokens_cached, tokens_cache_write = cache_usage(usage)
+		cost = track_usage(
+			model, tokens_input, tokens_output, user,
+			tokens_cached=tokens_cached, tokens_cache_write=tokens_cache_write,
+		)
 
-		# Save assistant message to session
-		session.reload()
+		# Save assistant message to session (only the new row; totals updated atomically)
 		session.append("messages", {
 			"role": "assistant",
 			"content": full_content,
@@ -344,10 +355,7 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 			"cost": cost,
 			"response_time": response_time,
 		})
-		session.total_tokens = (session.total_tokens or 0) + tokens_input + tokens_output
-		session.total_cost = (session.total_cost or 0) + cost
-		session.flags.ignore_permissions = True
-		session.save()
+		session.save_new_messages(tokens=tokens_input + tokens_output, cost=cost)
 		frappe.db.commit()
 
 		# Summarize session if it's getting long
@@ -364,8 +372,12 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 		except Exception as e:
 			frappe.logger("oly_ai").debug(f"Memory extraction failed: {e}")
 
+		frappe.logger("oly_ai").info(
+			f"Stream {task_id} stage timings: {timings}; chunk publishes: {publisher.stats()}"
+		)
+
 		# Send done event
-		frappe.publish_realtime(
+		publisher.emit(
 			"ai_done",
 			{
 				"task_id": task_id,
@@ -376,22 +388,23 @@ def _process_stream(task_id, session_name, message, model, mode, user, file_urls
 				"response_time": response_time,
 				"sources": sources,
 				"session_title": session.title,
+				"timings": timings,
+				"publish_stats": publisher.stats(),
 			},
-			user=user,
 		)
 
 	except Exception as e:
-		frappe.publish_realtime(
+		publisher.emit(
 			"ai_error",
 			{"task_id": task_id, "error": str(e)},
-			user=user,
 		)
 		frappe.log_error(f"Stream error: {e}", "AI Stream")
 
 
-def _process_with_tools(task_id, provider, llm_messages, model, tools, user, session, session_name, sources, start_time, mode, requested_model=None):
-	"""Handle tool-calling flow: run tool rounds non-streamed, then stream the final response."""
-	from oly_ai.core.tools import execute_tool
+def _process_with_tools(task_id, provider, llm_messages, model, tools, user, session, session_name, sources, start_time, mode, requested_model=None,
+						timings=None, job_start=None, publisher=None):
+	"""Handle tool-calling flow: stream each round, running tools until the model answers."""
+	from oly_ai.core.tools import execute_tools
 
 	try:
 		MAX_TOOL_ROUNDS = min(max(cint(frappe.db.get_single_value("AI Settings", "max_tool_rounds")) or 10, 1), 25)
@@ -399,61 +412,74 @@ def _process_with_tools(task_id, provider, llm_messages, model, tools, user, ses
 		MAX_TOOL_ROUNDS = 10
 	total_input_tokens = 0
 	total_output_tokens = 0
+	total_cached_tokens = 0
+	total_cache_write_tokens = 0
 	pending_actions = []
+	streamed = ""
+	timings = timings if timings is not None else {}
+	job_start = job_start or time.perf_counter()
+	publisher = publisher or ChunkPublisher(task_id, user)
 
 	for _round in range(MAX_TOOL_ROUNDS):
-		result = provider.chat(llm_messages, model=model, tools=tools)
-		total_input_tokens += result.get("tokens_input", 0)
-		total_output_tokens += result.get("tokens_output", 0)
-
-		tool_calls = result.get("tool_calls")
+		round_content = ""
+		round_tool_calls = {}
+		timings.setdefault("request_ms", _elapsed_ms(job_start))
+		for event in provider.chat_stream(llm_messages, model=model, tools=tools):
+			if event["type"] == "chunk":
+				timings.setdefault("first_token_ms", _elapsed_ms(job_start))
+				chunk = event["content"]
+				# Separate text from an earlier round (e.g. "Let me check…") from this one
+				if not round_content and streamed and not streamed.endswith("\n"):
+					chunk = "\n\n" + chunk
+				round_content += event["content"]
+				streamed += chunk
+				publisher.add(chunk)
+			elif event["type"] == "tool_call_delta":
+				timings.setdefault("first_tool_call_ms", _elapsed_ms(job_start))
+				_merge_tool_call_deltas(round_tool_calls, event["delta"])
+			elif event["type"] == "usage":
+				total_input_tokens += event["usage"].get("prompt_tokens", 0)
+				total_output_tokens += event["usage"].get("completion_tokens", 0)
+				cached, written = cache_usage(event["usage"])
+				total_cached_tokens += cached
+				total_cache_write_tokens += written
+		# Deliver buffered text before tool indicators or the done event
+		publisher.flush()
+
+		tool_calls = [round_tool_calls[i] for i in sorted(round_tool_calls)]
 		if not tool_calls:
-			# No more tool calls — stream this final text content
-			final_content = result.get("content") or ""
-
-			# Send as streamed chunks (simulate streaming for consistent UX)
-			chunk_size = 4
-			words = final_content.split(" ")
-			for i in range(0, len(words), chunk_size):
-				chunk = " ".join(words[i:i + chunk_size])
-				if i > 0:
-					chunk = " " + chunk
-				frappe.publish_realtime(
-					"ai_chunk",
-					{"task_id": task_id, "chunk": chunk},
-					user=user,
-				)
-				time.sleep(0.02)  # Small delay for smooth rendering
+			# No more tool calls — the answer has already been streamed
+			final_content = streamed
 			break
 
 		# Process tool calls
-		assistant_msg = {"role": "assistant", "content": result.get("content")}
-		if tool_calls:
-			assistant_msg["tool_calls"] = tool_calls
-
-			# Notify client about tool usage
-			for tc in tool_calls:
-				frappe.publish_realtime(
-					"ai_tool_call",
-					{
-						"task_id": task_id,
-						"tool_name": tc["function"]["name"],
-						"arguments": tc["function"]["arguments"],
-					},
-					user=user,
-				)
+		assistant_msg = {"role": "assistant", "content": round_content or None, "tool_calls": tool_calls}
+
+		# Notify client about tool usage
+		for tc in tool_calls:
+			publisher.emit(
+				"ai_tool_call",
+				{
+					"task_id": task_id,
+					"tool_name": tc["function"]["name"],
+					"arguments": tc["function"]["arguments"],
+				},
+			)
 
 		llm_messages.append(assistant_msg)
 
+		calls = []
 		for tc in tool_calls:
-			fn_name = tc["function"]["name"]
 			try:
 				fn_args = json.loads(tc["function"]["arguments"])
 			except json.JSONDecodeError:
 				fn_args = {}
+			calls.append((tc["function"]["name"], fn_args))
 
-			tool_result = execute_tool(fn_name, fn_args, user=user)
+		# Read-only calls of this round run concurrently; results keep call order
+		tool_results = execute_tools(calls, user=user)
 
+		for tc, tool_result in zip(tool_calls, tool_results):
 			# Check for pending action
 			try:
 				parsed_result = json.loads(tool_result)
@@ -472,18 +498,20 @@ def _process_with_tools(task_id, provider, llm_messages, model, tools, user, ses
 				"content": tool_result,
 			})
 	else:
-		final_content = result.get("content") or ""
+		final_content = streamed
 
 	response_time = round(time.time() - start_time, 2)
-	cost = track_usage(model, total_input_tokens, total_output_tokens, user)
+	cost = track_usage(
+		model, total_input_tokens, total_output_tokens, user,
+		tokens_cached=total_cached_tokens, tokens_cache_write=total_cache_write_tokens,
+	)
 	if requested_model and requested_model != model:
 		final_content = (
 			f"⚠️ Requested model '{requested_model}' is not available for this API key/provider. "
 			f"Used '{model}' instead.\n\n" + final_content
 		)
 
-	# Save to session
-	session.reload()
+	# Save to session (only the new row; totals updated atomically)
 	session.append("messages", {
 		"role": "assistant",
 		"content": final_content,
@@ -493,14 +521,15 @@ def _process_with_tools(task_id, provider, llm_messages, model, tools, user, ses
 		"cost": cost,
 		"response_time": response_time,
 	})
-	session.total_tokens = (session.total_tokens or 0) + total_input_tokens + total_output_tokens
-	session.total_cost = (session.total_cost or 0) + cost
-	session.flags.ignore_permissions = True
-	session.save()
+	session.save_new_messages(tokens=total_input_tokens + total_output_tokens, cost=cost)
 	frappe.db.commit()
 
+	frappe.logger("oly_ai").info(
+		f"Stream {task_id} stage timings: {timings}; chunk publishes: {publisher.stats()}"
+	)
+
 	# Send done event
-	frappe.publish_realtime(
+	publisher.emit(
 		"ai_done",
 		{
 			"task_id": task_id,
@@ -512,6 +541,120 @@ def _process_with_tools(task_id, provider, llm_messages, model, tools, user, ses
 			"sources": sources,
 			"session_title": session.title,
 			"pending_actions": pending_actions if pending_actions else None,
+			"timings": timings,
+			"publish_stats": publisher.stats(),
 		},
-		user=user,
 	)
+
+
+class ChunkPublisher:
+	"""Publishes a task's realtime events and buffers them for reconnecting clients.
+
+	Provider deltas are often one or two tokens; publishing each is a Redis
+	publish plus a socket.io fan-out. The first delta goes out immediately,
+	later ones are coalesced into one "ai_chunk" until FLUSH_INTERVAL_MS has
+	passed, the buffer reaches FLUSH_MAX_CHARS, or a sentence ends.
+
+	Every published event carries a sequence number and is appended to a capped
+	Redis stream (STREAM_BUFFER_KEY + task_id) so resume_stream can replay what
+	a client missed. Other events go through emit(), which flushes pending text
+	first so ordering is preserved.
+	"""
+
+	def __init__(self, task_id, user, interval_ms=FLUSH_INTERVAL_MS, max_chars=FLUSH_MAX_CHARS):
+		self.task_id = task_id
+		self.user = user
+		self.interval = interval_ms / 1000.0
+		self.max_chars = max_chars
+		self.buffer = []
+		self.size = 0
+		self.last_publish = None
+		self.seq = 0
+		self.deltas = 0
+		self.publishes = 0
+		self.chars = 0
+
+	def add(self, text):
+		if not text:
+			return
+		self.deltas += 1
+		self.buffer.append(text)
+		self.size += len(text)
+
+		now = time.perf_counter()
+		if (
+			self.last_publish is None
+			or now - self.last_publish >= self.interval
+			or self.size >= self.max_chars
+			or _SENTENCE_END_RE.search(text)
+		):
+			self.flush(now)
+
+	def flush(self, now=None):
+		if not self.buffer:
+			return
+		chunk = "".join(self.buffer)
+		self.buffer = []
+		self.size = 0
+		self.seq += 1
+		self._buffer_event("chunk", chunk)
+		frappe.publish_realtime(
+			"ai_chunk",
+			{"task_id": self.task_id, "chunk": chunk, "seq": self.seq},
+			user=self.user,
+		)
+		self.publishes += 1
+		self.chars += len(chunk)
+		self.last_publish = now or time.perf_counter()
+
+	def emit(self, event, data):
+		"""Publish a non-chunk event ("ai_tool_call", "ai_done", "ai_error") in order."""
+		self.flush()
+		self.seq += 1
+		data = dict(data, seq=self.seq)
+		self._buffer_event(event, json.dumps(data, default=str))
+		frappe.publish_realtime(event, data, user=self.user)
+
+	def stats(self):
+		"""Per-task counts: provider deltas received vs realtime publishes made."""
+		return {"deltas": self.deltas, "publishes": self.publishes, "chars": self.chars}
+
+	def _buffer_event(self, event, data):
+		try:
+			cache = frappe.cache()
+			key = cache.make_key(f"{STREAM_BUFFER_KEY}{self.task_id}")
+			cache.xadd(
+				key, {"event": event, "data": data}, id=f"{self.seq}-0",
+				maxlen=STREAM_BUFFER_MAXLEN, approximate=True,
+			)
+			if self.seq == 1 or event != "chunk":
+				# Terminal events restart the TTL so late reconnects can still see them
+				cache.expire(key, STREAM_BUFFER_TTL_SEC)
+				cache.set(cache.make_key(f"{STREAM_BUFFER_KEY}{self.task_id}:owner"), self.user, ex=STREAM_BUFFER_TTL_SEC)
+		except Exception as e:
+			frappe.logger("oly_ai").debug(f"Stream buffer write failed: {e}")
+
+
+def _elapsed_ms(since):
+	return round((time.perf_counter() - since) * 1000, 1)
+
+
+def _merge_tool_call_deltas(tool_calls, deltas):
+	"""Merge streamed tool_call deltas into complete OpenAI-format calls, keyed by index.
+
+	The first delta for an index carries the id and function name; later ones only
+	append argument fragments.
+	"""
+	for delta in deltas or []:
+		call = tool_calls.setdefault(delta.get("index", len(tool_calls)), {
+			"id": "",
+			"type": "function",
+			"function": {"name": "", "arguments": ""},
+		})
+		if delta.get("id"):
+			call["id"] = delta["id"]
+		function = delta.get("function") or {}
+		if function.get("name"):
+			call["function"]["name"] = function["name"]
+		if function.get("arguments"):
+			call["function"]["arguments"] += function["arguments"]
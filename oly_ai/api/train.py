@@ -1,9 +1,25 @@
 # Copyright (c) 2026, OLY Technologies and contributors
 # Training API — Index management, bulk indexing, stats, and auto-reindex hooks
 
+import time
+
 import frappe
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.utils import cint, now_datetime
+
+# Redis sorted set of (doctype, name) awaiting auto-index, scored by last change time
+AUTO_INDEX_QUEUE_KEY = "oly_ai:auto_index:dirty"
+# Documents drained per run of process_auto_index_queue (the rest wait a minute)
+AUTO_INDEX_DRAIN_LIMIT = 500
+_KEY_SEP = "\x1f"
+
+# Bumped on every AI Settings save so all workers rebuild their auto-index set
+AUTO_INDEX_VERSION_KEY = "oly_ai:auto_index:version"
+# Seconds a worker trusts its set before re-checking the shared version
+AUTO_INDEX_RECHECK_SEC = 5
+
+# site -> (frozenset of auto-indexed doctypes, version, monotonic time checked)
+_auto_index_doctypes = {}
 
 
 @frappe.whitelist()
@@ -39,7 +55,7 @@ def discover_doctypes():
 		# Translation / patches
 		"Translation", "Patch Log", "DefaultValue",
 		# oly_ai internal tables (already used differently)
-		"AI Document Index", "AI Chat Session", "AI Chat Message",
+		"AI Document Index", "AI Index Term", "AI Chat Session", "AI Chat Message",
 		"AI Action Log", "AI User Memory", "AI Chat Shared User",
 	}
 
@@ -116,23 +132,10 @@ def index_doctype_full(doctype, limit=500):
 	"""
 	frappe.only_for(["System Manager", "Administrator"])
 
-	from oly_ai.core.rag.indexer import index_document
+	from oly_ai.core.rag.indexer import index_documents
 
 	docs = frappe.get_all(doctype, limit=int(limit), pluck="name")
-	results = {"indexed": 0, "skipped": 0, "errors": 0}
-
-	for name in docs:
-		try:
-			result = index_document(doctype, name)
-			if result["status"] == "indexed":
-				results["indexed"] += 1
-			elif result["status"] == "skipped":
-				results["skipped"] += 1
-			else:
-				results["errors"] += 1
-		except Exception as e:
-			frappe.log_error(f"Index error: {doctype}/{name}: {e}", "AI Training")
-			results["errors"] += 1
+	results = index_documents(doctype, docs, publish_progress=True)
 
 	# Update the indexed doctype stats in AI Settings
 	_update_doctype_stats(doctype, results)
@@ -181,8 +184,12 @@ def clear_all_index_data():
 
 	count = frappe.db.count("AI Document Index")
 	frappe.db.sql("DELETE FROM `tabAI Document Index`")
+	frappe.db.sql("DELETE FROM `tabAI Index Term`")
 	frappe.db.commit()
 
+	from oly_ai.core.rag.vector_index import reset_vector_index
+	reset_vector_index()
+
 	# Reset stats in AI Settings
 	settings = frappe.get_doc("AI Settings")
 	for row in settings.get("indexed_doctypes", []):
@@ -209,11 +216,45 @@ def clear_doctype_index(doctype):
 	frappe.db.sql(
 		"DELETE FROM `tabAI Document Index` WHERE reference_doctype = %s", doctype
 	)
+	frappe.db.sql(
+		"DELETE FROM `tabAI Index Term` WHERE reference_doctype = %s", doctype
+	)
 	frappe.db.commit()
 
+	from oly_ai.core.rag.vector_index import reset_vector_index
+	reset_vector_index()
+
 	return {"deleted": count}
 
 
+@frappe.whitelist()
+def rebuild_ann_index():
+	"""Queue a rebuild of the IVF approximate-search index."""
+	frappe.only_for(["System Manager", "Administrator"])
+
+	frappe.enqueue(
+		"oly_ai.core.rag.ann.build_ann_index",
+		queue="long",
+		timeout=3600,
+		deduplicate=True,
+		job_id="oly_ai_build_ann_index",
+	)
+	return {"status": "queued"}
+
+
+@frappe.whitelist()
+def evaluate_ann_recall(k=10, samples=50, nprobe=8):
+	"""Compare IVF search against exact search on stored vectors.
+
+	Returns:
+		dict: {"recall_at_k", "avg_scanned_pct", "exact_ms", "ann_ms", ...}
+	"""
+	frappe.only_for(["System Manager", "Administrator"])
+
+	from oly_ai.core.rag.ann import evaluate_recall
+	return evaluate_recall(k=int(k), samples=int(samples), nprobe=int(nprobe))
+
+
 def _update_doctype_stats(doctype, results):
 	"""Update the AI Indexed DocType child table stats after indexing."""
 	try:
@@ -262,18 +303,94 @@ def auto_index_on_trash(doc, method=None):
 	_queue_auto_index(doc.doctype, doc.name, "delete")
 
 
-def _queue_auto_index(doctype, name, action):
-	"""Queue an auto-index job if this DocType is configured for auto-indexing."""
+def get_auto_index_doctypes():
+	"""Return the frozenset of DocTypes with auto-index enabled (cached per worker).
+
+	The wildcard doc_events hooks run on every save in the system, so this is
+	normally a dict lookup plus a clock read; the shared version in Redis is
+	only consulted every AUTO_INDEX_RECHECK_SEC seconds.
+	"""
+	site = getattr(frappe.local, "site", None) or ""
+	entry = _auto_index_doctypes.get(site)
+	now = time.monotonic()
+	if entry and now - entry[2] < AUTO_INDEX_RECHECK_SEC:
+		return entry[0]
+
+	version = _get_auto_index_version()
+	if entry and entry[1] == version:
+		_auto_index_doctypes[site] = (entry[0], version, now)
+		return entry[0]
+
+	settings = frappe.get_cached_doc("AI Settings")
+	doctypes = frozenset(
+		row.document_type
+		for row in settings.get("indexed_doctypes", [])
+		if row.enabled and row.auto_index
+	)
+	_auto_index_doctypes[site] = (doctypes, version, now)
+	return doctypes
+
+
+def invalidate_auto_index_doctypes():
+	"""Drop the cached auto-index set here and tell other workers to rebuild theirs."""
+	site = getattr(frappe.local, "site", None) or ""
+	_auto_index_doctypes.pop(site, None)
 	try:
-		# Quick check — is this DocType in the indexed list with auto_index enabled?
+		cache = frappe.cache()
+		cache.incr(cache.make_key(AUTO_INDEX_VERSION_KEY))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Auto-index version bump failed: {e}")
+
+
+def _get_auto_index_version():
+	try:
+		cache = frappe.cache()
+		return int(cache.get(cache.make_key(AUTO_INDEX_VERSION_KEY)) or 0)
+	except Exception:
+		return 0
+
+
+def benchmark_auto_index_hook(iterations=100000):
+	"""Micro-benchmark: per-save cost of the auto-index hook for a non-indexed DocType.
+
+	Run with: bench --site <site> execute oly_ai.api.train.benchmark_auto_index_hook
+
+	Returns:
+		dict: {"iterations", "fast_path_us", "settings_scan_us"} — microseconds per save
+	"""
+	iterations = int(iterations)
+	doc = frappe._dict(doctype="__oly_ai_benchmark__", name="x")
+
+	get_auto_index_doctypes()
+	start = time.perf_counter()
+	for _i in range(iterations):
+		auto_index_on_update(doc)
+	fast = time.perf_counter() - start
+
+	# Previous behaviour: load settings and rebuild the list on every save
+	start = time.perf_counter()
+	for _i in range(iterations):
 		settings = frappe.get_cached_doc("AI Settings")
 		auto_doctypes = [
 			row.document_type
 			for row in settings.get("indexed_doctypes", [])
 			if row.enabled and row.auto_index
 		]
+		doc.doctype in auto_doctypes
+	scan = time.perf_counter() - start
+
+	return {
+		"iterations": iterations,
+		"fast_path_us": round(fast / iterations * 1e6, 3),
+		"settings_scan_us": round(scan / iterations * 1e6, 3),
+	}
+
 
-		if doctype not in auto_doctypes:
+def _queue_auto_index(doctype, name, action):
+	"""Queue an auto-index job if this DocType is configured for auto-indexing."""
+	try:
+		# Quick check — is this DocType in the indexed list with auto_index enabled?
+		if doctype not in get_auto_index_doctypes():
 			return
 
 		if action == "delete":
@@ -282,21 +399,133 @@ def _queue_auto_index(doctype, name, action):
 				"DELETE FROM `tabAI Document Index` WHERE reference_doctype = %s AND reference_name = %s",
 				(doctype, name),
 			)
-		else:
-			# Queue indexing in background to avoid slowing down saves
-			frappe.enqueue(
-				"oly_ai.core.rag.indexer.index_document",
-				doctype=doctype,
-				name=name,
-				queue="short",
-				deduplicate=True,
-				job_id=f"oly_ai_index_{doctype}_{name}",
+			frappe.db.sql(
+				"DELETE FROM `tabAI Index Term` WHERE reference_doctype = %s AND reference_name = %s",
+				(doctype, name),
 			)
+			# Tell workers to drop the rows once the delete is committed
+			from oly_ai.core.rag.vector_index import mark_document_changed
+			frappe.db.after_commit.add(lambda: mark_document_changed(doctype, name))
+		else:
+			# Mark dirty once the save commits; process_auto_index_queue indexes it
+			# after the debounce window, coalescing repeated saves
+			frappe.db.after_commit.add(lambda: _mark_dirty(doctype, name))
 	except Exception:
 		# Never break the parent save operation
 		pass
 
 
+def _mark_dirty(doctype, name):
+	"""Add (or re-stamp) a document in the auto-index queue."""
+	try:
+		cache = frappe.cache()
+		cache.zadd(cache.make_key(AUTO_INDEX_QUEUE_KEY), {f"{doctype}{_KEY_SEP}{name}": time.time()})
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Auto-index queue update failed: {e}")
+
+
+def process_auto_index_queue():
+	"""Scheduled task: hand due documents to a drain job on the long queue.
+
+	The cron only checks whether anything has outlived the debounce window; the
+	embedding work runs in drain_auto_index_queue, one job at a time.
+	"""
+	settings = frappe.get_cached_doc("AI Settings")
+	debounce = max(0, cint(settings.get("auto_index_debounce")))
+
+	cache = frappe.cache()
+	if not cache.zcount(cache.make_key(AUTO_INDEX_QUEUE_KEY), "-inf", time.time() - debounce):
+		return
+
+	frappe.enqueue(
+		"oly_ai.api.train.drain_auto_index_queue",
+		queue="long",
+		timeout=3600,
+		deduplicate=True,
+		job_id="oly_ai_drain_auto_index",
+	)
+
+
+def drain_auto_index_queue():
+	"""Index documents whose last save is older than the debounce window.
+
+	Documents are grouped per DocType and go through the batched embedding pipeline
+	together. An entry leaves the queue only after its document indexed (or was
+	skipped as unchanged), and only if its score is unchanged — a save landing
+	mid-run keeps the document queued. Documents that failed are re-stamped and
+	retried after another debounce window; entries of a DocType that no longer
+	exists are dropped.
+	"""
+	settings = frappe.get_cached_doc("AI Settings")
+	debounce = max(0, cint(settings.get("auto_index_debounce")))
+
+	cache = frappe.cache()
+	key = cache.make_key(AUTO_INDEX_QUEUE_KEY)
+	entries = cache.zrangebyscore(
+		key, "-inf", time.time() - debounce, start=0, num=AUTO_INDEX_DRAIN_LIMIT, withscores=True
+	)
+	if not entries:
+		return
+
+	by_doctype = {}
+	for member, score in entries:
+		if isinstance(member, bytes):
+			member = member.decode()
+		doctype, _sep, name = member.partition(_KEY_SEP)
+		by_doctype.setdefault(doctype, []).append((name, member, score))
+
+	from oly_ai.core.rag.indexer import index_documents
+
+	for doctype, queued in by_doctype.items():
+		failed = set()
+		# Entries of a DocType deleted or renamed meanwhile are simply dropped
+		if frappe.db.exists("DocType", doctype):
+			try:
+				# Skip documents deleted while they waited in the queue
+				names = frappe.get_all(doctype, filters={"name": ["in", [q[0] for q in queued]]}, pluck="name")
+				if names:
+					result = index_documents(doctype, names)
+					failed.update(result["failed"])
+					frappe.logger("oly_ai").info(
+						f"Auto-index: {doctype} — {result['indexed']} indexed, "
+						f"{result['skipped']} skipped, {result['errors']} errors"
+					)
+			except Exception as e:
+				frappe.log_error(f"Auto-index error for {doctype}: {e}", "AI Training")
+				failed.update(q[0] for q in queued)
+
+		if failed:
+			# Retry after another debounce window
+			now = time.time()
+			cache.zadd(key, {member: now for name, member, _score in queued if name in failed})
+		_dequeue_if_unchanged(
+			cache, key, [(member, score) for name, member, score in queued if name not in failed]
+		)
+
+
+# Removes each member only while its score is still the one the drain read
+_DEQUEUE_IF_UNCHANGED = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+	local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+	if score and tonumber(score) == tonumber(ARGV[i + 1]) then
+		removed = removed + redis.call('ZREM', KEYS[1], ARGV[i])
+	end
+end
+return removed
+"""
+
+
+def _dequeue_if_unchanged(cache, key, entries):
+	"""Atomically drop (member, score) entries that were not re-stamped meanwhile."""
+	if not entries:
+		return 0
+	args = []
+	for member, score in entries:
+		args += [member, repr(float(score))]
+	return cache.eval(_DEQUEUE_IF_UNCHANGED, 1, key, *args)
+
+
 def scheduled_reindex():
 	"""Scheduled task: Nightly full re-index of all configured DocTypes."""
 	try:
@@ -319,5 +548,14 @@ def scheduled_reindex():
 			except Exception as e:
 				frappe.log_error(f"Nightly reindex error for {dt}: {e}", "AI Training")
 
+		# Refresh IVF partitions so approximate search tracks the new content
+		from oly_ai.core.rag import ann
+		if ann.is_enabled(settings):
+			try:
+				result = ann.build_ann_index()
+				frappe.logger("oly_ai").info(f"Nightly IVF rebuild: {result}")
+			except Exception as e:
+				frappe.log_error(f"Nightly IVF rebuild failed: {e}", "AI Training")
+
 	except Exception as e:
 		frappe.log_error(f"Scheduled reindex failed: {e}", "AI Training")
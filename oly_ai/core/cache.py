@@ -1,17 +1,81 @@
 # Copyright (c) 2026, OLY Technologies and contributors
 # Response caching to reduce API costs by 60-80%
+# Two tiers: a small per-worker LRU in front of Redis, bounded by bytes, with tags
+# for targeted invalidation (a document save drops only that document's answers)
+# Query-embedding cache: in-process LRU in front of Redis, keyed by model + normalized text
 
 import hashlib
 import json
+import re
+import threading
 import time
+from collections import OrderedDict
 
 import frappe
+from frappe.utils import add_days, date_diff, getdate, nowdate
+from frappe.utils.redis_wrapper import RedisWrapper
+
+# Response cache (Redis keys are site-scoped via frappe.cache().make_key):
+#   <RESPONSE_KEY><sha256>   JSON {"response", "cached_at"}
+#   RESPONSE_LRU_KEY         zset  entry key → last use (eviction order)
+#   RESPONSE_SIZES_KEY       hash  entry key → payload bytes
+#   RESPONSE_TAGS_KEY        hash  entry key → its tags (so dropping it cleans the tag sets)
+#   RESPONSE_BYTES_KEY       int   total payload bytes (checked against the budget)
+#   <RESPONSE_TAG_KEY><tag>  set   entry keys carrying the tag
+#   RESPONSE_DOCTYPES_KEY    set   doctypes with doc-tagged entries (gates the save hook)
+RESPONSE_KEY = "oly_ai:resp:"
+RESPONSE_LRU_KEY = "oly_ai:resp_meta:lru"
+RESPONSE_SIZES_KEY = "oly_ai:resp_meta:sizes"
+RESPONSE_TAGS_KEY = "oly_ai:resp_meta:tags"
+RESPONSE_BYTES_KEY = "oly_ai:resp_meta:bytes"
+RESPONSE_TAG_KEY = "oly_ai:resp_tag:"
+RESPONSE_DOCTYPES_KEY = "oly_ai:resp_meta:doctypes"
+# Bumped on every eviction / invalidation so workers drop their in-process copies
+RESPONSE_GENERATION_KEY = "oly_ai:resp_meta:generation"
+# Redis tier budget when AI Settings has none
+DEFAULT_CACHE_MAX_MB = 64
+# In-process tier per worker and site
+RESPONSE_LRU_MAX_BYTES = 4 * 1024 * 1024
+CLEAR_BATCH = 500
+# Seconds a worker trusts its copy of a cached-doctypes set (see has_cached_doctype)
+CACHED_DOCTYPES_RECHECK_SEC = 5
+_TAG_SEP = "\x1f"
+
+# Query embeddings kept per worker process (a 1536-dim vector is ~6 KB)
+EMBEDDING_LRU_SIZE = 256
+# Redis tier lifetime — embeddings only change with the model, which is part of the key
+EMBEDDING_TTL_SEC = 7 * 24 * 3600
+# Daily hit/miss counters kept for the AI Usage dashboard
+LOOKUP_STATS_TTL_SEC = 90 * 24 * 3600
+EMBEDDING_STATS_KEY = "oly_ai:embedding_cache:stats:"
+
+_response_lru = {}
+_response_lock = threading.Lock()
+# (site, set key) -> (frozenset of doctypes, monotonic time read)
+_cached_doctypes = {}
+_embedding_lru = OrderedDict()
+_embedding_lock = threading.Lock()
+
+
+def raw_redis(cache):
+	"""Return plain redis-py commands for frappe.cache().
+
+	RedisWrapper's hash and set helpers (hget, hset, hgetall, hdel, sadd, smembers)
+	apply make_key a second time and pickle values. Keys here are already built
+	with make_key and values are plain strings, so those commands go through this.
+	"""
+	return super(RedisWrapper, cache)
 
 
 def get_cache_key(messages, model, feature=""):
 	"""Generate a deterministic cache key from messages + model."""
 	content = json.dumps({"messages": messages, "model": model, "feature": feature}, sort_keys=True)
-	return f"oly_ai:{hashlib.sha256(content.encode()).hexdigest()}"
+	return f"{RESPONSE_KEY}{hashlib.sha256(content.encode()).hexdigest()}"
+
+
+def doc_tag(doctype, name):
+	"""Tag for responses derived from one document (see invalidate_tags)."""
+	return f"doc:{doctype}:{name}"
 
 
 def get_cached_response(messages, model, feature=""):
@@ -21,51 +85,391 @@ def get_cached_response(messages, model, feature=""):
 		return None
 
 	cache_key = get_cache_key(messages, model, feature)
-	cached = frappe.cache().get_value(cache_key)
+	try:
+		cache = frappe.cache()
+		site = _sync_response_lru(cache)
+
+		data = _lru_get(site, cache_key)
+		if data is None:
+			raw = cache.get(cache.make_key(cache_key))
+			if not raw:
+				return None
+			data = json.loads(raw)
+			_lru_put(site, cache_key, data, len(raw))
 
-	if cached:
-		try:
-			data = json.loads(cached)
-			# Check TTL
-			ttl_hours = settings.cache_ttl_hours or 0
-			if ttl_hours > 0:
-				cached_at = data.get("cached_at", 0)
-				if time.time() - cached_at > ttl_hours * 3600:
-					frappe.cache().delete_value(cache_key)
-					return None
-			return data.get("response")
-		except (json.JSONDecodeError, KeyError):
+		# Check TTL
+		ttl_hours = settings.cache_ttl_hours or 0
+		if ttl_hours > 0 and time.time() - data.get("cached_at", 0) > ttl_hours * 3600:
+			_drop_responses(cache, [cache_key])
 			return None
 
-	return None
+		cache.zadd(cache.make_key(RESPONSE_LRU_KEY), {cache_key: time.time()})
+		return data.get("response")
+	except (json.JSONDecodeError, KeyError):
+		return None
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Response cache read failed: {e}")
+		return None
+
 
+def set_cached_response(messages, model, response, feature="", tags=None):
+	"""Cache a response.
 
-def set_cached_response(messages, model, response, feature=""):
-	"""Cache a response."""
+	`tags` (e.g. doc_tag(doctype, name)) let invalidate_tags drop just the entries
+	tied to something that changed. When the Redis tier grows past the AI Settings
+	byte budget, the least recently used entries are evicted.
+	"""
 	settings = frappe.get_cached_doc("AI Settings")
 	if not settings.enable_caching:
 		return
 
 	cache_key = get_cache_key(messages, model, feature)
 	ttl_hours = settings.cache_ttl_hours or 4
+	ttl_sec = ttl_hours * 3600 if ttl_hours > 0 else None
+	tags = list(tags or [])
 
 	data = {
 		"response": response,
 		"cached_at": time.time(),
 	}
+	payload = json.dumps(data)
+	size = len(payload.encode())
+	max_bytes = (settings.get("cache_max_size_mb") or DEFAULT_CACHE_MAX_MB) * 1024 * 1024
+	# One oversized answer must not flush a large part of the cache
+	if size > max_bytes // 10:
+		return
 
-	# Store in Redis with TTL
-	frappe.cache().set_value(
-		cache_key,
-		json.dumps(data),
-		expires_in_sec=ttl_hours * 3600 if ttl_hours > 0 else None,
-	)
+	try:
+		cache = frappe.cache()
+		previous = int(raw_redis(cache).hget(cache.make_key(RESPONSE_SIZES_KEY), cache_key) or 0)
 
+		# Store in Redis with TTL, plus LRU / size bookkeeping and tag sets
+		pipe = cache.pipeline()
+		pipe.set(cache.make_key(cache_key), payload, ex=ttl_sec)
+		pipe.zadd(cache.make_key(RESPONSE_LRU_KEY), {cache_key: data["cached_at"]})
+		pipe.hset(cache.make_key(RESPONSE_SIZES_KEY), cache_key, size)
+		if tags:
+			pipe.hset(cache.make_key(RESPONSE_TAGS_KEY), cache_key, _TAG_SEP.join(tags))
+		for tag in tags:
+			tag_key = cache.make_key(f"{RESPONSE_TAG_KEY}{tag}")
+			pipe.sadd(tag_key, cache_key)
+			if ttl_sec:
+				pipe.expire(tag_key, ttl_sec)
+		pipe.incrby(cache.make_key(RESPONSE_BYTES_KEY), size - previous)
+		total = pipe.execute()[-1]
 
-def clear_cache():
-	"""Clear all AI response caches."""
-	# Clear by pattern
-	keys = frappe.cache().get_keys("oly_ai:*")
-	for key in keys:
-		frappe.cache().delete_value(key)
+		for tag in tags:
+			if tag.startswith("doc:"):
+				mark_doctype_cached(RESPONSE_DOCTYPES_KEY, tag.split(":", 2)[1])
+
+		if total > max_bytes:
+			_evict_responses(cache, total - max_bytes)
+
+		_lru_put(_sync_response_lru(cache), cache_key, data, size)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Response cache write failed: {e}")
+
+
+def invalidate_tags(*tags):
+	"""Drop every cached response carrying any of `tags`. Returns the number dropped."""
+	cache = frappe.cache()
+	tag_keys = [cache.make_key(f"{RESPONSE_TAG_KEY}{tag}") for tag in tags]
+	members = cache.sunion(tag_keys)
+	if not members:
+		return 0
+
+	keys = [m.decode() if isinstance(m, bytes) else m for m in members]
+	cache.delete(*tag_keys)
+	_drop_responses(cache, keys, bump=True)
 	return len(keys)
+
+
+def invalidate_document_cache(doc, method=None):
+	"""Hook (doc_events "*" on_update / on_trash): drop ai_assist answers for this document."""
+	if doc.doctype.startswith("AI ") or frappe.flags.in_install or frappe.flags.in_migrate:
+		return
+	try:
+		# Most saves are of doctypes no answer was ever cached for — skip Redis entirely
+		if not has_cached_doctype(RESPONSE_DOCTYPES_KEY, doc.doctype):
+			return
+		if not frappe.get_cached_doc("AI Settings").enable_caching:
+			return
+		invalidate_tags(doc_tag(doc.doctype, doc.name))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Response cache invalidation failed for {doc.doctype} {doc.name}: {e}")
+
+
+def clear_cache():
+	"""Clear all AI response caches (exact and semantic) without blocking Redis."""
+	cache = frappe.cache()
+	count = 0
+	while True:
+		popped = cache.zpopmin(cache.make_key(RESPONSE_LRU_KEY), CLEAR_BATCH)
+		if not popped:
+			break
+		count += len(popped)
+		_drop_responses(cache, [m.decode() if isinstance(m, bytes) else m for m, _score in popped], untag=False)
+
+	for pattern in (f"{RESPONSE_TAG_KEY}*", "oly_ai:semcache:*"):
+		batch = []
+		for key in cache.scan_iter(match=cache.make_key(pattern), count=CLEAR_BATCH):
+			batch.append(key)
+			if len(batch) >= CLEAR_BATCH:
+				cache.unlink(*batch)
+				batch = []
+		if batch:
+			cache.unlink(*batch)
+
+	cache.delete(cache.make_key(RESPONSE_BYTES_KEY), cache.make_key(RESPONSE_TAGS_KEY))
+	cache.incr(cache.make_key(RESPONSE_GENERATION_KEY))
+	return count
+
+
+def mark_doctype_cached(set_key, doctype):
+	"""Record in a shared set that entries derived from `doctype` documents exist."""
+	key = (getattr(frappe.local, "site", None) or "", set_key)
+	with _response_lock:
+		entry = _cached_doctypes.get(key)
+		if entry and doctype in entry[0]:
+			return
+	cache = frappe.cache()
+	raw_redis(cache).sadd(cache.make_key(set_key), doctype)
+	with _response_lock:
+		entry = _cached_doctypes.get(key)
+		if entry:
+			_cached_doctypes[key] = (entry[0] | {doctype}, entry[1])
+
+
+def has_cached_doctype(set_key, doctype):
+	"""Return True if `doctype` is in a set written by mark_doctype_cached.
+
+	Save hooks call this for every document, so each worker keeps a frozenset copy
+	and only re-reads Redis every CACHED_DOCTYPES_RECHECK_SEC seconds.
+	"""
+	key = (getattr(frappe.local, "site", None) or "", set_key)
+	now = time.monotonic()
+	with _response_lock:
+		entry = _cached_doctypes.get(key)
+	if entry is None or now - entry[1] > CACHED_DOCTYPES_RECHECK_SEC:
+		cache = frappe.cache()
+		doctypes = frozenset(
+			m.decode() if isinstance(m, bytes) else m
+			for m in raw_redis(cache).smembers(cache.make_key(set_key))
+		)
+		entry = (doctypes, now)
+		with _response_lock:
+			_cached_doctypes[key] = entry
+	return doctype in entry[0]
+
+
+def get_response_cache_stats():
+	"""Return {"entries", "bytes", "max_bytes", "local_entries", "local_bytes"}."""
+	settings = frappe.get_cached_doc("AI Settings")
+	cache = frappe.cache()
+	site = getattr(frappe.local, "site", None) or ""
+	with _response_lock:
+		local = _response_lru.get(site) or {}
+	return {
+		"entries": cache.zcard(cache.make_key(RESPONSE_LRU_KEY)),
+		"bytes": int(cache.get(cache.make_key(RESPONSE_BYTES_KEY)) or 0),
+		"max_bytes": (settings.get("cache_max_size_mb") or DEFAULT_CACHE_MAX_MB) * 1024 * 1024,
+		"local_entries": len(local.get("entries") or ()),
+		"local_bytes": local.get("bytes", 0),
+	}
+
+
+def _evict_responses(cache, excess):
+	"""Evict least recently used entries until `excess` bytes are freed."""
+	freed = 0
+	while freed < excess:
+		# Usually one or two entries — pop them one at a time so nothing extra goes
+		popped = cache.zpopmin(cache.make_key(RESPONSE_LRU_KEY), 1)
+		if not popped:
+			# Nothing left to account for — reset a drifted counter
+			cache.set(cache.make_key(RESPONSE_BYTES_KEY), 0)
+			break
+		freed += _drop_responses(cache, [m.decode() if isinstance(m, bytes) else m for m, _score in popped])
+
+
+def _drop_responses(cache, keys, bump=False, untag=True):
+	"""Delete entries plus their LRU / size / tag bookkeeping; returns the bytes freed.
+
+	Evicted or expired entries are still correct answers, so in-process copies are
+	only discarded (bump=True) when entries are invalidated. untag=False skips the
+	tag-set cleanup when the caller deletes every tag set anyway.
+	"""
+	freed = 0
+	for start in range(0, len(keys), CLEAR_BATCH):
+		chunk = keys[start:start + CLEAR_BATCH]
+		pipe = cache.pipeline()
+		pipe.hmget(cache.make_key(RESPONSE_SIZES_KEY), chunk)
+		pipe.hmget(cache.make_key(RESPONSE_TAGS_KEY), chunk)
+		sizes, entry_tags = pipe.execute()
+		size = sum(int(s or 0) for s in sizes)
+
+		pipe = cache.pipeline()
+		if untag:
+			by_tag = {}
+			for key, tags in zip(chunk, entry_tags):
+				if tags:
+					tags = tags.decode() if isinstance(tags, bytes) else tags
+					for tag in tags.split(_TAG_SEP):
+						by_tag.setdefault(tag, []).append(key)
+			for tag, members in by_tag.items():
+				pipe.srem(cache.make_key(f"{RESPONSE_TAG_KEY}{tag}"), *members)
+		pipe.unlink(*[cache.make_key(k) for k in chunk])
+		pipe.hdel(cache.make_key(RESPONSE_SIZES_KEY), *chunk)
+		pipe.hdel(cache.make_key(RESPONSE_TAGS_KEY), *chunk)
+		pipe.zrem(cache.make_key(RESPONSE_LRU_KEY), *chunk)
+		pipe.decrby(cache.make_key(RESPONSE_BYTES_KEY), size)
+		pipe.execute()
+		freed += size
+	if bump and keys:
+		# Workers drop their in-process copies on the next lookup
+		cache.incr(cache.make_key(RESPONSE_GENERATION_KEY))
+	return freed
+
+
+def _sync_response_lru(cache):
+	"""Clear this worker's LRU if any worker evicted or invalidated entries; returns the site."""
+	site = getattr(frappe.local, "site", None) or ""
+	generation = int(cache.get(cache.make_key(RESPONSE_GENERATION_KEY)) or 0)
+	with _response_lock:
+		local = _response_lru.get(site)
+		if local is None or local["generation"] != generation:
+			_response_lru[site] = {"generation": generation, "entries": OrderedDict(), "bytes": 0}
+	return site
+
+
+def _lru_get(site, key):
+	with _response_lock:
+		local = _response_lru.get(site)
+		item = local and local["entries"].get(key)
+		if not item:
+			return None
+		local["entries"].move_to_end(key)
+		return item[0]
+
+
+def _lru_put(site, key, data, size):
+	with _response_lock:
+		local = _response_lru.get(site)
+		if local is None or size > RESPONSE_LRU_MAX_BYTES:
+			return
+		entries = local["entries"]
+		if key in entries:
+			local["bytes"] -= entries.pop(key)[1]
+		entries[key] = (data, size)
+		local["bytes"] += size
+		while local["bytes"] > RESPONSE_LRU_MAX_BYTES and entries:
+			local["bytes"] -= entries.popitem(last=False)[1][1]
+
+
+# ─── Query Embedding Cache ───────────────────────────────────
+
+
+def normalize_query(text):
+	"""Normalize query text so trivially different phrasings share a cache entry."""
+	text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+	return text.rstrip("?!. ")
+
+
+def get_embedding_cache_key(text, model):
+	"""Cache key for one query embedding: embedding model + normalized text."""
+	digest = hashlib.sha256(f"{model}\x1f{normalize_query(text)}".encode()).hexdigest()
+	return f"oly_ai:emb:{digest}"
+
+
+def get_query_embedding(provider, text):
+	"""Return the embedding for a query, checking the in-process LRU, then Redis,
+	then calling the provider.
+
+	Args:
+		provider: LLMProvider used on a cache miss
+		text: query text
+
+	Returns:
+		numpy.ndarray | list: the embedding vector
+	"""
+	from oly_ai.core.rag.codec import decode_embedding, encode_embedding
+
+	model = provider.settings.embedding_model
+	cache_key = get_embedding_cache_key(text, model)
+	lru_key = (getattr(frappe.local, "site", None) or "", cache_key)
+
+	with _embedding_lock:
+		vector = _embedding_lru.get(lru_key)
+		if vector is not None:
+			_embedding_lru.move_to_end(lru_key)
+	if vector is not None:
+		record_lookup(EMBEDDING_STATS_KEY, "hits")
+		return vector
+
+	cached = frappe.cache().get_value(cache_key)
+	vector = decode_embedding(cached) if cached else None
+	if vector is not None:
+		record_lookup(EMBEDDING_STATS_KEY, "hits")
+	else:
+		record_lookup(EMBEDDING_STATS_KEY, "misses")
+		vector = provider.get_embeddings(text)[0]
+		frappe.cache().set_value(
+			cache_key, encode_embedding(vector, "f32"), expires_in_sec=EMBEDDING_TTL_SEC
+		)
+
+	with _embedding_lock:
+		_embedding_lru[lru_key] = vector
+		_embedding_lru.move_to_end(lru_key)
+		while len(_embedding_lru) > EMBEDDING_LRU_SIZE:
+			_embedding_lru.popitem(last=False)
+
+	return vector
+
+
+def get_embedding_cache_stats(from_date=None, to_date=None):
+	"""Sum the daily embedding-cache counters over a date range.
+
+	Returns:
+		dict: {"hits", "misses", "hit_rate"} — hit_rate in percent
+	"""
+	return get_lookup_stats(EMBEDDING_STATS_KEY, from_date, to_date)
+
+
+def record_lookup(stats_key, outcome):
+	"""Increment today's "hits" / "misses" counter under a daily stats key prefix."""
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{stats_key}{nowdate()}")
+		cache.hincrby(key, outcome, 1)
+		cache.expire(key, LOOKUP_STATS_TTL_SEC)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Cache stats update failed ({stats_key}): {e}")
+
+
+def get_lookup_stats(stats_key, from_date=None, to_date=None):
+	"""Sum the daily counters written by record_lookup over a date range.
+
+	Returns:
+		dict: {"hits", "misses", "hit_rate"} — hit_rate in percent
+	"""
+	to_date = getdate(to_date or nowdate())
+	from_date = getdate(from_date or to_date)
+	days = min(date_diff(to_date, from_date), 366)
+
+	hits = misses = 0
+	try:
+		cache = frappe.cache()
+		pipe = cache.pipeline()
+		for offset in range(days + 1):
+			pipe.hgetall(cache.make_key(f"{stats_key}{add_days(from_date, offset)}"))
+		for counts in pipe.execute():
+			hits += int(counts.get(b"hits", 0))
+			misses += int(counts.get(b"misses", 0))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Cache stats unavailable ({stats_key}): {e}")
+
+	lookups = hits + misses
+	return {
+		"hits": hits,
+		"misses": misses,
+		"hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+	}
@@ -1,9 +1,25 @@
 # Copyright (c) 2026, OLY Technologies and contributors
 # Context builder — extracts document data for AI prompts
+#
+# Rendered contexts are cached in Redis per document, keyed by a fingerprint of
+# the document's `modified` plus the build options. Saving the document, or any
+# Communication / Comment that references it, drops the document's entries.
+
+import hashlib
+import json
 
 import frappe
 from frappe.utils import cstr
 
+from oly_ai.core.cache import get_lookup_stats, has_cached_doctype, mark_doctype_cached, raw_redis, record_lookup
+
+# Redis hash per document (site-scoped via make_key): fingerprint → rendered context
+CONTEXT_CACHE_KEY = "oly_ai:docctx:"
+CONTEXT_CACHE_TTL_SEC = 3600
+CONTEXT_STATS_KEY = "oly_ai:docctx_stats:"
+# Redis set of doctypes with a rendered context cached (gates the save hook)
+CONTEXT_DOCTYPES_KEY = "oly_ai:docctx_meta:doctypes"
+
 
 def get_document_context(doctype, name, fields=None, include_comms=True, include_comments=True, max_length=4000):
 	"""Build a text context from a Frappe document for AI consumption.
@@ -19,10 +35,83 @@ def get_document_context(doctype, name, fields=None, include_comms=True, include
 	Returns:
 		str: formatted context text
 	"""
-	# Permission check
+	# Permission check (never cached)
 	if not frappe.has_permission(doctype, "read", name):
 		frappe.throw(f"No permission to read {doctype} {name}")
 
+	modified = frappe.db.get_value(doctype, name, "modified")
+	fingerprint = hashlib.sha1(json.dumps(
+		[str(modified), fields, bool(include_comms), bool(include_comments), max_length],
+		default=str,
+	).encode()).hexdigest()
+
+	cached = _get_cached_context(doctype, name, fingerprint) if modified else None
+	if cached is not None:
+		record_lookup(CONTEXT_STATS_KEY, "hits")
+		return cached
+
+	record_lookup(CONTEXT_STATS_KEY, "misses")
+	context = _build_document_context(doctype, name, fields, include_comms, include_comments, max_length)
+	if modified:
+		_set_cached_context(doctype, name, fingerprint, context)
+	return context
+
+
+def invalidate_document_context(doc, method=None):
+	"""Hook (doc_events "*" on_update / on_trash): drop cached contexts for a document.
+
+	A Communication or Comment invalidates the document it references.
+	"""
+	if doc.doctype in ("Communication", "Comment"):
+		doctype, name = doc.get("reference_doctype"), doc.get("reference_name")
+	else:
+		doctype, name = doc.doctype, doc.name
+	if not doctype or not name or doctype.startswith("AI "):
+		return
+	try:
+		# Most saves are of doctypes never rendered as context — skip Redis entirely
+		if not has_cached_doctype(CONTEXT_DOCTYPES_KEY, doctype):
+			return
+		cache = frappe.cache()
+		cache.delete(cache.make_key(f"{CONTEXT_CACHE_KEY}{doctype}:{name}"))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Document context invalidation failed for {doctype} {name}: {e}")
+
+
+def get_context_cache_stats(from_date=None, to_date=None):
+	"""Daily document-context cache counters summed over a date range.
+
+	Returns:
+		dict: {"hits", "misses", "hit_rate"} — hit_rate in percent
+	"""
+	return get_lookup_stats(CONTEXT_STATS_KEY, from_date, to_date)
+
+
+def _get_cached_context(doctype, name, fingerprint):
+	try:
+		cache = frappe.cache()
+		value = raw_redis(cache).hget(cache.make_key(f"{CONTEXT_CACHE_KEY}{doctype}:{name}"), fingerprint)
+		return value.decode() if isinstance(value, bytes) else value
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Document context cache read failed: {e}")
+		return None
+
+
+def _set_cached_context(doctype, name, fingerprint, context):
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{CONTEXT_CACHE_KEY}{doctype}:{name}")
+		pipe = cache.pipeline()
+		pipe.hset(key, fingerprint, context)
+		pipe.expire(key, CONTEXT_CACHE_TTL_SEC)
+		pipe.execute()
+		mark_doctype_cached(CONTEXT_DOCTYPES_KEY, doctype)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Document context cache write failed: {e}")
+
+
+def _build_document_context(doctype, name, fields, include_comms, include_comments, max_length):
+	"""Render the context text (uncached)."""
 	doc = frappe.get_doc(doctype, name)
 	meta = frappe.get_meta(doctype)
 
@@ -0,0 +1,211 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Context Assembly — gathers prompt context from independent sources concurrently.
+#
+# RAG retrieval (an embeddings call), long-term memories, @mention schemas, page
+# context and attachment parsing do not depend on each other. They used to run one
+# after another before the first token was requested; here each runs on its own
+# thread (own site context + DB connection) with a per-source timeout and a
+# character budget. A source that errors or times out is simply left out.
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import frappe
+
+# Seconds to wait for each source, measured from the start of assembly
+SOURCE_TIMEOUTS = {
+	"rag": 8,
+	"memories": 3,
+	"mentions": 5,
+	"page": 5,
+	"files": 20,
+}
+
+# Max characters each source may add to the prompt
+SOURCE_BUDGETS = {
+	"rag": 16000,
+	"memories": 4000,
+	"mentions": 16000,
+	"page": 16000,
+	"files": 60000,
+}
+
+MAX_CONTEXT_WORKERS = 5
+
+
+def assemble_context(message, user, page_doctype=None, page_docname=None, list_doctype=None,
+					 page_trail=None, file_urls=None):
+	"""Collect prompt context from every applicable source in parallel.
+
+	Args:
+		message: the user's message
+		user: requesting user (each source runs with this user's permissions)
+		page_doctype / page_docname / list_doctype / page_trail: current page info
+		file_urls: list (or JSON list) of attached file URLs
+
+	Returns:
+		frappe._dict: {
+			"rag_context": str, "sources": list,
+			"user_memories": str,
+			"mention_blocks": list[str],
+			"page_context": str,
+			"file_context": str,
+			"timings": {source: ms, ..., "total": ms},
+		}
+	"""
+	start = time.perf_counter()
+	jobs = {
+		"rag": (_rag_source, (message,)),
+		"memories": (_memories_source, (user, message)),
+	}
+	if "@" in (message or ""):
+		jobs["mentions"] = (_mentions_source, (message,))
+	if page_doctype or list_doctype or page_trail:
+		jobs["page"] = (_page_source, (page_doctype, page_docname, list_doctype, page_trail))
+	files = _parse_file_urls(file_urls)
+	if files:
+		jobs["files"] = (_files_source, (files,))
+
+	results, timings = _run_sources(jobs, user)
+
+	rag_context, sources = results.get("rag") or ("", [])
+	context = frappe._dict(
+		rag_context=_apply_budget(rag_context, "rag"),
+		sources=sources or [],
+		user_memories=_apply_budget(results.get("memories"), "memories"),
+		mention_blocks=[],
+		page_context=_apply_budget(results.get("page"), "page"),
+		file_context=_apply_budget(results.get("files"), "files"),
+		timings=timings,
+	)
+
+	remaining = SOURCE_BUDGETS["mentions"]
+	for block in results.get("mentions") or []:
+		if remaining <= 0:
+			break
+		block = block[:remaining]
+		context.mention_blocks.append(block)
+		remaining -= len(block)
+
+	timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+	frappe.logger("oly_ai").debug(f"Context assembly timings: {timings}")
+	return context
+
+
+def _run_sources(jobs, user):
+	"""Run source callables concurrently; returns ({source: result}, {source: ms})."""
+	results = {}
+	timings = {}
+	if not jobs:
+		return results, timings
+
+	site = frappe.local.site
+	sites_path = frappe.local.sites_path
+	start = time.perf_counter()
+
+	executor = ThreadPoolExecutor(max_workers=min(MAX_CONTEXT_WORKERS, len(jobs)))
+	try:
+		futures = {
+			name: executor.submit(_run_in_site_thread, site, sites_path, user, fn, args)
+			for name, (fn, args) in jobs.items()
+		}
+		# Wait on the shortest deadlines first so one slow source can't hold the rest
+		for name in sorted(futures, key=lambda n: SOURCE_TIMEOUTS.get(n, 5)):
+			remaining = SOURCE_TIMEOUTS.get(name, 5) - (time.perf_counter() - start)
+			try:
+				value, elapsed = futures[name].result(timeout=max(remaining, 0))
+				results[name] = value
+				timings[name] = elapsed
+			except FutureTimeoutError:
+				timings[name] = "timeout"
+				frappe.logger("oly_ai").info(f"Context source '{name}' timed out")
+			except Exception as e:
+				timings[name] = "error"
+				frappe.logger("oly_ai").debug(f"Context source '{name}' failed: {e}")
+	finally:
+		# Don't block on stragglers — they tear down their own site context
+		executor.shutdown(wait=False, cancel_futures=True)
+
+	return results, timings
+
+
+def _run_in_site_thread(site, sites_path, user, fn, args):
+	"""Run one source on a fresh thread-local site context; returns (result, ms)."""
+	start = time.perf_counter()
+	try:
+		frappe.init(site=site, sites_path=sites_path)
+		frappe.connect()
+		frappe.set_user(user)
+		return fn(*args), round((time.perf_counter() - start) * 1000, 1)
+	finally:
+		frappe.destroy()
+
+
+def _rag_source(message):
+	from oly_ai.core.rag.retriever import build_rag_context
+	return build_rag_context(message, top_k=5, min_score=0.7)
+
+
+def _memories_source(user, message):
+	from oly_ai.core.long_term_memory import get_user_memories
+	return get_user_memories(user, message_context=message)
+
+
+def _mentions_source(message):
+	"""@DocType schemas plus @DocType:Name document data, as system-prompt blocks."""
+	from oly_ai.api.chat import (
+		_build_doctype_context,
+		_build_specific_document_context,
+		_extract_doctype_mentions,
+	)
+
+	blocks = []
+	doctype_only, specific_docs = _extract_doctype_mentions(message)
+	if doctype_only:
+		blocks.append(_build_doctype_context(doctype_only))
+	if specific_docs:
+		# Also inject the schema for referenced doctypes
+		blocks.append(_build_doctype_context(list({dt for dt, _ in specific_docs})))
+		blocks.append(_build_specific_document_context(specific_docs))
+	return [b for b in blocks if b]
+
+
+def _page_source(page_doctype, page_docname, list_doctype, page_trail):
+	from oly_ai.api.chat import _build_page_context
+	return _build_page_context(page_doctype, page_docname, list_doctype, page_trail)
+
+
+def _files_source(files):
+	"""Parse non-image attachments (PDF, Excel, CSV, etc.)."""
+	from oly_ai.api.chat import _IMAGE_EXTS
+	from oly_ai.core.file_parser import SUPPORTED_EXTENSIONS, parse_files_for_context
+
+	non_image_files = [
+		f for f in files
+		if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
+		and os.path.splitext(f)[1].lower() not in _IMAGE_EXTS
+	]
+	if not non_image_files:
+		return ""
+	return parse_files_for_context(non_image_files)
+
+
+def _parse_file_urls(file_urls):
+	if not file_urls:
+		return []
+	try:
+		return (json.loads(file_urls) if isinstance(file_urls, str) else file_urls) or []
+	except (json.JSONDecodeError, TypeError):
+		return []
+
+
+def _apply_budget(text, source):
+	if not text:
+		return ""
+	budget = SOURCE_BUDGETS.get(source)
+	if budget and len(text) > budget:
+		return text[:budget] + "\n... [truncated]"
+	return text
@@ -2,7 +2,7 @@
 # Token usage tracking + budget enforcement
 
 import frappe
-from frappe.utils import today, getdate, get_first_day, get_last_day, flt
+from frappe.utils import today, getdate, get_first_day, get_last_day, flt, add_days, date_diff
 
 
 # Approximate cost per 1M tokens (USD) — updated 2026-02
@@ -34,14 +34,45 @@ MODEL_COSTS = {
 	"qwen2.5": {"input": 0, "output": 0},
 }
 
+# Provider prompt caching: price of a cached input token as a share of the input
+# price, by model prefix (Anthropic cache reads 10%, OpenAI 50% — 10% for GPT-5).
+CACHE_READ_RATES = {
+	"claude": 0.10,
+	"gpt-5": 0.10,
+}
+DEFAULT_CACHE_READ_RATE = 0.50
+# Anthropic bills writing a prefix into the (5-minute) cache at 125% of input
+CACHE_WRITE_RATE = 1.25
+
+# Daily prompt-cache token counters (Redis hash per day)
+PROMPT_CACHE_STATS_KEY = "oly_ai:prompt_cache:stats:"
+
 
-def estimate_cost(model, tokens_input, tokens_output):
-	"""Estimate cost in USD for a request."""
+def estimate_cost(model, tokens_input, tokens_output, tokens_cached=0, tokens_cache_write=0):
+	"""Estimate cost in USD for a request.
+
+	tokens_input includes tokens_cached (read from the provider's prompt cache) and
+	tokens_cache_write (written to it); those are priced at their cache rates.
+	"""
 	costs = MODEL_COSTS.get(model, {"input": 1.0, "output": 3.0})  # conservative default
-	cost = (tokens_input * costs["input"] / 1_000_000) + (tokens_output * costs["output"] / 1_000_000)
+	uncached = max(tokens_input - tokens_cached - tokens_cache_write, 0)
+	input_tokens = (
+		uncached
+		+ tokens_cached * _cache_read_rate(model)
+		+ tokens_cache_write * CACHE_WRITE_RATE
+	)
+	cost = (input_tokens * costs["input"] / 1_000_000) + (tokens_output * costs["output"] / 1_000_000)
 	return round(cost, 6)
 
 
+def _cache_read_rate(model):
+	m = (model or "").lower()
+	for prefix, rate in CACHE_READ_RATES.items():
+		if m.startswith(prefix):
+			return rate
+	return DEFAULT_CACHE_READ_RATE
+
+
 def check_budget(user=None):
 	"""Check if the user/system is within budget. Returns (allowed, reason)."""
 	settings = frappe.get_cached_doc("AI Settings")
@@ -72,13 +103,19 @@ def check_budget(user=None):
 	return True, ""
 
 
-def track_usage(model, tokens_input, tokens_output, user=None):
-	"""Record token usage and update counters."""
+def track_usage(model, tokens_input, tokens_output, user=None, tokens_cached=0, tokens_cache_write=0):
+	"""Record token usage and update counters.
+
+	tokens_cached / tokens_cache_write: prompt-cache reads and writes reported by the
+	provider (part of tokens_input); they lower the cost and feed the cache stats.
+	"""
+	_record_prompt_cache(model, tokens_input, tokens_cached, tokens_cache_write)
+
 	settings = frappe.get_cached_doc("AI Settings")
 	if not settings.enable_cost_tracking:
 		return 0
 
-	cost = estimate_cost(model, tokens_input, tokens_output)
+	cost = estimate_cost(model, tokens_input, tokens_output, tokens_cached, tokens_cache_write)
 	user = user or frappe.session.user
 
 	# Update settings counters (best-effort, non-blocking)
@@ -96,6 +133,61 @@ def track_usage(model, tokens_input, tokens_output, user=None):
 	return cost
 
 
+def _record_prompt_cache(model, tokens_input, tokens_cached, tokens_cache_write):
+	"""Add a request's input tokens to today's prompt-cache counters."""
+	if not tokens_input:
+		return
+	from oly_ai.core.cache import LOOKUP_STATS_TTL_SEC
+
+	saved = (
+		estimate_cost(model, tokens_input, 0)
+		- estimate_cost(model, tokens_input, 0, tokens_cached, tokens_cache_write)
+	)
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(f"{PROMPT_CACHE_STATS_KEY}{today()}")
+		pipe = cache.pipeline()
+		pipe.hincrby(key, "input_tokens", int(tokens_input))
+		pipe.hincrby(key, "cached_tokens", int(tokens_cached or 0))
+		pipe.hincrby(key, "cache_write_tokens", int(tokens_cache_write or 0))
+		pipe.hincrbyfloat(key, "saved_usd", saved)
+		pipe.expire(key, LOOKUP_STATS_TTL_SEC)
+		pipe.execute()
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Prompt cache stats update failed: {e}")
+
+
+def get_prompt_cache_stats(from_date=None, to_date=None):
+	"""Sum the daily prompt-cache counters over a date range.
+
+	Returns:
+		dict: {"input_tokens", "cached_tokens", "cache_write_tokens",
+		       "cached_rate" (percent of input tokens read from cache), "saved_usd"}
+	"""
+	to_date = getdate(to_date or today())
+	from_date = getdate(from_date or to_date)
+	days = min(date_diff(to_date, from_date), 366)
+
+	totals = {"input_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0, "saved_usd": 0.0}
+	try:
+		cache = frappe.cache()
+		pipe = cache.pipeline()
+		for offset in range(days + 1):
+			pipe.hgetall(cache.make_key(f"{PROMPT_CACHE_STATS_KEY}{add_days(from_date, offset)}"))
+		for counts in pipe.execute():
+			for field in totals:
+				totals[field] += float(counts.get(field.encode(), 0))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Prompt cache stats unavailable: {e}")
+
+	stats = {field: int(value) for field, value in totals.items() if field != "saved_usd"}
+	stats["cached_rate"] = (
+		round(stats["cached_tokens"] / stats["input_tokens"] * 100, 1) if stats["input_tokens"] else 0
+	)
+	stats["saved_usd"] = round(totals["saved_usd"], 4)
+	return stats
+
+
 def _check_budget_warning(settings, current_spend):
 	"""Send a one-time notification to admins when spend crosses the warning threshold."""
 	try:
@@ -0,0 +1,300 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# HTTP Pool — per-process keep-alive requests.Session objects for LLM providers.
+#
+# Every provider call used to go through module-level requests.post, paying a new
+# TCP + TLS handshake each time. Sessions here are shared per base URL, so
+# connections stay open between calls (tool rounds, embedding batches, follow-up
+# requests on the same worker). Connection opens, connect time and requests are
+# counted per host for the AI Usage dashboard — in process memory, written to
+# Redis in one pipeline at most every STATS_FLUSH_SEC, off the per-call path.
+#
+# The async provider path gets one httpx.AsyncClient and one semaphore per
+# (event loop, origin): clients cannot be shared across loops, and the semaphore
+# caps how many calls a single worker loop keeps in flight against one provider.
+
+import asyncio
+import os
+import socket
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from oly_ai.core.cache import raw_redis
+
+# Distinct hosts cached per adapter, and sockets kept per host
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# Cumulative per-host counters shared by all workers (Redis hash)
+STATS_KEY = "oly_ai:http_pool:stats"
+# Seconds a process buffers its counters before adding them to STATS_KEY
+STATS_FLUSH_SEC = 30
+
+# TCP keep-alive so idle pooled sockets survive NAT / load-balancer timeouts
+_KEEPALIVE_OPTIONS = HTTPConnection.default_socket_options + [
+	(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+_sessions = {}
+# event loop → {origin: ...}; entries go away with their loop
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_pid = None
+# site → {"host|metric": amount} not yet written, and when each site last flushed
+_pending_stats = {}
+_last_flush = {}
+_stats_lock = threading.Lock()
+
+
+def get_session(base_url):
+	"""Return this process's pooled session for a provider base URL."""
+	origin = _origin(base_url)
+
+	with _lock:
+		# Sockets must not be shared with a forked parent
+		if _pid != os.getpid():
+			_reset_for_fork()
+
+		session = _sessions.get(origin)
+		if session is None:
+			session = requests.Session()
+			adapter = InstrumentedAdapter(
+				pool_connections=POOL_CONNECTIONS,
+				pool_maxsize=POOL_MAXSIZE,
+			)
+			session.mount("https://", adapter)
+			session.mount("http://", adapter)
+			_sessions[origin] = session
+
+	return session
+
+
+def get_httpx():
+	"""Import httpx lazily — only the async provider path needs it."""
+	try:
+		import httpx
+		return httpx
+	except ImportError:
+		frappe.throw("httpx is required for async AI provider calls. Install with: pip install httpx")
+
+
+def get_async_client(base_url):
+	"""Return the pooled httpx.AsyncClient for a provider on the running event loop."""
+	httpx = get_httpx()
+	loop = asyncio.get_running_loop()
+	origin = _origin(base_url)
+
+	with _lock:
+		if _pid != os.getpid():
+			_reset_for_fork()
+
+		clients = _async_clients.setdefault(loop, {})
+		client = clients.get(origin)
+		if client is None or client.is_closed:
+			client = httpx.AsyncClient(
+				limits=httpx.Limits(
+					max_connections=POOL_MAXSIZE,
+					max_keepalive_connections=POOL_MAXSIZE,
+				),
+				event_hooks={"request": [_record_async_request]},
+			)
+			clients[origin] = client
+
+	return client
+
+
+def get_provider_semaphore(base_url, limit):
+	"""Return the semaphore bounding in-flight async calls to one provider on this loop."""
+	loop = asyncio.get_running_loop()
+	origin = _origin(base_url)
+
+	with _lock:
+		semaphores = _semaphores.setdefault(loop, {})
+		entry = semaphores.get(origin)
+		if entry is None or entry[1] != limit:
+			entry = (asyncio.Semaphore(max(1, int(limit))), limit)
+			semaphores[origin] = entry
+
+	return entry[0]
+
+
+async def close_async_clients():
+	"""Close the async clients bound to the running loop (call before the loop ends)."""
+	loop = asyncio.get_running_loop()
+	with _lock:
+		clients = list(_async_clients.pop(loop, {}).values())
+		_semaphores.pop(loop, None)
+	for client in clients:
+		await client.aclose()
+
+
+def get_pool_stats():
+	"""Return per-host connection stats.
+
+	requests / connections_opened / connect_ms are cumulative across workers (other
+	workers' last STATS_FLUSH_SEC may not be in yet); idle_sockets is what this
+	process currently holds open.
+
+	Returns:
+		list of dict: [{"host", "requests", "connections_opened", "reuse_rate",
+		                "avg_connect_ms", "idle_sockets"}, ...]
+	"""
+	flush_pool_stats()
+	totals = {}
+	try:
+		cache = frappe.cache()
+		for field, value in raw_redis(cache).hgetall(cache.make_key(STATS_KEY)).items():
+			field = field.decode() if isinstance(field, bytes) else field
+			host, _sep, metric = field.rpartition("|")
+			totals.setdefault(host, {})[metric] = float(value)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"HTTP pool stats unavailable: {e}")
+
+	idle = _idle_sockets()
+	stats = []
+	for host in sorted(set(totals) | set(idle)):
+		counts = totals.get(host, {})
+		requests_made = int(counts.get("requests", 0))
+		opened = int(counts.get("connections", 0))
+		stats.append({
+			"host": host,
+			"requests": requests_made,
+			"connections_opened": opened,
+			"reuse_rate": round((1 - opened / requests_made) * 100, 1) if requests_made else 0,
+			"avg_connect_ms": round(counts.get("connect_ms", 0) / opened, 1) if opened else 0,
+			"idle_sockets": idle.get(host, 0),
+		})
+	return stats
+
+
+def flush_pool_stats():
+	"""Add this process's buffered counters for the current site to Redis in one pipeline."""
+	site = getattr(frappe.local, "site", None) or ""
+	with _stats_lock:
+		pending = _pending_stats.pop(site, None)
+		_last_flush[site] = time.monotonic()
+	if not pending:
+		return
+
+	try:
+		cache = frappe.cache()
+		key = cache.make_key(STATS_KEY)
+		pipe = cache.pipeline()
+		for field, amount in pending.items():
+			pipe.hincrbyfloat(key, field, amount)
+		pipe.execute()
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"HTTP pool stats flush failed: {e}")
+
+
+class InstrumentedAdapter(HTTPAdapter):
+	"""HTTPAdapter whose pools count requests and time new connections."""
+
+	def init_poolmanager(self, *args, **kwargs):
+		super().init_poolmanager(*args, **kwargs)
+		self.poolmanager.pool_classes_by_scheme = {
+			"http": _TimedHTTPConnectionPool,
+			"https": _TimedHTTPSConnectionPool,
+		}
+
+	def send(self, request, *args, **kwargs):
+		_record(urlsplit(request.url).netloc, "requests", 1)
+		return super().send(request, *args, **kwargs)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+	default_socket_options = _KEEPALIVE_OPTIONS
+
+	def connect(self):
+		start = time.perf_counter()
+		super().connect()
+		_record_connect(self, start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+	default_socket_options = _KEEPALIVE_OPTIONS
+
+	def connect(self):
+		start = time.perf_counter()
+		super().connect()
+		_record_connect(self, start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+	ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+	ConnectionCls = _TimedHTTPSConnection
+
+
+async def _record_async_request(request):
+	_record(request.url.netloc.decode("ascii"), "requests", 1)
+
+
+def _reset_for_fork():
+	global _pid
+	_sessions.clear()
+	_async_clients.clear()
+	_semaphores.clear()
+	with _stats_lock:
+		_pending_stats.clear()
+	_pid = os.getpid()
+
+
+def _record_connect(conn, start):
+	host = f"{conn.host}:{conn.port}" if conn.port else conn.host
+	_record(host, "connections", 1)
+	_record(host, "connect_ms", round((time.perf_counter() - start) * 1000, 3))
+
+
+def _record(host, metric, amount):
+	site = getattr(frappe.local, "site", None) or ""
+	field = f"{_normalize_host(host)}|{metric}"
+	with _stats_lock:
+		pending = _pending_stats.setdefault(site, {})
+		pending[field] = pending.get(field, 0) + amount
+		last = _last_flush.get(site)
+		if last is not None and time.monotonic() - last < STATS_FLUSH_SEC:
+			return
+	flush_pool_stats()
+
+
+def _idle_sockets():
+	"""Count sockets parked in this process's pools, per host."""
+	idle = {}
+	with _lock:
+		sessions = list(_sessions.values()) if _pid == os.getpid() else []
+	for session in sessions:
+		adapters = {id(a): a for a in session.adapters.values()}
+		for adapter in adapters.values():
+			for key in list(adapter.poolmanager.pools.keys()):
+				pool = adapter.poolmanager.pools.get(key)
+				if pool is None or pool.pool is None:
+					continue
+				host = _normalize_host(f"{pool.host}:{pool.port}" if pool.port else pool.host)
+				idle[host] = idle.get(host, 0) + sum(
+					1 for conn in list(pool.pool.queue) if conn is not None and conn.sock is not None
+				)
+	return idle
+
+
+def _normalize_host(host):
+	"""Drop default ports so "api.openai.com" and "api.openai.com:443" match."""
+	for default in (":443", ":80"):
+		if host.endswith(default):
+			return host[: -len(default)]
+	return host
+
+
+def _origin(base_url):
+	parts = urlsplit(base_url or "")
+	return f"{parts.scheme}://{parts.netloc}"
@@ -14,6 +14,47 @@ SUMMARIZE_THRESHOLD = 24
 SUMMARY_MAX_TOKENS = 500
 
 
+def load_session_window(session_name, window=MAX_RECENT_MESSAGES):
+	"""Load an AI Chat Session with only its last `window` messages.
+
+	frappe.get_doc loads every message row, while the LLM context only ever uses
+	the recent tail plus the stored summary. The returned doc carries the session
+	columns, its shared_with rows and the tail (read with ORDER BY idx DESC LIMIT),
+	so cost stays flat as a session grows. New turns are appended and persisted with
+	save_new_messages(); save() is refused because it would drop the unloaded rows.
+
+	Returns:
+		AIChatSession doc with flags.message_window set
+	"""
+	row = frappe.db.get_value("AI Chat Session", session_name, "*", as_dict=True)
+	if not row:
+		frappe.throw(_("Chat session not found"), frappe.DoesNotExistError)
+
+	messages = frappe.db.sql(
+		"""SELECT * FROM `tabAI Chat Message`
+		WHERE parent = %s AND parenttype = 'AI Chat Session' AND parentfield = 'messages'
+		ORDER BY idx DESC
+		LIMIT %s""",
+		(session_name, int(window)),
+		as_dict=True,
+	)
+	shared_with = frappe.get_all(
+		"AI Chat Shared User",
+		filters={"parent": session_name, "parenttype": "AI Chat Session", "parentfield": "shared_with"},
+		fields=["*"],
+		order_by="idx asc",
+	)
+
+	session = frappe.get_doc(dict(
+		row,
+		doctype="AI Chat Session",
+		messages=list(reversed(messages)),
+		shared_with=shared_with,
+	))
+	session.flags.message_window = int(window)
+	return session
+
+
 def get_session_context(session):
 	"""Build optimized conversation context for the LLM.
 
@@ -58,16 +99,28 @@ def maybe_summarize_session(session):
 	SUMMARIZE_THRESHOLD, summarizes the older messages and stores
 	the summary on the session.
 
-	Only summarizes messages NOT in the recent window.
+	Only summarizes messages NOT in the recent window. Messages are read from
+	the database, so a session loaded with load_session_window works too.
 	"""
-	messages = session.messages or []
+	message_count = frappe.db.count(
+		"AI Chat Message",
+		{"parent": session.name, "parenttype": "AI Chat Session", "parentfield": "messages"},
+	)
 
-	if len(messages) < SUMMARIZE_THRESHOLD:
+	if message_count < SUMMARIZE_THRESHOLD:
 		return
 
 	# Already has a recent summary and not grown too much since
 	old_summary = session.get("conversation_summary") or ""
-	messages_to_summarize = messages[:-MAX_RECENT_MESSAGES]
+	messages_to_summarize = frappe.db.sql(
+		"""SELECT role, SUBSTRING(content, 1, 500) AS content
+		FROM `tabAI Chat Message`
+		WHERE parent = %s AND parenttype = 'AI Chat Session' AND parentfield = 'messages'
+		ORDER BY idx
+		LIMIT %s""",
+		(session.name, message_count - MAX_RECENT_MESSAGES),
+		as_dict=True,
+	)
 
 	if not messages_to_summarize:
 		return
@@ -79,7 +132,7 @@ def maybe_summarize_session(session):
 
 	for msg in messages_to_summarize:
 		role = msg.role.upper()
-		content = (msg.content or "")[:500]  # Truncate long messages
+		content = msg.content or ""  # Truncated to 500 chars in the query
 		parts.append(f"{role}: {content}")
 
 	text_to_summarize = "\n".join(parts)
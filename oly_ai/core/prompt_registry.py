@@ -0,0 +1,86 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Prompt Registry — system prompts compiled once per worker, per site and mode.
+#
+# Building a system prompt (api/chat.get_system_prompt) checks AI Prompt Template,
+# reads Global Defaults / Company and lists installed app versions before formatting
+# a multi-KB string. The text only changes when one of those changes, so each worker
+# keeps the compiled prompts and recompiles when a Redis generation counter moves —
+# bumped from AI Settings, AI Prompt Template, Company and Global Defaults saves.
+#
+# Each compiled prompt carries a prefix hash: identical across workers and turns
+# while the prompt is unchanged, so providers can key prompt caching on it.
+
+import hashlib
+import threading
+import time
+
+import frappe
+
+GENERATION_KEY = "oly_ai:prompts:generation"
+MODES = ("ask", "agent", "execute", "research")
+# Safety net for changes no hook sees (e.g. apps installed or removed)
+PROMPT_MAX_AGE_SEC = 3600
+
+_registries = {}
+_lock = threading.Lock()
+
+
+def get_compiled_prompt(mode="ask"):
+	"""Return the compiled system prompt for a mode.
+
+	Returns:
+		frappe._dict: {"mode", "text", "prefix_hash"}
+	"""
+	mode = mode if mode in MODES else "ask"
+	site = getattr(frappe.local, "site", None) or ""
+	generation = _get_generation()
+
+	with _lock:
+		registry = _registries.get(site)
+		if (
+			registry is None
+			or registry["generation"] != generation
+			or time.monotonic() - registry["compiled_at"] > PROMPT_MAX_AGE_SEC
+		):
+			registry = {"generation": generation, "compiled_at": time.monotonic(), "prompts": {}}
+			_registries[site] = registry
+		compiled = registry["prompts"].get(mode)
+
+	if compiled is None:
+		# Compile outside the lock — it reads the DB; a racing worker thread just compiles twice
+		from oly_ai.api.chat import get_system_prompt
+		text = get_system_prompt(mode)
+		compiled = frappe._dict(mode=mode, text=text, prefix_hash=prefix_hash(text))
+		with _lock:
+			registry["prompts"][mode] = compiled
+
+	return compiled
+
+
+def get_prompt(mode="ask"):
+	"""Return the compiled system prompt text for a mode."""
+	return get_compiled_prompt(mode).text
+
+
+def prefix_hash(text):
+	"""Stable short hash of a prompt prefix (used as the provider prompt-cache key)."""
+	return hashlib.sha256((text or "").encode()).hexdigest()[:16]
+
+
+def invalidate_prompts(doc=None, method=None):
+	"""Make every worker recompile its prompts. Usable as a doc_events hook."""
+	try:
+		cache = frappe.cache()
+		cache.incr(cache.make_key(GENERATION_KEY))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Prompt registry invalidation failed: {e}")
+	with _lock:
+		_registries.pop(getattr(frappe.local, "site", None) or "", None)
+
+
+def _get_generation():
+	try:
+		cache = frappe.cache()
+		return int(cache.get(cache.make_key(GENERATION_KEY)) or 0)
+	except Exception:
+		return 0
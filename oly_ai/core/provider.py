@@ -8,6 +8,52 @@ import time
 import frappe
 import requests
 
+from oly_ai.core.http_pool import get_async_client, get_httpx, get_provider_semaphore, get_session
+
+# Message key marking the end of the stable prompt prefix (system prompt + company
+# context). Its value is the prefix hash; it never reaches the provider as-is —
+# Anthropic gets a cache_control breakpoint there, OpenAI a prompt_cache_key.
+CACHE_BREAKPOINT = "cache_breakpoint"
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def cache_usage(usage):
+	"""Return (cached, cache_write) input tokens from an OpenAI-format usage dict."""
+	details = (usage or {}).get("prompt_tokens_details") or {}
+	return details.get("cached_tokens") or 0, details.get("cache_write_tokens") or 0
+
+
+def _anthropic_usage(usage):
+	"""Normalize Anthropic usage: input includes cache reads and writes, as with OpenAI."""
+	usage = usage or {}
+	cached = usage.get("cache_read_input_tokens") or 0
+	written = usage.get("cache_creation_input_tokens") or 0
+	return (usage.get("input_tokens") or 0) + cached + written, cached, written
+
+
+def _strip_cache_markers(messages):
+	"""Return (messages without CACHE_BREAKPOINT keys, prefix cache key or None)."""
+	cache_key = next((m[CACHE_BREAKPOINT] for m in messages if m.get(CACHE_BREAKPOINT)), None)
+	if cache_key is None:
+		return messages, None
+	return [{k: v for k, v in m.items() if k != CACHE_BREAKPOINT} for m in messages], cache_key
+
+
+def _error_detail(response, default):
+	"""Extract the provider's error message from an HTTP error response."""
+	try:
+		return response.json().get("error", {}).get("message", default)
+	except Exception:
+		return default
+
+
+def _iter_stream_lines(response):
+	"""Iterate a streamed response's lines, releasing its pooled connection afterwards."""
+	try:
+		yield from response.iter_lines()
+	finally:
+		response.close()
+
 
 class LLMProvider:
 	"""Provider-agnostic LLM client.
@@ -30,6 +76,10 @@ class LLMProvider:
 		self.temperature = settings.temperature if settings.temperature is not None else 0.3
 		self.top_p = settings.top_p if settings.top_p is not None else 1.0
 		self.timeout = settings.timeout_seconds or 30
+		# Keep-alive connection pool shared by every provider call in this process
+		self.session = get_session(self.base_url)
+		# In-flight cap for the async path, per provider and event loop
+		self.async_concurrency = settings.get("async_provider_concurrency") or 8
 
 	def chat(self, messages, model=None, max_tokens=None, temperature=None, json_mode=False, tools=None):
 		"""Send a chat completion request. Returns dict with response + usage metadata.
@@ -46,8 +96,10 @@ class LLMProvider:
 			dict: {
 				"content": str,          # AI response text (may be None if tool_calls)
 				"model": str,            # model used
-				"tokens_input": int,     # input tokens
+				"tokens_input": int,     # input tokens (including cached)
 				"tokens_output": int,    # output tokens
+				"tokens_cached": int,    # input tokens read from the provider's prompt cache
+				"tokens_cache_write": int,  # input tokens written to it (Anthropic)
 				"response_time": float,  # seconds
 				"tool_calls": list|None, # tool calls if function calling
 			}
@@ -87,8 +139,8 @@ class LLMProvider:
 		m = (model or "").lower()
 		return m.startswith(("o1", "o3", "o4"))
 
-	def _call_openai_compatible(self, messages, model, max_tokens, temperature, json_mode=False, tools=None):
-		"""Call OpenAI-compatible API (works with OpenAI, Ollama, vLLM, LiteLLM)."""
+	def _openai_request(self, messages, model, max_tokens, temperature, json_mode=False, tools=None, stream=False):
+		"""Build (url, headers, payload) for an OpenAI-compatible chat completion."""
 		url = f"{self.base_url.rstrip('/')}/chat/completions"
 
 		headers = {
@@ -96,10 +148,17 @@ class LLMProvider:
 			"Authorization": f"Bearer {self.api_key}",
 		}
 
+		# OpenAI caches shared prefixes automatically; the key routes requests with the
+		# same system prompt to the same cache. Compatible servers may not accept it.
+		messages, cache_key = _strip_cache_markers(messages)
+
 		payload = {
 			"model": model,
 			"messages": messages,
 		}
+		if stream:
+			payload["stream"] = True
+			payload["stream_options"] = {"include_usage": True}
 
 		# Newer models use max_completion_tokens; older use max_tokens
 		if self._needs_new_params(model):
@@ -119,62 +178,61 @@ class LLMProvider:
 			payload["tools"] = tools
 			payload["tool_choice"] = "auto"
 
+		if cache_key and self.provider_type == "OpenAI":
+			payload["prompt_cache_key"] = cache_key
+
+		return url, headers, payload
+
+	@staticmethod
+	def _openai_retry_payloads(payload, error_detail):
+		"""Yield adjusted payloads to retry with when the model rejects a parameter."""
+		detail_lower = error_detail.lower()
+		if "prompt_cache_key" in detail_lower and payload.pop("prompt_cache_key", None):
+			yield payload
+		# Auto-retry: if temperature/top_p not supported, retry without them
+		if "unsupported" in detail_lower and ("temperature" in detail_lower or "top_p" in detail_lower):
+			payload.pop("temperature", None)
+			payload.pop("top_p", None)
+			yield payload
+		if "unsupported" in detail_lower and "max_tokens" in detail_lower:
+			# Switch from max_tokens to max_completion_tokens
+			val = payload.pop("max_tokens", None)
+			if val:
+				payload["max_completion_tokens"] = val
+				yield payload
+
+	@staticmethod
+	def _parse_openai_response(data):
+		msg = data["choices"][0]["message"]
+		usage = data.get("usage") or {}
+		cached, written = cache_usage(usage)
+		return {
+			"content": msg.get("content"),
+			"tokens_input": usage.get("prompt_tokens", 0),
+			"tokens_output": usage.get("completion_tokens", 0),
+			"tokens_cached": cached,
+			"tokens_cache_write": written,
+			"tool_calls": msg.get("tool_calls"),
+		}
+
+	def _call_openai_compatible(self, messages, model, max_tokens, temperature, json_mode=False, tools=None):
+		"""Call OpenAI-compatible API (works with OpenAI, Ollama, vLLM, LiteLLM)."""
+		url, headers, payload = self._openai_request(messages, model, max_tokens, temperature, json_mode, tools)
+
 		try:
-			response = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
+			response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
 			response.raise_for_status()
-			data = response.json()
-
-			msg = data["choices"][0]["message"]
-			result = {
-				"content": msg.get("content"),
-				"tokens_input": data.get("usage", {}).get("prompt_tokens", 0),
-				"tokens_output": data.get("usage", {}).get("completion_tokens", 0),
-				"tool_calls": msg.get("tool_calls"),
-			}
-			return result
+			return self._parse_openai_response(response.json())
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-
-			# Auto-retry: if temperature/top_p/max_tokens not supported, retry without them
-			detail_lower = error_detail.lower()
-			if "unsupported" in detail_lower and ("temperature" in detail_lower or "top_p" in detail_lower):
-				payload.pop("temperature", None)
-				payload.pop("top_p", None)
+			error_detail = _error_detail(e.response, str(e))
+
+			for retry_payload in self._openai_retry_payloads(payload, error_detail):
 				try:
-					response2 = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
+					response2 = self.session.post(url, headers=headers, json=retry_payload, timeout=self.timeout)
 					response2.raise_for_status()
-					data2 = response2.json()
-					msg2 = data2["choices"][0]["message"]
-					return {
-						"content": msg2.get("content"),
-						"tokens_input": data2.get("usage", {}).get("prompt_tokens", 0),
-						"tokens_output": data2.get("usage", {}).get("completion_tokens", 0),
-						"tool_calls": msg2.get("tool_calls"),
-					}
+					return self._parse_openai_response(response2.json())
 				except Exception:
 					pass  # Fall through to original error
-			if "unsupported" in detail_lower and "max_tokens" in detail_lower:
-				# Switch from max_tokens to max_completion_tokens
-				val = payload.pop("max_tokens", None)
-				if val:
-					payload["max_completion_tokens"] = val
-					try:
-						response2 = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
-						response2.raise_for_status()
-						data2 = response2.json()
-						msg2 = data2["choices"][0]["message"]
-						return {
-							"content": msg2.get("content"),
-							"tokens_input": data2.get("usage", {}).get("prompt_tokens", 0),
-							"tokens_output": data2.get("usage", {}).get("completion_tokens", 0),
-							"tool_calls": msg2.get("tool_calls"),
-						}
-					except Exception:
-						pass
 
 			frappe.throw(f"AI API error: {error_detail}")
 		except requests.exceptions.Timeout:
@@ -182,11 +240,15 @@ class LLMProvider:
 		except Exception as e:
 			frappe.throw(f"AI request failed: {str(e)}")
 
-	def _call_anthropic(self, messages, model, max_tokens, temperature, tools=None):
-		"""Call Anthropic Claude API (different format from OpenAI).
+	def _anthropic_request(self, messages, model, max_tokens, temperature, tools=None, stream=False):
+		"""Build (url, headers, payload) for the Anthropic Messages API.
 
-		Supports tool calling (function calling) with Anthropic's native format.
-		Converts OpenAI-format tool definitions to Anthropic format automatically.
+		Converts OpenAI-format messages (system, tool results, assistant tool_calls,
+		multipart vision content) and tool definitions to Anthropic's format.
+
+		Prompt caching: a system message carrying CACHE_BREAKPOINT becomes a
+		cache_control breakpoint, so tools + the stable system prefix are cached and
+		only the system blocks after it (RAG, memories, page context) are billed in full.
 		"""
 		url = f"{self.base_url.rstrip('/')}/v1/messages"
 
@@ -196,12 +258,16 @@ class LLMProvider:
 			"anthropic-version": "2023-06-01",
 		}
 
-		# Separate system message from conversation
-		system_text = ""
+		# Separate system messages from conversation
+		system_blocks = []
+		breakpoint_at = None
 		conversation = []
 		for msg in messages:
 			if msg["role"] == "system":
-				system_text += msg["content"] + "\n"
+				if msg.get("content"):
+					system_blocks.append({"type": "text", "text": msg["content"]})
+				if msg.get(CACHE_BREAKPOINT) and system_blocks:
+					breakpoint_at = len(system_blocks) - 1
 			elif msg["role"] == "tool":
 				# Convert OpenAI tool result format to Anthropic
 				conversation.append({
@@ -263,8 +329,13 @@ class LLMProvider:
 			"top_p": self.top_p,
 			"messages": conversation,
 		}
-		if system_text.strip():
-			payload["system"] = system_text.strip()
+		if stream:
+			payload["stream"] = True
+		if breakpoint_at is not None:
+			system_blocks[breakpoint_at]["cache_control"] = _EPHEMERAL
+			payload["system"] = system_blocks
+		elif system_blocks:
+			payload["system"] = "\n".join(b["text"] for b in system_blocks).strip()
 
 		# Convert OpenAI tool definitions to Anthropic format
 		if tools:
@@ -276,49 +347,63 @@ class LLMProvider:
 					"description": func.get("description", ""),
 					"input_schema": func.get("parameters", {"type": "object", "properties": {}}),
 				})
+			if breakpoint_at is not None:
+				# Tools precede the system prompt in the cached prefix; their own breakpoint
+				# keeps them cached when only the system prompt changes
+				anthropic_tools[-1]["cache_control"] = _EPHEMERAL
 			payload["tools"] = anthropic_tools
 
-		try:
-			response = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
-			response.raise_for_status()
-			data = response.json()
+		return url, headers, payload
 
-			content = ""
-			tool_calls = []
-			for block in data.get("content", []):
-				if block.get("type") == "text":
-					content += block["text"]
-				elif block.get("type") == "tool_use":
-					# Convert Anthropic tool_use to OpenAI tool_calls format
-					tool_calls.append({
-						"id": block["id"],
-						"type": "function",
-						"function": {
-							"name": block["name"],
-							"arguments": json.dumps(block.get("input", {})),
-						},
-					})
+	@staticmethod
+	def _parse_anthropic_response(data):
+		content = ""
+		tool_calls = []
+		for block in data.get("content", []):
+			if block.get("type") == "text":
+				content += block["text"]
+			elif block.get("type") == "tool_use":
+				# Convert Anthropic tool_use to OpenAI tool_calls format
+				tool_calls.append({
+					"id": block["id"],
+					"type": "function",
+					"function": {
+						"name": block["name"],
+						"arguments": json.dumps(block.get("input", {})),
+					},
+				})
 
-			result = {
-				"content": content if content else None,
-				"tokens_input": data.get("usage", {}).get("input_tokens", 0),
-				"tokens_output": data.get("usage", {}).get("output_tokens", 0),
-			}
+		tokens_input, cached, written = _anthropic_usage(data.get("usage"))
+		result = {
+			"content": content if content else None,
+			"tokens_input": tokens_input,
+			"tokens_output": data.get("usage", {}).get("output_tokens", 0),
+			"tokens_cached": cached,
+			"tokens_cache_write": written,
+		}
+
+		# Only include tool_calls if there are any
+		if tool_calls:
+			result["tool_calls"] = tool_calls
+
+		return result
 
-			# Only include tool_calls if there are any
-			if tool_calls:
-				result["tool_calls"] = tool_calls
+	def _call_anthropic(self, messages, model, max_tokens, temperature, tools=None):
+		"""Call Anthropic Claude API (different format from OpenAI).
 
-			return result
+		Supports tool calling (function calling) with Anthropic's native format.
+		Converts OpenAI-format tool definitions to Anthropic format automatically.
+		"""
+		url, headers, payload = self._anthropic_request(messages, model, max_tokens, temperature, tools)
+
+		try:
+			response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+			response.raise_for_status()
+			return self._parse_anthropic_response(response.json())
 		except requests.exceptions.Timeout:
 			frappe.throw(f"AI request timed out after {self.timeout}s. Try again or increase timeout.")
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-			frappe.throw(f"Anthropic API error: {error_detail}")
+			frappe.throw(f"Anthropic API error: {_error_detail(e.response, str(e))}")
 		except Exception as e:
 			frappe.throw(f"Anthropic request failed: {str(e)}")
 
@@ -345,125 +430,45 @@ class LLMProvider:
 			yield from self._stream_anthropic(messages, model, max_tokens, temperature, tools)
 			return
 
-		url = f"{self.base_url.rstrip('/')}/chat/completions"
-
-		headers = {
-			"Content-Type": "application/json",
-			"Authorization": f"Bearer {self.api_key}",
-		}
-
-		payload = {
-			"model": model,
-			"messages": messages,
-			"stream": True,
-			"stream_options": {"include_usage": True},
-		}
-
-		# Newer models use max_completion_tokens; older use max_tokens
-		if self._needs_new_params(model):
-			payload["max_completion_tokens"] = max_tokens
-		else:
-			payload["max_tokens"] = max_tokens
-
-		# Reasoning models (o-series) don't support temperature/top_p
-		if not self._is_reasoning_model(model):
-			payload["temperature"] = temperature
-			payload["top_p"] = self.top_p
-
-		if tools:
-			payload["tools"] = tools
-			payload["tool_choice"] = "auto"
+		url, headers, payload = self._openai_request(
+			messages, model, max_tokens, temperature, tools=tools, stream=True
+		)
 
 		try:
-			response = requests.post(
+			response = self.session.post(
 				url, headers=headers, json=payload,
 				timeout=self.timeout, stream=True,
 			)
 			response.raise_for_status()
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-
-			# Auto-retry without temperature/top_p if unsupported
-			detail_lower = error_detail.lower()
+			error_detail = _error_detail(e.response, str(e))
+
+			# Auto-retry without unsupported parameters
 			retried = False
-			if "unsupported" in detail_lower and ("temperature" in detail_lower or "top_p" in detail_lower):
-				payload.pop("temperature", None)
-				payload.pop("top_p", None)
+			for retry_payload in self._openai_retry_payloads(payload, error_detail):
 				try:
-					response = requests.post(
-						url, headers=headers, json=payload,
+					response = self.session.post(
+						url, headers=headers, json=retry_payload,
 						timeout=self.timeout, stream=True,
 					)
 					response.raise_for_status()
 					retried = True
+					break
 				except Exception:
 					pass
-			if "unsupported" in detail_lower and "max_tokens" in detail_lower:
-				val = payload.pop("max_tokens", None)
-				if val:
-					payload["max_completion_tokens"] = val
-					try:
-						response = requests.post(
-							url, headers=headers, json=payload,
-							timeout=self.timeout, stream=True,
-						)
-						response.raise_for_status()
-						retried = True
-					except Exception:
-						pass
 			if not retried:
 				raise Exception(f"AI API error: {error_detail}")
 		except requests.exceptions.Timeout:
 			raise Exception(f"AI request timed out after {self.timeout}s")
 
+		parser = _OpenAIStreamParser()
 		try:
-			for line in response.iter_lines():
-				if not line:
-					continue
-				line_str = line.decode("utf-8")
-				if not line_str.startswith("data: "):
-					continue
-				data_str = line_str[6:]
-				if data_str.strip() == "[DONE]":
-					break
-
-				try:
-					chunk = json.loads(data_str)
-				except json.JSONDecodeError:
-					continue
-
-				# Usage in final chunk
-				if chunk.get("usage"):
-					yield {"type": "usage", "usage": chunk["usage"]}
-					continue
-
-				choices = chunk.get("choices", [])
-				if not choices:
-					continue
-
-				delta = choices[0].get("delta", {})
-
-				# Text content
-				if delta.get("content"):
-					yield {"type": "chunk", "content": delta["content"]}
-
-				# Tool calls
-				if delta.get("tool_calls"):
-					yield {"type": "tool_call_delta", "delta": delta["tool_calls"]}
-
+			for line in _iter_stream_lines(response):
+				yield from parser.feed(line)
 		except requests.exceptions.Timeout:
 			raise Exception(f"AI request timed out after {self.timeout}s")
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-			raise Exception(f"AI API error: {error_detail}")
+			raise Exception(f"AI API error: {_error_detail(e.response, str(e))}")
 
 	def _stream_anthropic(self, messages, model, max_tokens, temperature, tools=None):
 		"""Stream Anthropic Claude API responses using server-sent events.
@@ -473,183 +478,27 @@ class LLMProvider:
 		  {"type": "tool_call_delta", "delta": [...]}
 		  {"type": "usage", "usage": {...}}
 		"""
-		url = f"{self.base_url.rstrip('/')}/v1/messages"
-
-		headers = {
-			"Content-Type": "application/json",
-			"x-api-key": self.api_key,
-			"anthropic-version": "2023-06-01",
-		}
-
-		# Reuse the same message conversion as _call_anthropic
-		system_text = ""
-		conversation = []
-		for msg in messages:
-			if msg["role"] == "system":
-				system_text += msg["content"] + "\n"
-			elif msg["role"] == "tool":
-				conversation.append({
-					"role": "user",
-					"content": [{
-						"type": "tool_result",
-						"tool_use_id": msg.get("tool_call_id", ""),
-						"content": msg.get("content", ""),
-					}],
-				})
-			elif msg["role"] == "assistant" and msg.get("tool_calls"):
-				content_blocks = []
-				if msg.get("content"):
-					content_blocks.append({"type": "text", "text": msg["content"]})
-				for tc in msg["tool_calls"]:
-					try:
-						args = json.loads(tc["function"]["arguments"]) if isinstance(tc["function"]["arguments"], str) else tc["function"]["arguments"]
-					except (json.JSONDecodeError, TypeError):
-						args = {}
-					content_blocks.append({
-						"type": "tool_use",
-						"id": tc["id"],
-						"name": tc["function"]["name"],
-						"input": args,
-					})
-				conversation.append({"role": "assistant", "content": content_blocks})
-			else:
-				content = msg.get("content", "")
-				if isinstance(content, list):
-					anthropic_content = []
-					for part in content:
-						if part.get("type") == "text":
-							anthropic_content.append({"type": "text", "text": part["text"]})
-						elif part.get("type") == "image_url":
-							img_url = part.get("image_url", {}).get("url", "")
-							if img_url.startswith("data:"):
-								header, b64_data = img_url.split(",", 1) if "," in img_url else ("", "")
-								media_type = header.split(":")[1].split(";")[0] if ":" in header else "image/png"
-								anthropic_content.append({
-									"type": "image",
-									"source": {
-										"type": "base64",
-										"media_type": media_type,
-										"data": b64_data,
-									},
-								})
-					conversation.append({"role": msg["role"], "content": anthropic_content if anthropic_content else content})
-				else:
-					conversation.append({"role": msg["role"], "content": content})
-
-		payload = {
-			"model": model,
-			"max_tokens": max_tokens,
-			"temperature": temperature,
-			"top_p": self.top_p,
-			"messages": conversation,
-			"stream": True,
-		}
-		if system_text.strip():
-			payload["system"] = system_text.strip()
-
-		if tools:
-			anthropic_tools = []
-			for t in tools:
-				func = t.get("function", {})
-				anthropic_tools.append({
-					"name": func.get("name", ""),
-					"description": func.get("description", ""),
-					"input_schema": func.get("parameters", {"type": "object", "properties": {}}),
-				})
-			payload["tools"] = anthropic_tools
+		url, headers, payload = self._anthropic_request(
+			messages, model, max_tokens, temperature, tools, stream=True
+		)
 
 		try:
-			response = requests.post(
+			response = self.session.post(
 				url, headers=headers, json=payload,
 				timeout=self.timeout, stream=True,
 			)
 			response.raise_for_status()
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-			raise Exception(f"Anthropic API error: {error_detail}")
+			raise Exception(f"Anthropic API error: {_error_detail(e.response, str(e))}")
 		except requests.exceptions.Timeout:
 			raise Exception(f"AI request timed out after {self.timeout}s")
 
-		# Track tool call accumulation during streaming
-		current_tool_id = None
-		current_tool_name = None
-		current_tool_input = ""
-		usage_data = {}
-
-		for line in response.iter_lines():
-			if not line:
-				continue
-			line_str = line.decode("utf-8")
-			if not line_str.startswith("data: "):
-				continue
-			data_str = line_str[6:].strip()
-			if not data_str:
-				continue
-
-			try:
-				event = json.loads(data_str)
-			except json.JSONDecodeError:
-				continue
-
-			event_type = event.get("type", "")
-
-			if event_type == "content_block_start":
-				block = event.get("content_block", {})
-				if block.get("type") == "tool_use":
-					current_tool_id = block.get("id", "")
-					current_tool_name = block.get("name", "")
-					current_tool_input = ""
-
-			elif event_type == "content_block_delta":
-				delta = event.get("delta", {})
-				if delta.get("type") == "text_delta":
-					yield {"type": "chunk", "content": delta.get("text", "")}
-				elif delta.get("type") == "input_json_delta":
-					current_tool_input += delta.get("partial_json", "")
-
-			elif event_type == "content_block_stop":
-				if current_tool_id and current_tool_name:
-					# Emit complete tool call in OpenAI format
-					yield {
-						"type": "tool_call_delta",
-						"delta": [{
-							"index": 0,
-							"id": current_tool_id,
-							"type": "function",
-							"function": {
-								"name": current_tool_name,
-								"arguments": current_tool_input,
-							},
-						}],
-					}
-					current_tool_id = None
-					current_tool_name = None
-					current_tool_input = ""
-
-			elif event_type == "message_delta":
-				# Usage info comes in message_delta
-				u = event.get("usage", {})
-				if u:
-					usage_data["completion_tokens"] = u.get("output_tokens", 0)
-
-			elif event_type == "message_start":
-				u = event.get("message", {}).get("usage", {})
-				if u:
-					usage_data["prompt_tokens"] = u.get("input_tokens", 0)
-
-			elif event_type == "message_stop":
-				if usage_data:
-					yield {"type": "usage", "usage": usage_data}
+		parser = _AnthropicStreamParser()
+		for line in _iter_stream_lines(response):
+			yield from parser.feed(line)
 
-	def get_embeddings(self, texts, model=None):
-		"""Get embeddings for a list of texts. Returns list of embedding vectors.
-
-		Works with OpenAI embeddings API and compatible endpoints.
-		"""
+	def _embeddings_request(self, texts, model=None):
+		"""Build (url, headers, payload) for an OpenAI-compatible embeddings call."""
 		settings = self.settings
 		embed_model = model or settings.embedding_model
 		if not embed_model:
@@ -667,15 +516,139 @@ class LLMProvider:
 			"model": embed_model,
 			"input": texts if isinstance(texts, list) else [texts],
 		}
+		return url, headers, payload
+
+	def get_embeddings(self, texts, model=None):
+		"""Get embeddings for a list of texts. Returns list of embedding vectors.
+
+		Works with OpenAI embeddings API and compatible endpoints.
+		"""
+		url, headers, payload = self._embeddings_request(texts, model)
 
 		try:
-			response = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
+			response = get_session(url).post(url, headers=headers, json=payload, timeout=self.timeout)
 			response.raise_for_status()
 			data = response.json()
 			return [item["embedding"] for item in data["data"]]
 		except Exception as e:
 			frappe.throw(f"Embedding request failed: {str(e)}")
 
+	# ─── Async client path ───────────────────────────────────
+	# Same arguments, return values and events as the blocking methods, built on
+	# httpx. Requests to one provider share a per-event-loop semaphore
+	# (AI Settings → Async Provider Concurrency) so a worker can keep many calls
+	# in flight without overrunning rate limits.
+
+	async def achat(self, messages, model=None, max_tokens=None, temperature=None, json_mode=False, tools=None):
+		"""Async counterpart of chat()."""
+		httpx = get_httpx()
+		model = model or self.default_model
+		max_tokens = max_tokens or self.max_tokens
+		temperature = temperature if temperature is not None else self.temperature
+
+		start_time = time.time()
+
+		try:
+			if self.provider_type == "Anthropic":
+				url, headers, payload = self._anthropic_request(messages, model, max_tokens, temperature, tools)
+				result = self._parse_anthropic_response(await self._apost_json(url, headers, payload))
+			else:
+				url, headers, payload = self._openai_request(
+					messages, model, max_tokens, temperature, json_mode, tools
+				)
+				result = self._parse_openai_response(
+					await self._apost_json(url, headers, payload, retry_payloads=self._openai_retry_payloads)
+				)
+		except httpx.TimeoutException:
+			frappe.throw(f"AI request timed out after {self.timeout}s. Try again or increase timeout.")
+		except httpx.HTTPStatusError as e:
+			frappe.throw(f"AI API error: {_error_detail(e.response, str(e))}")
+		except httpx.HTTPError as e:
+			frappe.throw(f"AI request failed: {str(e)}")
+
+		result["response_time"] = round(time.time() - start_time, 2)
+		result["model"] = model
+		return result
+
+	async def achat_stream(self, messages, model=None, max_tokens=None, temperature=None, tools=None):
+		"""Async counterpart of chat_stream() — an async generator of the same events."""
+		httpx = get_httpx()
+		model = model or self.default_model
+		max_tokens = max_tokens or self.max_tokens
+		temperature = temperature if temperature is not None else self.temperature
+
+		if self.provider_type == "Anthropic":
+			url, headers, payload = self._anthropic_request(
+				messages, model, max_tokens, temperature, tools, stream=True
+			)
+			parser = _AnthropicStreamParser()
+			retry_payloads = None
+		else:
+			url, headers, payload = self._openai_request(
+				messages, model, max_tokens, temperature, tools=tools, stream=True
+			)
+			parser = _OpenAIStreamParser()
+			retry_payloads = self._openai_retry_payloads
+
+		try:
+			async for line in self._astream_lines(url, headers, payload, retry_payloads):
+				for event in parser.feed(line):
+					yield event
+		except httpx.TimeoutException:
+			raise Exception(f"AI request timed out after {self.timeout}s")
+		except httpx.HTTPStatusError as e:
+			raise Exception(f"AI API error: {_error_detail(e.response, str(e))}")
+
+	async def aget_embeddings(self, texts, model=None):
+		"""Async counterpart of get_embeddings()."""
+		url, headers, payload = self._embeddings_request(texts, model)
+
+		try:
+			data = await self._apost_json(url, headers, payload)
+			return [item["embedding"] for item in data["data"]]
+		except Exception as e:
+			frappe.throw(f"Embedding request failed: {str(e)}")
+
+	async def _apost_json(self, url, headers, payload, retry_payloads=None):
+		"""POST and return the JSON body, retrying with adjusted payloads on rejection."""
+		httpx = get_httpx()
+		client = get_async_client(url)
+		async with get_provider_semaphore(self.base_url, self.async_concurrency):
+			response = await client.post(url, headers=headers, json=payload, timeout=self.timeout)
+			if response.is_error and retry_payloads:
+				error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+				for retry_payload in retry_payloads(payload, _error_detail(response, str(error))):
+					retry = await client.post(url, headers=headers, json=retry_payload, timeout=self.timeout)
+					if not retry.is_error:
+						return retry.json()
+				raise error
+			response.raise_for_status()
+			return response.json()
+
+	async def _astream_lines(self, url, headers, payload, retry_payloads=None):
+		"""Yield the lines of a streamed POST, retrying with adjusted payloads on rejection."""
+		httpx = get_httpx()
+		client = get_async_client(url)
+		async with get_provider_semaphore(self.base_url, self.async_concurrency):
+			retries = None
+			while True:
+				async with client.stream("POST", url, headers=headers, json=payload, timeout=self.timeout) as response:
+					if not response.is_error:
+						async for line in response.aiter_lines():
+							yield line
+						return
+					await response.aread()
+					error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+					detail = _error_detail(response, str(error))
+
+				if retry_payloads is None:
+					raise error
+				if retries is None:
+					retries = retry_payloads(payload, detail)
+				payload = next(retries, None)
+				if payload is None:
+					raise error
+
 	def generate_image(self, prompt, model="dall-e-3", size="1024x1024", quality="standard", n=1):
 		"""Generate an image using OpenAI's DALL-E API.
 
@@ -711,7 +684,7 @@ class LLMProvider:
 			payload["quality"] = quality
 
 		try:
-			response = requests.post(url, headers=headers, json=payload, timeout=120)
+			response = self.session.post(url, headers=headers, json=payload, timeout=120)
 			response.raise_for_status()
 			data = response.json()
 
@@ -723,11 +696,132 @@ class LLMProvider:
 				"size": size,
 			}
 		except requests.exceptions.HTTPError as e:
-			error_detail = ""
-			try:
-				error_detail = e.response.json().get("error", {}).get("message", str(e))
-			except Exception:
-				error_detail = str(e)
-			frappe.throw(f"Image generation error: {error_detail}")
+			frappe.throw(f"Image generation error: {_error_detail(e.response, str(e))}")
 		except Exception as e:
 			frappe.throw(f"Image generation failed: {str(e)}")
+
+
+class _OpenAIStreamParser:
+	"""Turns OpenAI-compatible SSE lines into chat_stream events."""
+
+	def feed(self, line):
+		if isinstance(line, bytes):
+			line = line.decode("utf-8")
+		if not line or not line.startswith("data: "):
+			return []
+		data_str = line[6:]
+		if data_str.strip() == "[DONE]":
+			# Callers keep reading to EOF so the connection goes back to the pool
+			return []
+
+		try:
+			chunk = json.loads(data_str)
+		except json.JSONDecodeError:
+			return []
+
+		# Usage in final chunk
+		if chunk.get("usage"):
+			return [{"type": "usage", "usage": chunk["usage"]}]
+
+		choices = chunk.get("choices", [])
+		if not choices:
+			return []
+
+		delta = choices[0].get("delta", {})
+		events = []
+
+		# Text content
+		if delta.get("content"):
+			events.append({"type": "chunk", "content": delta["content"]})
+
+		# Tool calls
+		if delta.get("tool_calls"):
+			events.append({"type": "tool_call_delta", "delta": delta["tool_calls"]})
+
+		return events
+
+
+class _AnthropicStreamParser:
+	"""Turns Anthropic SSE lines into chat_stream events (OpenAI-format tool calls)."""
+
+	def __init__(self):
+		# Track tool call accumulation during streaming
+		self.current_tool_id = None
+		self.current_tool_name = None
+		self.current_tool_input = ""
+		self.tool_index = 0
+		self.usage_data = {}
+
+	def feed(self, line):
+		if isinstance(line, bytes):
+			line = line.decode("utf-8")
+		if not line or not line.startswith("data: "):
+			return []
+		data_str = line[6:].strip()
+		if not data_str:
+			return []
+
+		try:
+			event = json.loads(data_str)
+		except json.JSONDecodeError:
+			return []
+
+		event_type = event.get("type", "")
+
+		if event_type == "content_block_start":
+			block = event.get("content_block", {})
+			if block.get("type") == "tool_use":
+				self.current_tool_id = block.get("id", "")
+				self.current_tool_name = block.get("name", "")
+				self.current_tool_input = ""
+
+		elif event_type == "content_block_delta":
+			delta = event.get("delta", {})
+			if delta.get("type") == "text_delta":
+				return [{"type": "chunk", "content": delta.get("text", "")}]
+			elif delta.get("type") == "input_json_delta":
+				self.current_tool_input += delta.get("partial_json", "")
+
+		elif event_type == "content_block_stop":
+			if self.current_tool_id and self.current_tool_name:
+				# Emit complete tool call in OpenAI format
+				tool_call = {
+					"type": "tool_call_delta",
+					"delta": [{
+						"index": self.tool_index,
+						"id": self.current_tool_id,
+						"type": "function",
+						"function": {
+							"name": self.current_tool_name,
+							"arguments": self.current_tool_input,
+						},
+					}],
+				}
+				self.current_tool_id = None
+				self.current_tool_name = None
+				self.current_tool_input = ""
+				self.tool_index += 1
+				return [tool_call]
+
+		elif event_type == "message_delta":
+			# Usage info comes in message_delta
+			u = event.get("usage", {})
+			if u:
+				self.usage_data["completion_tokens"] = u.get("output_tokens", 0)
+
+		elif event_type == "message_start":
+			u = event.get("message", {}).get("usage", {})
+			if u:
+				# Same shape as OpenAI usage, so callers read cache hits with cache_usage()
+				tokens_input, cached, written = _anthropic_usage(u)
+				self.usage_data["prompt_tokens"] = tokens_input
+				self.usage_data["prompt_tokens_details"] = {
+					"cached_tokens": cached,
+					"cache_write_tokens": written,
+				}
+
+		elif event_type == "message_stop":
+			if self.usage_data:
+				return [{"type": "usage", "usage": self.usage_data}]
+
+		return []
@@ -0,0 +1,228 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# ANN Index — Inverted-file (IVF) approximate nearest-neighbour search for RAG.
+#
+# Spherical k-means (numpy only) partitions the resident vector index into lists.
+# A query scores the centroids first and only runs exact cosine over the rows in
+# the `nprobe` closest lists. Centroids + row assignments are persisted to the
+# site's private files and rebuilt by the nightly reindex.
+
+import os
+import time
+
+import frappe
+
+from oly_ai.core.rag.vector_index import get_vector_index
+
+ANN_FILENAME = "oly_ai_ann_index.npz"
+SEARCH_MODE_IVF = "Approximate (IVF)"
+
+# Below this many rows exact search is fast enough — IVF is skipped
+ANN_MIN_ROWS = 2000
+MAX_LISTS = 1024
+# k-means trains on a sample to keep nightly builds bounded
+TRAIN_SAMPLE = 50000
+TRAIN_ITERATIONS = 10
+# Rows per block when assigning vectors to centroids
+ASSIGN_BLOCK = 8192
+
+_persisted = {}
+
+
+def is_enabled(settings=None):
+	"""Return True if AI Settings selects the IVF search mode."""
+	settings = settings or frappe.get_cached_doc("AI Settings")
+	return settings.get("rag_search_mode") == SEARCH_MODE_IVF
+
+
+def get_ann_path():
+	return frappe.get_site_path("private", "files", ANN_FILENAME)
+
+
+def build_ann_index(iterations=TRAIN_ITERATIONS):
+	"""Train IVF centroids over the resident index and persist them.
+
+	Returns:
+		dict: {"status", "rows", "lists", "build_time"}
+	"""
+	np = _get_numpy()
+	start = time.time()
+
+	index = get_vector_index()
+	n_rows = len(index)
+	if n_rows < ANN_MIN_ROWS:
+		return {"status": "skipped", "reason": f"Index has fewer than {ANN_MIN_ROWS} chunks", "rows": n_rows}
+
+	n_lists = min(MAX_LISTS, max(1, int(np.sqrt(n_rows))))
+	centroids = _train_kmeans(index.matrix, n_lists, iterations)
+	lists = _assign(index.matrix, centroids)
+
+	path = get_ann_path()
+	tmp_path = path + ".tmp.npz"
+	np.savez(tmp_path, centroids=centroids, lists=lists, names=np.array(index.names))
+	os.replace(tmp_path, path)
+
+	return {
+		"status": "built",
+		"rows": n_rows,
+		"lists": n_lists,
+		"build_time": round(time.time() - start, 2),
+	}
+
+
+def probe_candidates(index, query_unit, candidates, nprobe=8):
+	"""Narrow candidate rows to those in the `nprobe` lists nearest the query.
+
+	Falls back to the unfiltered candidates when no persisted IVF index is
+	available or the index is too small to benefit.
+	"""
+	np = _get_numpy()
+	ivf = len(index) >= ANN_MIN_ROWS and _attach(index)
+	if not ivf:
+		return candidates
+
+	centroids, lists = ivf
+	nprobe = max(1, min(int(nprobe), len(centroids)))
+	centroid_scores = centroids @ query_unit
+	probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+
+	return candidates[np.isin(lists[candidates], probe)]
+
+
+def evaluate_recall(k=10, samples=50, nprobe=8):
+	"""Measure recall@k of IVF search against exact search.
+
+	Uses stored chunk vectors as queries, so no embedding API calls are made.
+
+	Returns:
+		dict: {"recall_at_k", "k", "samples", "nprobe", "avg_scanned_pct",
+		       "exact_ms", "ann_ms"}
+	"""
+	np = _get_numpy()
+	index = get_vector_index()
+	if len(index) < ANN_MIN_ROWS or not _attach(index):
+		return {"status": "unavailable", "reason": "No IVF index built (or index too small)"}
+
+	k = int(k)
+	samples = min(int(samples), len(index))
+	rng = np.random.default_rng(0)
+	query_rows = rng.choice(len(index), size=samples, replace=False)
+	all_rows = np.arange(len(index))
+
+	hits = 0
+	scanned = 0
+	exact_time = 0.0
+	ann_time = 0.0
+
+	for row in query_rows:
+		query = index.matrix[row]
+
+		t0 = time.perf_counter()
+		exact_scores = index.matrix @ query
+		exact_top = set(np.argsort(exact_scores)[::-1][:k].tolist())
+		exact_time += time.perf_counter() - t0
+
+		t0 = time.perf_counter()
+		cand = probe_candidates(index, query, all_rows, nprobe=nprobe)
+		ann_scores = index.matrix[cand] @ query
+		ann_top = set(cand[np.argsort(ann_scores)[::-1][:k]].tolist())
+		ann_time += time.perf_counter() - t0
+
+		hits += len(exact_top & ann_top)
+		scanned += len(cand)
+
+	return {
+		"recall_at_k": round(hits / (samples * k), 4),
+		"k": k,
+		"samples": samples,
+		"nprobe": nprobe,
+		"avg_scanned_pct": round(100.0 * scanned / (samples * len(index)), 2),
+		"exact_ms": round(1000 * exact_time / samples, 3),
+		"ann_ms": round(1000 * ann_time / samples, 3),
+	}
+
+
+def _attach(index):
+	"""Return (centroids, per-row list ids) for `index`, or None if there is no usable IVF file.
+
+	The pair is cached on the index as one tuple, so threads probing the same
+	index never mix centroids and list ids from different builds.
+	"""
+	np = _get_numpy()
+	path = get_ann_path()
+	try:
+		mtime = os.path.getmtime(path)
+	except OSError:
+		return None
+
+	attached = getattr(index, "_ann", None)
+	if attached and attached[0] == mtime:
+		return attached[1:]
+
+	site = getattr(frappe.local, "site", None) or ""
+	persisted = _persisted.get(site)
+	if not persisted or persisted["mtime"] != mtime:
+		with np.load(path, allow_pickle=False) as data:
+			persisted = {
+				"mtime": mtime,
+				"centroids": data["centroids"],
+				"by_name": dict(zip(data["names"].tolist(), data["lists"].tolist())),
+			}
+		_persisted[site] = persisted
+
+	centroids = persisted["centroids"]
+	if centroids.shape[1] != index.dim:
+		return None
+
+	# Rows indexed after the last build are assigned to their nearest centroid
+	by_name = persisted["by_name"]
+	lists = np.array([by_name.get(n, -1) for n in index.names], dtype=np.int32)
+	missing = np.nonzero(lists < 0)[0]
+	if len(missing):
+		lists[missing] = _assign(index.matrix[missing], centroids)
+
+	index._ann = (mtime, centroids, lists)
+	return centroids, lists
+
+
+def _train_kmeans(matrix, n_lists, iterations):
+	"""Spherical k-means on a sample of unit vectors; returns unit centroids."""
+	np = _get_numpy()
+	rng = np.random.default_rng(0)
+
+	sample = matrix
+	if len(matrix) > TRAIN_SAMPLE:
+		sample = matrix[rng.choice(len(matrix), size=TRAIN_SAMPLE, replace=False)]
+
+	centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+	for _ in range(iterations):
+		assign = _assign(sample, centroids)
+		sums = np.zeros_like(centroids)
+		np.add.at(sums, assign, sample)
+		counts = np.bincount(assign, minlength=n_lists)
+
+		# Re-seed empty lists with random sample points
+		empty = np.nonzero(counts == 0)[0]
+		if len(empty):
+			sums[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+
+		norms = np.linalg.norm(sums, axis=1, keepdims=True)
+		norms[norms == 0] = 1.0
+		centroids = (sums / norms).astype(np.float32)
+
+	return centroids
+
+
+def _assign(matrix, centroids):
+	"""Return the nearest-centroid id for each row (block-wise to bound memory)."""
+	np = _get_numpy()
+	out = np.empty(len(matrix), dtype=np.int32)
+	for start in range(0, len(matrix), ASSIGN_BLOCK):
+		block = matrix[start:start + ASSIGN_BLOCK]
+		out[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+	return out
+
+
+def _get_numpy():
+	from oly_ai.core.rag.retriever import _get_numpy as get_np
+	return get_np()
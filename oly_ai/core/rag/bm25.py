@@ -0,0 +1,131 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# BM25 Inverted Index — term statistics built at index time, scored from postings.
+#
+# index_document writes one AI Index Term row per (term, chunk) with its frequency
+# and stores the chunk's token count on AI Document Index. At query time only the
+# postings for the query's terms are read: document frequency comes from an index
+# range count and term frequencies from the (term, chunk) composite index.
+
+import math
+import re
+from collections import Counter
+
+import frappe
+
+# Okapi BM25 parameters (same defaults as rank_bm25.BM25Okapi)
+K1 = 1.5
+B = 0.75
+
+# Longest term stored — matches the AI Index Term.term column length
+MAX_TERM_LENGTH = 64
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+	"""Simple tokenizer shared by indexing and querying."""
+	if not text:
+		return []
+	# Lower-case, split on non-alphanum, filter short tokens
+	tokens = _TOKEN_RE.findall(text.lower())
+	return [t[:MAX_TERM_LENGTH] for t in tokens if len(t) >= 2]
+
+
+def term_counts(text):
+	"""Return {term: frequency} for a chunk; its total is the chunk's token count."""
+	return Counter(tokenize(text))
+
+
+def build_postings(chunk_name, doctype, name, counts):
+	"""Return posting rows (for write_postings) from a chunk's term_counts."""
+	return [
+		(frappe.generate_hash(length=10), term, tf, chunk_name, doctype, name)
+		for term, tf in counts.items()
+	]
+
+
+def write_postings(rows):
+	"""Bulk-insert posting rows produced by build_postings."""
+	if rows:
+		frappe.db.bulk_insert(
+			"AI Index Term",
+			fields=["name", "term", "tf", "chunk", "reference_doctype", "reference_name"],
+			values=rows,
+			ignore_duplicates=True,
+		)
+
+
+def delete_postings(doctype, name=None):
+	"""Remove postings for one document (or a list of names), or a whole doctype when name is None."""
+	filters = {"reference_doctype": doctype}
+	if isinstance(name, (list, tuple)):
+		filters["reference_name"] = ["in", name]
+	elif name is not None:
+		filters["reference_name"] = name
+	frappe.db.delete("AI Index Term", filters)
+
+
+def delete_chunk_postings(chunk_names):
+	"""Remove postings for specific AI Document Index rows."""
+	if chunk_names:
+		frappe.db.delete("AI Index Term", {"chunk": ["in", list(chunk_names)]})
+
+
+def get_document_frequencies(terms):
+	"""Return {term: number of chunks containing it} for the given terms."""
+	if not terms:
+		return {}
+	rows = frappe.db.sql(
+		"""SELECT term, COUNT(*) FROM `tabAI Index Term`
+		WHERE term IN %(terms)s
+		GROUP BY term""",
+		{"terms": tuple(terms)},
+	)
+	return {term: cnt for term, cnt in rows}
+
+
+def get_term_frequencies(terms, chunk_names):
+	"""Return {(chunk, term): tf} for the given terms restricted to chunk_names."""
+	if not terms or not chunk_names:
+		return {}
+	rows = frappe.db.sql(
+		"""SELECT chunk, term, tf FROM `tabAI Index Term`
+		WHERE term IN %(terms)s AND chunk IN %(chunks)s""",
+		{"terms": tuple(terms), "chunks": tuple(chunk_names)},
+	)
+	return {(chunk, term): tf for chunk, term, tf in rows}
+
+
+def idf(df, total_docs):
+	"""Non-negative BM25 inverse document frequency."""
+	return math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_scores(query_terms, chunk_names, doc_lengths, total_docs, avg_length, doc_freqs, term_freqs):
+	"""Score chunks against query terms from precomputed statistics.
+
+	Args:
+		query_terms: tokenized query (deduplicated)
+		chunk_names: chunk ids to score, in output order
+		doc_lengths: token count per chunk (same order as chunk_names)
+		total_docs: number of chunks in the corpus
+		avg_length: mean chunk token count across the corpus
+		doc_freqs: {term: df}
+		term_freqs: {(chunk, term): tf}
+
+	Returns:
+		list[float]: raw BM25 score per chunk
+	"""
+	avg_length = avg_length or 1.0
+	weights = {t: idf(doc_freqs[t], total_docs) for t in query_terms if doc_freqs.get(t)}
+
+	scores = []
+	for chunk, length in zip(chunk_names, doc_lengths):
+		norm = K1 * (1 - B + B * (length or 0) / avg_length)
+		score = 0.0
+		for term, weight in weights.items():
+			tf = term_freqs.get((chunk, term))
+			if tf:
+				score += weight * tf * (K1 + 1) / (tf + norm)
+		scores.append(score)
+	return scores
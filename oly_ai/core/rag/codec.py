@@ -0,0 +1,108 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Embedding Codec — Compact binary encoding for vectors stored in AI Document Index.
+#
+# Vectors are packed as little-endian float32 (optionally float16 or int8-quantized)
+# and base64-encoded so they fit the existing Long Text column. A version marker
+# prefixes every value so legacy JSON rows ("[0.1, 0.2, ...]") keep decoding.
+#
+# Layout:
+#   ov1:f32:<base64>            — float32, 4 bytes/dim
+#   ov1:f16:<base64>            — float16, 2 bytes/dim
+#   ov1:i8:<scale>:<base64>     — symmetric int8, 1 byte/dim, value = q * scale
+
+import base64
+import json
+
+import frappe
+
+CODEC_VERSION = "ov1"
+
+# AI Settings → embedding_storage label → codec dtype tag
+STORAGE_FORMATS = {
+	"Float32": "f32",
+	"Float16": "f16",
+	"Int8 (Quantized)": "i8",
+}
+
+_DTYPES = {
+	"f32": "<f4",
+	"f16": "<f2",
+	"i8": "i1",
+}
+
+
+def get_storage_format():
+	"""Return the codec tag configured in AI Settings (defaults to float32)."""
+	try:
+		label = frappe.get_cached_doc("AI Settings").get("embedding_storage")
+	except Exception:
+		label = None
+	return STORAGE_FORMATS.get(label or "Float32", "f32")
+
+
+def is_legacy_json(value):
+	"""Return True if a stored embedding is in the old JSON-array format."""
+	return bool(value) and value.lstrip()[:1] == "["
+
+
+def encode_embedding(vector, fmt=None):
+	"""Pack an embedding vector into the versioned binary text format.
+
+	Args:
+		vector: list of floats or numpy array
+		fmt: codec tag ("f32", "f16", "i8"); defaults to the AI Settings choice
+
+	Returns:
+		str: encoded value safe to store in a Long Text field
+	"""
+	import numpy as np
+
+	fmt = fmt or get_storage_format()
+	if fmt not in _DTYPES:
+		frappe.throw(f"Unknown embedding storage format: {fmt}")
+
+	arr = np.asarray(vector, dtype=np.float32)
+
+	if fmt == "i8":
+		max_abs = float(np.max(np.abs(arr))) if arr.size else 0.0
+		scale = max_abs / 127.0 if max_abs > 0 else 1.0
+		packed = np.clip(np.rint(arr / scale), -127, 127).astype(_DTYPES["i8"])
+		payload = base64.b64encode(packed.tobytes()).decode("ascii")
+		return f"{CODEC_VERSION}:i8:{scale!r}:{payload}"
+
+	packed = arr.astype(_DTYPES[fmt])
+	payload = base64.b64encode(packed.tobytes()).decode("ascii")
+	return f"{CODEC_VERSION}:{fmt}:{payload}"
+
+
+def decode_embedding(value):
+	"""Unpack a stored embedding into a float32 numpy array.
+
+	Float32 values are returned as a read-only view over the decoded bytes
+	(``numpy.frombuffer``) — no per-element parsing or copying. Legacy JSON
+	rows are still accepted.
+
+	Returns:
+		numpy.ndarray | None: 1-D float32 vector, or None if the value is unreadable
+	"""
+	import numpy as np
+
+	if not value:
+		return None
+
+	try:
+		if value.startswith(CODEC_VERSION + ":"):
+			_, fmt, rest = value.split(":", 2)
+			if fmt == "i8":
+				scale, payload = rest.split(":", 1)
+				raw = np.frombuffer(base64.b64decode(payload), dtype=_DTYPES["i8"])
+				return raw.astype(np.float32) * np.float32(float(scale))
+			raw = np.frombuffer(base64.b64decode(rest), dtype=_DTYPES[fmt])
+			return raw if fmt == "f32" else raw.astype(np.float32)
+
+		if is_legacy_json(value):
+			return np.asarray(json.loads(value), dtype=np.float32)
+	except (ValueError, KeyError, TypeError):
+		return None
+
+	return None
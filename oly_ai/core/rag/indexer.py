@@ -2,35 +2,67 @@
 # RAG Indexer — Extracts text from ERPNext documents/Wiki and creates embeddings.
 # Stores vectors in MariaDB (no external vector DB needed for Phase 1).
 
+import contextvars
 import hashlib
-import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import frappe
 from frappe import _
-from frappe.utils import cstr
+from frappe.utils import cint, cstr, now_datetime
 
 from oly_ai.core.provider import LLMProvider
+from oly_ai.core.rag import bm25
+from oly_ai.core.rag.codec import decode_embedding, encode_embedding, get_storage_format
+from oly_ai.core.rag.vector_index import mark_document_changed, reset_vector_index
+
+# Documents extracted, embedded and committed together by index_documents
+PIPELINE_WINDOW = 200
+# Approximate token budget per embeddings request (OpenAI allows 300k)
+EMBEDDING_BATCH_TOKENS = 100000
+
+# Column order for bulk inserts into AI Document Index
+INDEX_FIELDS = [
+	"name", "creation", "modified", "owner", "modified_by",
+	"reference_doctype", "reference_name", "chunk_index", "token_count",
+	"content_hash", "chunk_text", "embedding",
+]
 
 
 def chunk_text(text, chunk_size=500, overlap=50):
-	"""Split text into overlapping chunks for embedding."""
+	"""Split text into overlapping chunks for embedding.
+
+	Chunk ends are content-defined: once a chunk has chunk_size // 2 words it
+	closes after the first word whose CRC hits a 1-in-(chunk_size // 2) boundary
+	(or at chunk_size words). An edit therefore only changes the chunks around
+	it — later boundaries fall on the same words — so unchanged chunks keep
+	their hashes and are not re-embedded.
+	"""
 	if not text:
 		return []
 
 	words = text.split()
+	min_size = max(1, chunk_size // 2)
 	chunks = []
-	i = 0
-	while i < len(words):
-		chunk = " ".join(words[i : i + chunk_size])
+	start = 0
+	while start < len(words):
+		end = min(start + min_size, len(words))
+		while end < len(words) and end - start < chunk_size:
+			end += 1
+			if zlib.crc32(words[end - 1].encode()) % min_size == 0:
+				break
+
+		lead = max(0, start - overlap) if chunks else start
+		chunk = " ".join(words[lead:end])
 		if chunk.strip():
 			chunks.append(chunk.strip())
-		i += chunk_size - overlap
+		start = end
 
 	return chunks
 
 
 def compute_content_hash(text):
-	"""Hash content to detect changes without re-embedding."""
+	"""Hash content to detect changes without re-embedding (stored per chunk)."""
 	return hashlib.sha256(cstr(text).encode()).hexdigest()[:32]
 
 
@@ -91,81 +123,387 @@ def index_document(doctype, name):
 	"""Index a single document — extract text, chunk, embed, store."""
 	frappe.only_for(["System Manager", "Administrator"])
 
-	text = extract_document_text(doctype, name)
-	if not text or len(text) < 20:
-		return {"status": "skipped", "reason": "No meaningful text content"}
-
-	content_hash = compute_content_hash(text)
-
-	# Check if already indexed with same content
-	existing = frappe.db.get_value(
-		"AI Document Index",
-		{"reference_doctype": doctype, "reference_name": name},
-		["name", "content_hash"],
-		as_dict=True,
-	)
-	if existing and existing.content_hash == content_hash:
-		return {"status": "skipped", "reason": "Content unchanged"}
-
-	# Chunk the text
-	chunks = chunk_text(text)
-	if not chunks:
-		return {"status": "skipped", "reason": "No chunks created"}
-
-	# Get embeddings
-	settings = frappe.get_cached_doc("AI Settings")
-	provider = LLMProvider(settings)
-
-	try:
-		embeddings = provider.get_embeddings(chunks)
-	except Exception as e:
-		frappe.log_error(f"Embedding failed for {doctype}/{name}: {e}", "RAG Indexer")
-		return {"status": "error", "reason": str(e)}
-
-	# Delete old index entries for this doc
-	if existing:
-		frappe.db.delete("AI Document Index", {"reference_doctype": doctype, "reference_name": name})
-
-	# Store chunks with embeddings
-	for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-		doc = frappe.new_doc("AI Document Index")
-		doc.reference_doctype = doctype
-		doc.reference_name = name
-		doc.chunk_index = i
-		doc.chunk_text = chunk
-		doc.content_hash = content_hash
-		doc.embedding = json.dumps(embedding)
-		doc.flags.ignore_permissions = True
-		doc.insert()
-
-	frappe.db.commit()
-	return {"status": "indexed", "chunks": len(chunks)}
+	return _index_documents(doctype, [name])[name]
 
 
 @frappe.whitelist()
-def index_doctype(doctype, limit=100):
+def index_doctype(doctype, limit=100, publish_progress=False):
 	"""Index all documents of a given doctype."""
 	frappe.only_for(["System Manager", "Administrator"])
 
-	docs = frappe.get_all(doctype, limit=limit, pluck="name")
-	results = {"indexed": 0, "skipped": 0, "errors": 0}
+	docs = frappe.get_all(doctype, limit=int(limit), pluck="name")
+	return index_documents(doctype, docs, publish_progress=cint(publish_progress))
 
-	for name in docs:
-		try:
-			result = index_document(doctype, name)
-			if result["status"] == "indexed":
-				results["indexed"] += 1
-			elif result["status"] == "skipped":
-				results["skipped"] += 1
+
+def index_documents(doctype, names, publish_progress=False):
+	"""Index many documents of one doctype through the batched embedding pipeline.
+
+	Documents are processed in windows of PIPELINE_WINDOW. Within a window,
+	chunks from all changed documents are packed into embedding requests (up to
+	embedding_batch_size inputs / EMBEDDING_BATCH_TOKENS tokens), at most
+	embedding_concurrency requests run at once, and finished documents are
+	written with bulk inserts.
+
+	Returns:
+		dict: {"indexed": N, "skipped": N, "errors": N, "failed": [names that errored]}
+	"""
+	results = {"indexed": 0, "skipped": 0, "errors": 0, "failed": []}
+	total = len(names)
+
+	for start in range(0, total, PIPELINE_WINDOW):
+		window = names[start:start + PIPELINE_WINDOW]
+		for name, result in _index_documents(doctype, window).items():
+			if result["status"] in ("indexed", "skipped"):
+				results[result["status"]] += 1
 			else:
 				results["errors"] += 1
+				results["failed"].append(name)
+
+		if publish_progress:
+			frappe.publish_realtime(
+				"oly_ai_index_progress",
+				{
+					"doctype": doctype,
+					"processed": start + len(window),
+					"total": total,
+					"indexed": results["indexed"],
+					"skipped": results["skipped"],
+					"errors": results["errors"],
+				},
+				user=frappe.session.user,
+			)
+
+	return results
+
+
+def _index_documents(doctype, names):
+	"""Extract, embed and store one window of documents.
+
+	Returns:
+		dict: {name: {"status": "indexed"|"skipped"|"error", ...}}
+	"""
+	results = {}
+	existing = _get_existing_chunks(doctype, names)
+
+	jobs = []
+	for name in names:
+		try:
+			job, skipped = _prepare_document(doctype, name, existing.get(name, []))
 		except Exception as e:
 			frappe.log_error(f"Index error: {doctype}/{name}: {e}", "RAG Indexer")
-			results["errors"] += 1
+			results[name] = {"status": "error", "reason": str(e)}
+			continue
+		if skipped:
+			results[name] = skipped
+		else:
+			jobs.append(job)
+
+	if not jobs:
+		return results
+
+	if any(job.embed_indexes for job in jobs):
+		settings = frappe.get_cached_doc("AI Settings")
+		_embed_jobs(LLMProvider(settings), jobs, settings)
+
+	ready = []
+	for job in jobs:
+		if job.error:
+			frappe.log_error(f"Embedding failed for {doctype}/{job.name}: {job.error}", "RAG Indexer")
+			results[job.name] = {"status": "error", "reason": job.error}
+		else:
+			ready.append(job)
+			results[job.name] = {
+				"status": "indexed",
+				"chunks": len(job.chunks),
+				"embedded": len(job.embed_indexes),
+			}
+
+	if ready:
+		_store_documents(doctype, ready, get_storage_format())
+		frappe.db.commit()
+		for job in ready:
+			mark_document_changed(doctype, job.name)
 
 	return results
 
 
+def _get_existing_chunks(doctype, names):
+	"""Return {name: [{name, chunk_index, content_hash}, ...]} for already indexed documents."""
+	if not names:
+		return {}
+	rows = frappe.db.sql(
+		"""SELECT name, reference_name, chunk_index, content_hash
+		FROM `tabAI Document Index`
+		WHERE reference_doctype = %s AND reference_name IN %s
+		ORDER BY chunk_index""",
+		(doctype, tuple(names)),
+		as_dict=True,
+	)
+	existing = {}
+	for row in rows:
+		existing.setdefault(row.reference_name, []).append(row)
+	return existing
+
+
+def _prepare_document(doctype, name, existing_rows=()):
+	"""Extract and chunk a document, then diff its chunk hashes against the index.
+
+	Chunks whose hash already has a row keep that row (re-numbered if they moved);
+	only new or changed chunks are embedded, and rows left over are dropped.
+
+	Returns:
+		tuple: (job, None) when the index needs changes, else (None, skip result)
+	"""
+	text = extract_document_text(doctype, name)
+	if not text or len(text) < 20:
+		return None, {"status": "skipped", "reason": "No meaningful text content"}
+
+	chunks = chunk_text(text)
+	if not chunks:
+		return None, {"status": "skipped", "reason": "No chunks created"}
+
+	# Rows written before per-chunk hashing carry the whole-text hash — leave them
+	# alone until the text changes (they are then replaced like any stale chunk)
+	text_hash = compute_content_hash(text)
+	if existing_rows and all(row.content_hash == text_hash for row in existing_rows):
+		return None, {"status": "skipped", "reason": "Content unchanged"}
+
+	hashes = [compute_content_hash(chunk) for chunk in chunks]
+
+	available = {}
+	for row in existing_rows:
+		available.setdefault(row.content_hash, []).append(row)
+
+	keep = {}
+	embed_indexes = []
+	for i, chunk_hash in enumerate(hashes):
+		rows = available.get(chunk_hash)
+		if rows:
+			keep[i] = rows.pop(0)
+		else:
+			embed_indexes.append(i)
+
+	drop = [row.name for rows in available.values() for row in rows]
+	# Kept rows already carry the chunk's hash — only their position can be stale
+	moved = [i for i, row in keep.items() if row.chunk_index != i]
+
+	if not embed_indexes and not drop and not moved:
+		return None, {"status": "skipped", "reason": "Content unchanged"}
+
+	return frappe._dict(
+		name=name,
+		chunks=chunks,
+		hashes=hashes,
+		keep=keep,
+		moved=moved,
+		drop=drop,
+		embed_indexes=embed_indexes,
+		embeddings={},
+		error=None,
+	), None
+
+
+def _make_batches(jobs, max_inputs):
+	"""Pack (job, chunk_index) pairs from all jobs into embedding requests."""
+	batches = []
+	batch = []
+	batch_tokens = 0
+	for job in jobs:
+		for i in job.embed_indexes:
+			tokens = _estimate_tokens(job.chunks[i])
+			if batch and (len(batch) >= max_inputs or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+				batches.append(batch)
+				batch = []
+				batch_tokens = 0
+			batch.append((job, i))
+			batch_tokens += tokens
+	if batch:
+		batches.append(batch)
+	return batches
+
+
+def _estimate_tokens(text):
+	"""Rough token count (~4 characters per token) for request packing."""
+	return len(text) // 4 + 1
+
+
+def _embed_jobs(provider, jobs, settings):
+	"""Fill job.embeddings in place; a failed request sets job.error on its documents."""
+	batches = _make_batches(jobs, cint(settings.get("embedding_batch_size")) or 64)
+	if not batches:
+		return
+	concurrency = cint(settings.get("embedding_concurrency")) or 4
+
+	with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+		# Each request runs in its own copy of the request context so frappe.throw
+		# inside the provider can still reach frappe.local
+		futures = {
+			pool.submit(
+				contextvars.copy_context().run,
+				provider.get_embeddings,
+				[job.chunks[i] for job, i in batch],
+			): batch
+			for batch in batches
+		}
+		for future in as_completed(futures):
+			batch = futures[future]
+			try:
+				vectors = future.result()
+				if len(vectors) != len(batch):
+					raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+			except Exception as e:
+				for job, _i in batch:
+					job.error = job.error or str(e)
+				continue
+			for (job, i), vector in zip(batch, vectors):
+				job.embeddings[i] = vector
+
+
+def _store_documents(doctype, jobs, storage_format):
+	"""Apply chunk diffs: drop stale rows, re-number moved ones, bulk-insert new ones."""
+	drop = [row_name for job in jobs for row_name in job.drop]
+	if drop:
+		frappe.db.delete("AI Document Index", {"name": ["in", drop]})
+		bm25.delete_chunk_postings(drop)
+
+	for job in jobs:
+		for i in job.moved:
+			frappe.db.sql(
+				"UPDATE `tabAI Document Index` SET chunk_index = %s, content_hash = %s WHERE name = %s",
+				(i, job.hashes[i], job.keep[i].name),
+			)
+
+	now = now_datetime()
+	user = frappe.session.user
+	rows = []
+	postings = []
+	for job in jobs:
+		for i in job.embed_indexes:
+			chunk_name = frappe.generate_hash(length=10)
+			counts = bm25.term_counts(job.chunks[i])
+			rows.append((
+				chunk_name, now, now, user, user,
+				doctype, job.name, i, sum(counts.values()), job.hashes[i], job.chunks[i],
+				# Packed binary, see core/rag/codec.py
+				encode_embedding(job.embeddings[i], storage_format),
+			))
+			postings.extend(bm25.build_postings(chunk_name, doctype, job.name, counts))
+
+	if rows:
+		frappe.db.bulk_insert("AI Document Index", fields=INDEX_FIELDS, values=rows)
+	bm25.write_postings(postings)
+
+
+def migrate_legacy_embeddings(batch_size=500):
+	"""Background job: re-encode JSON embedding rows into the packed binary format.
+
+	Works through the table in name order, committing after each batch so large
+	indexes migrate without holding a long transaction. Rows that cannot be
+	decoded are skipped, not retried. Safe to re-run.
+	"""
+	batch_size = int(batch_size)
+	storage_format = get_storage_format()
+	migrated = 0
+	last_name = ""
+
+	while True:
+		rows = frappe.db.sql(
+			"""SELECT name, embedding FROM `tabAI Document Index`
+			WHERE embedding LIKE '[%%' AND name > %s
+			ORDER BY name
+			LIMIT %s""",
+			(last_name, batch_size),
+			as_dict=True,
+		)
+		if not rows:
+			break
+		last_name = rows[-1].name
+
+		for row in rows:
+			vector = decode_embedding(row.embedding)
+			if vector is None:
+				continue
+			frappe.db.sql(
+				"UPDATE `tabAI Document Index` SET embedding = %s WHERE name = %s",
+				(encode_embedding(vector, storage_format), row.name),
+			)
+			migrated += 1
+
+		frappe.db.commit()
+
+	frappe.logger("oly_ai").info(f"Embedding migration: {migrated} rows re-encoded")
+	return {"migrated": migrated}
+
+
+def enqueue_embedding_migration():
+	"""Queue the legacy-embedding migration job (deduplicated)."""
+	frappe.enqueue(
+		"oly_ai.core.rag.indexer.migrate_legacy_embeddings",
+		queue="long",
+		timeout=3600,
+		deduplicate=True,
+		job_id="oly_ai_migrate_embeddings",
+	)
+
+
+def backfill_term_index(batch_size=500):
+	"""Background job: build BM25 postings for chunks indexed before the term index existed.
+
+	Picks up rows whose token_count is still 0, writes their AI Index Term
+	postings and stores the token count. Commits per batch; safe to re-run.
+	"""
+	batch_size = int(batch_size)
+	backfilled = 0
+	last_name = ""
+
+	while True:
+		rows = frappe.db.sql(
+			"""SELECT name, reference_doctype, reference_name, chunk_text
+			FROM `tabAI Document Index`
+			WHERE IFNULL(token_count, 0) = 0 AND name > %s
+			ORDER BY name
+			LIMIT %s""",
+			(last_name, batch_size),
+			as_dict=True,
+		)
+		if not rows:
+			break
+
+		postings = []
+		for row in rows:
+			frappe.db.delete("AI Index Term", {"chunk": row.name})
+			counts = bm25.term_counts(row.chunk_text)
+			if counts:
+				frappe.db.sql(
+					"UPDATE `tabAI Document Index` SET token_count = %s WHERE name = %s",
+					(sum(counts.values()), row.name),
+				)
+				postings.extend(bm25.build_postings(
+					row.name, row.reference_doctype, row.reference_name, counts
+				))
+
+		bm25.write_postings(postings)
+		frappe.db.commit()
+		backfilled += len(rows)
+		last_name = rows[-1].name
+
+	# Corpus statistics live in the resident index — make every worker reload
+	reset_vector_index()
+	frappe.logger("oly_ai").info(f"BM25 term index backfill: {backfilled} chunks processed")
+	return {"backfilled": backfilled}
+
+
+def enqueue_term_index_backfill():
+	"""Queue the BM25 postings backfill job (deduplicated)."""
+	frappe.enqueue(
+		"oly_ai.core.rag.indexer.backfill_term_index",
+		queue="long",
+		timeout=3600,
+		deduplicate=True,
+		job_id="oly_ai_backfill_term_index",
+	)
+
+
 @frappe.whitelist()
 def get_index_stats():
 	"""Get statistics about the RAG index."""
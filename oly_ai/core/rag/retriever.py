@@ -1,19 +1,47 @@
 # Copyright (c) 2026, OLY Technologies and contributors
 # RAG Retriever — Finds the most relevant document chunks for a query.
 # Uses hybrid BM25 + numpy-accelerated cosine similarity on embeddings stored in MariaDB.
-# Supports keyword pre-filtering to reduce the search space for large indexes.
+# BM25 reads term statistics from the persistent inverted index (see bm25.py).
+# When no query embedding is available, a MariaDB FULLTEXT search ranks chunks instead.
 
-import json
 import re
 
 import frappe
 from frappe import _
+from frappe.utils import cint
 
+from oly_ai.core.cache import get_query_embedding
 from oly_ai.core.provider import LLMProvider
+from oly_ai.core.rag import ann, bm25
+from oly_ai.core.rag.vector_index import get_vector_index
+
+# Hybrid weights: 60% semantic (cosine), 40% keyword (BM25)
+SEMANTIC_WEIGHT = 0.6
+KEYWORD_WEIGHT = 0.4
+
+# Max chunks scored with BM25 per query (highest cosine first)
+MAX_TEXT_POOL = 2000
+
+STOP_WORDS = frozenset({
+	"the", "a", "an", "is", "are", "was", "were", "be", "been", "being",
+	"have", "has", "had", "do", "does", "did", "will", "would", "could",
+	"should", "may", "might", "can", "shall", "to", "of", "in", "for",
+	"on", "with", "at", "by", "from", "as", "into", "through", "during",
+	"before", "after", "above", "below", "between", "under", "again",
+	"further", "then", "once", "here", "there", "when", "where", "why",
+	"how", "all", "both", "each", "few", "more", "most", "other", "some",
+	"such", "no", "nor", "not", "only", "own", "same", "so", "than",
+	"too", "very", "just", "about", "what", "which", "who", "whom",
+	"this", "that", "these", "those", "it", "its", "and", "but", "or",
+	"me", "my", "we", "our", "you", "your", "he", "she", "they", "them",
+	"his", "her", "i", "am",
+})
+
+# Strips boolean-mode operators (+ - < > ~ * " @ ...) from full-text keywords
+_NON_WORD_RE = re.compile(r"[^\w]+")
 
 # Cache for lazy imports
 _np = None
-_bm25_class = None
 
 
 def _get_numpy():
@@ -25,41 +53,14 @@ def _get_numpy():
 	return _np
 
 
-def _get_bm25():
-	"""Lazy-load rank_bm25 for BM25 scoring."""
-	global _bm25_class
-	if _bm25_class is None:
-		try:
-			from rank_bm25 import BM25Okapi
-			_bm25_class = BM25Okapi
-		except ImportError:
-			_bm25_class = False  # Sentinel: not available
-	return _bm25_class if _bm25_class is not False else None
-
-
 def _extract_keywords(query, min_length=3, max_keywords=8):
-	"""Extract meaningful keywords from a query for pre-filtering.
+	"""Extract meaningful keywords from a query for full-text search.
 
 	Strips common stop words and returns the most distinctive terms.
 	"""
-	stop_words = {
-		"the", "a", "an", "is", "are", "was", "were", "be", "been", "being",
-		"have", "has", "had", "do", "does", "did", "will", "would", "could",
-		"should", "may", "might", "can", "shall", "to", "of", "in", "for",
-		"on", "with", "at", "by", "from", "as", "into", "through", "during",
-		"before", "after", "above", "below", "between", "under", "again",
-		"further", "then", "once", "here", "there", "when", "where", "why",
-		"how", "all", "both", "each", "few", "more", "most", "other", "some",
-		"such", "no", "nor", "not", "only", "own", "same", "so", "than",
-		"too", "very", "just", "about", "what", "which", "who", "whom",
-		"this", "that", "these", "those", "it", "its", "and", "but", "or",
-		"me", "my", "we", "our", "you", "your", "he", "she", "they", "them",
-		"his", "her", "i", "am",
-	}
-
 	words = query.lower().split()
 	keywords = [w.strip(".,!?;:'\"()[]{}") for w in words]
-	keywords = [w for w in keywords if len(w) >= min_length and w not in stop_words]
+	keywords = [w for w in keywords if len(w) >= min_length and w not in STOP_WORDS]
 
 	# Deduplicate while preserving order
 	seen = set()
@@ -78,7 +79,12 @@ def retrieve(query, top_k=5, min_score=0.7, doctype_filter=None):
 	Uses hybrid BM25 + numpy vectorized cosine similarity for scoring.
 	BM25 handles keyword relevance, cosine similarity handles semantic relevance.
 	Final score = 0.4 * BM25_normalized + 0.6 * cosine_similarity.
-	Applies keyword pre-filtering when the index is large (>500 chunks).
+	If the query cannot be embedded (provider error, or the index was built with
+	a different embedding model) it falls back to a FULLTEXT keyword search.
+	Cosine runs against the worker-resident vector index (see vector_index.py),
+	optionally narrowed by the IVF index (ann.py) when AI Settings selects it;
+	BM25 reads only the postings of the query terms for chunks that can still
+	pass min_score, and chunk text is fetched for the final top_k alone.
 
 	Args:
 		query: The user's question or search text
@@ -91,175 +97,182 @@ def retrieve(query, top_k=5, min_score=0.7, doctype_filter=None):
 	"""
 	np = _get_numpy()
 
-	# Get query embedding
+	# Get query embedding (cached per model + normalized text, see core/cache.py)
 	settings = frappe.get_cached_doc("AI Settings")
 	provider = LLMProvider(settings)
 
 	try:
-		query_embedding = provider.get_embeddings(query)[0]
+		query_embedding = get_query_embedding(provider, query)
 	except Exception as e:
 		frappe.log_error(f"RAG query embedding failed: {e}", "RAG Retriever")
-		return []
+		return _fulltext_search(query, top_k, min_score, doctype_filter)
 
 	query_vec = np.array(query_embedding, dtype=np.float32)
+	query_norm = np.linalg.norm(query_vec)
+	if query_norm == 0:
+		return []
 
-	# Determine total count for filtering strategy
-	count_filters = {}
-	if doctype_filter:
-		count_filters["reference_doctype"] = doctype_filter
-
-	total_chunks = frappe.db.count("AI Document Index", filters=count_filters)
-	if total_chunks == 0:
+	index = get_vector_index()
+	if not len(index):
 		return []
+	if index.dim != query_vec.shape[0]:
+		return _fulltext_search(query, top_k, min_score, doctype_filter)
 
-	# Keyword pre-filtering for large indexes (>500 chunks)
-	use_keyword_filter = total_chunks > 500
-	keyword_filtered_names = None
-
-	if use_keyword_filter:
-		keywords = _extract_keywords(query)
-		if keywords:
-			# Build SQL LIKE conditions — match any keyword in chunk_text
-			conditions = []
-			values = {}
-			for i, kw in enumerate(keywords):
-				conditions.append(f"`chunk_text` LIKE %(kw_{i})s")
-				values[f"kw_{i}"] = f"%{kw}%"
-
-			where_clause = " OR ".join(conditions)
-			if doctype_filter:
-				where_clause = f"(`reference_doctype` = %(dt)s) AND ({where_clause})"
-				values["dt"] = doctype_filter
-
-			try:
-				keyword_filtered_names = frappe.db.sql(
-					f"""SELECT name FROM `tabAI Document Index`
-					WHERE {where_clause}
-					LIMIT 2000""",
-					values,
-					as_list=True,
-				)
-				keyword_filtered_names = [r[0] for r in keyword_filtered_names]
-			except Exception:
-				keyword_filtered_names = None  # Fall back to full scan
-
-	# Load embeddings — either filtered subset or all
-	db_filters = {}
+	# Candidate rows — whole index or one doctype
 	if doctype_filter:
-		db_filters["reference_doctype"] = doctype_filter
-
-	if keyword_filtered_names is not None and len(keyword_filtered_names) > 0:
-		db_filters["name"] = ("in", keyword_filtered_names)
-		limit = len(keyword_filtered_names)
+		candidates = index.rows_for_doctype(doctype_filter)
 	else:
-		limit = 10000
+		candidates = np.arange(len(index))
 
-	chunks = frappe.get_all(
-		"AI Document Index",
-		filters=db_filters,
-		fields=["name", "reference_doctype", "reference_name", "chunk_text", "embedding"],
-		limit=limit,
-	)
-
-	if not chunks:
+	if not len(candidates):
 		return []
 
-	# Parse embeddings and build matrix for vectorized similarity
-	valid_chunks = []
-	embedding_list = []
-
-	for chunk in chunks:
-		try:
-			emb = json.loads(chunk.embedding)
-			embedding_list.append(emb)
-			valid_chunks.append(chunk)
-		except (json.JSONDecodeError, TypeError):
-			continue
+	query_unit = query_vec / query_norm
 
-	if not valid_chunks:
-		return []
+	# Approximate mode: only scan rows in the IVF lists closest to the query
+	if ann.is_enabled(settings):
+		candidates = ann.probe_candidates(
+			index, query_unit, candidates, nprobe=cint(settings.get("ann_nprobe")) or 8
+		)
+		if not len(candidates):
+			return []
 
-	# ── Cosine similarity (semantic) ──
-	embedding_matrix = np.array(embedding_list, dtype=np.float32)
-	query_norm = np.linalg.norm(query_vec)
-	if query_norm == 0:
-		return []
+	# ── Cosine similarity (semantic) — rows are pre-normalized ──
+	cosine_scores = index.matrix[candidates] @ query_unit
 
-	chunk_norms = np.linalg.norm(embedding_matrix, axis=1)
-	nonzero_mask = chunk_norms > 0
-	if not np.any(nonzero_mask):
+	# A chunk can only reach min_score if its cosine clears the bar assuming a
+	# perfect BM25 score, so everything below that is never scored further.
+	cosine_floor = (min_score - KEYWORD_WEIGHT) / SEMANTIC_WEIGHT
+	pool = np.nonzero(cosine_scores >= cosine_floor)[0]
+	if not len(pool):
 		return []
+	if len(pool) > MAX_TEXT_POOL:
+		pool = pool[np.argsort(cosine_scores[pool])[::-1][:MAX_TEXT_POOL]]
 
-	cosine_scores = np.zeros(len(valid_chunks), dtype=np.float32)
-	dots = embedding_matrix[nonzero_mask] @ query_vec
-	cosine_scores[nonzero_mask] = dots / (chunk_norms[nonzero_mask] * query_norm)
+	cosine_scores = cosine_scores[pool]
+	pool_rows = candidates[pool]
+	pool_names = [index.names[i] for i in pool_rows]
 
-	# ── BM25 scoring (keyword) ──
-	BM25Class = _get_bm25()
-	bm25_scores = np.zeros(len(valid_chunks), dtype=np.float32)
+	# ── BM25 scoring (keyword) — postings for the query terms only ──
+	bm25_scores = np.zeros(len(pool_names), dtype=np.float32)
+	query_terms = list(dict.fromkeys(t for t in _tokenize(query) if t not in STOP_WORDS))
 
-	if BM25Class is not None:
+	if query_terms and index.bm25_docs:
 		try:
-			# Tokenize chunks for BM25
-			tokenized_corpus = [_tokenize(c.chunk_text) for c in valid_chunks]
-			query_tokens = _tokenize(query)
-
-			if tokenized_corpus and query_tokens:
-				bm25 = BM25Class(tokenized_corpus)
-				raw_bm25 = np.array(bm25.get_scores(query_tokens), dtype=np.float32)
-				# Normalize BM25 scores to 0-1 range
-				bm25_max = raw_bm25.max()
-				if bm25_max > 0:
-					bm25_scores = raw_bm25 / bm25_max
+			doc_freqs = bm25.get_document_frequencies(query_terms)
+			term_freqs = bm25.get_term_frequencies(list(doc_freqs), pool_names)
+			raw_bm25 = np.array(bm25.bm25_scores(
+				query_terms, pool_names, index.token_counts[pool_rows],
+				index.bm25_docs, index.bm25_avg_length, doc_freqs, term_freqs,
+			), dtype=np.float32)
+			# Normalize BM25 scores to 0-1 range
+			bm25_max = raw_bm25.max()
+			if bm25_max > 0:
+				bm25_scores = raw_bm25 / bm25_max
 		except Exception as e:
 			frappe.logger("oly_ai").debug(f"BM25 scoring failed, using cosine only: {e}")
 
 	# ── Hybrid scoring ──
-	# Weight: 60% semantic (cosine), 40% keyword (BM25)
-	SEMANTIC_WEIGHT = 0.6
-	KEYWORD_WEIGHT = 0.4
-
 	if np.any(bm25_scores > 0):
 		hybrid_scores = SEMANTIC_WEIGHT * cosine_scores + KEYWORD_WEIGHT * bm25_scores
 	else:
-		hybrid_scores = cosine_scores  # Fallback to pure cosine if BM25 failed
+		hybrid_scores = cosine_scores  # Fallback to pure cosine if BM25 found nothing
 
 	# Filter by min_score and get top_k
-	score_mask = hybrid_scores >= min_score
-	if not np.any(score_mask):
+	passing = np.nonzero(hybrid_scores >= min_score)[0]
+	if not len(passing):
 		return []
 
-	passing_indices = np.where(score_mask)[0]
-	passing_scores = hybrid_scores[score_mask]
+	top = passing[np.argsort(hybrid_scores[passing])[::-1][:top_k]]
 
-	# Sort by score descending, take top_k
-	if len(passing_scores) > top_k:
-		top_indices = np.argsort(passing_scores)[::-1][:top_k]
-	else:
-		top_indices = np.argsort(passing_scores)[::-1]
+	# Load chunk text only for the winners (rows deleted since sync drop out)
+	top_names = [pool_names[i] for i in top]
+	text_rows = frappe.get_all(
+		"AI Document Index",
+		filters={"name": ["in", top_names]},
+		fields=["name", "reference_doctype", "reference_name", "chunk_text"],
+		limit_page_length=0,
+	)
+	rows_by_name = {r.name: r for r in text_rows}
 
 	# Build results
 	scored = []
-	for idx in top_indices:
-		chunk_idx = passing_indices[idx]
-		chunk = valid_chunks[chunk_idx]
+	for idx, name in zip(top, top_names):
+		chunk = rows_by_name.get(name)
+		if not chunk:
+			continue
 		scored.append({
 			"chunk_text": chunk.chunk_text,
 			"reference_doctype": chunk.reference_doctype,
 			"reference_name": chunk.reference_name,
-			"score": round(float(passing_scores[idx]), 4),
+			"score": round(float(hybrid_scores[idx]), 4),
 		})
 
 	return scored
 
 
-def _tokenize(text):
-	"""Simple tokenizer for BM25 scoring."""
-	if not text:
+def _fulltext_search(query, top_k=5, min_score=0.7, doctype_filter=None):
+	"""Keyword-only retrieval via the FULLTEXT index on chunk_text.
+
+	MATCH ... AGAINST in boolean mode ranks chunks containing any keyword. Its
+	relevance is only comparable within one query, so the score is the relevance
+	relative to the top row times the share of the query's keywords the chunk
+	contains: the best match of a single word from a five-word question scores at
+	most 0.2, however it ranks.
+	"""
+	if frappe.db.db_type != "mariadb":
+		return []
+
+	keywords = [kw for kw in (_NON_WORD_RE.sub("", kw) for kw in _extract_keywords(query)) if kw]
+	against = " ".join(keywords)
+	if not against:
+		return []
+
+	conditions = "MATCH(chunk_text) AGAINST (%(against)s IN BOOLEAN MODE)"
+	values = {"against": against, "limit": int(top_k)}
+	if doctype_filter:
+		conditions += " AND reference_doctype = %(doctype)s"
+		values["doctype"] = doctype_filter
+
+	try:
+		rows = frappe.db.sql(
+			f"""SELECT chunk_text, reference_doctype, reference_name,
+				MATCH(chunk_text) AGAINST (%(against)s IN BOOLEAN MODE) AS relevance
+			FROM `tabAI Document Index`
+			WHERE {conditions}
+			ORDER BY relevance DESC
+			LIMIT %(limit)s""",
+			values,
+			as_dict=True,
+		)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"RAG full-text search failed: {e}")
 		return []
-	# Lower-case, split on non-alphanum, filter short tokens
-	tokens = re.findall(r"[a-z0-9]+", text.lower())
-	return [t for t in tokens if len(t) >= 2]
+
+	if not rows or not rows[0].relevance:
+		return []
+
+	top_relevance = float(rows[0].relevance)
+	scored = []
+	for row in rows:
+		tokens = set(_NON_WORD_RE.split((row.chunk_text or "").lower()))
+		coverage = sum(1 for kw in keywords if kw in tokens) / len(keywords)
+		score = float(row.relevance) / top_relevance * coverage
+		if score < min_score:
+			continue
+		scored.append({
+			"chunk_text": row.chunk_text,
+			"reference_doctype": row.reference_doctype,
+			"reference_name": row.reference_name,
+			"score": round(score, 4),
+		})
+
+	return scored
+
+
+def _tokenize(text):
+	"""Simple tokenizer for BM25 scoring (shared with the indexer)."""
+	return bm25.tokenize(text)
 
 
 def build_rag_context(query, top_k=5, min_score=0.7):
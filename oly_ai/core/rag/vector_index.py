@@ -0,0 +1,268 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Resident Vector Index — per-worker in-memory matrix of normalized embeddings.
+#
+# Each gunicorn / RQ worker keeps one VectorIndex per site. It is loaded once and
+# then kept in sync through a Redis generation counter: every index write bumps the
+# counter and records the (doctype, name) it touched in a change log, so workers
+# only reload the documents that changed since their last sync.
+
+import threading
+
+import frappe
+
+from oly_ai.core.rag.codec import decode_embedding
+
+# Redis keys (site-scoped via frappe.cache().make_key)
+GENERATION_KEY = "oly_ai:rag:generation"
+CHANGE_LOG_KEY = "oly_ai:rag:changes"
+FLOOR_KEY = "oly_ai:rag:floor"
+
+# Change-log entries older than this many generations are trimmed; workers that
+# fall further behind do a full reload instead of an incremental one.
+MAX_CHANGE_LOG = 5000
+# Rows fetched per query when (re)loading the whole table
+LOAD_BATCH_SIZE = 5000
+# Above this many changed documents a full reload is cheaper than patching
+MAX_INCREMENTAL_DOCS = 1000
+
+_KEY_SEP = "\x1f"
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class VectorIndex:
+	"""Unit-normalized embedding matrix plus row metadata for one site.
+
+	Also carries per-chunk token counts so BM25 corpus statistics (N, avgdl)
+	never need a table scan. An index is never modified once built: a sync builds
+	a new one and swaps it in, so threads still searching the old one see its
+	matrix and metadata together.
+	"""
+
+	def __init__(self, matrix=None, meta=(), generation=0):
+		np = _get_numpy()
+		self.generation = generation
+		self.matrix = matrix
+		self.dim = matrix.shape[1] if matrix is not None else None
+		self.names = [m[0] for m in meta]
+		self.doctypes = np.array([m[1] for m in meta], dtype=object)
+		self.ref_names = [m[2] for m in meta]
+		self.token_counts = np.array([m[3] for m in meta], dtype=np.int32)
+		self._positions = {name: i for i, name in enumerate(self.names)}
+
+		# BM25 corpus statistics over chunks that have postings
+		with_terms = self.token_counts[self.token_counts > 0]
+		self.bm25_docs = len(with_terms)
+		self.bm25_avg_length = float(with_terms.mean()) if len(with_terms) else 0.0
+
+	def __len__(self):
+		return len(self.names)
+
+	@classmethod
+	def load(cls, generation=0):
+		"""Build an index of the whole AI Document Index table."""
+		rows = []
+		last_name = ""
+		while True:
+			batch = frappe.db.sql(
+				"""SELECT name, reference_doctype, reference_name, token_count, embedding
+				FROM `tabAI Document Index`
+				WHERE name > %s
+				ORDER BY name
+				LIMIT %s""",
+				(last_name, LOAD_BATCH_SIZE),
+				as_dict=True,
+			)
+			if not batch:
+				break
+			rows.extend(batch)
+			last_name = batch[-1].name
+			if len(batch) < LOAD_BATCH_SIZE:
+				break
+
+		return cls(*_decode_rows(rows), generation=generation)
+
+	def with_documents(self, keys, generation):
+		"""Return a new index with the rows of the given (doctype, name) documents re-read."""
+		np = _get_numpy()
+		keys = set(keys)
+		keep = [
+			i for i, key in enumerate(zip(self.doctypes, self.ref_names))
+			if key not in keys
+		]
+		vectors = [self.matrix[keep]] if self.matrix is not None and keep else []
+		meta = [
+			(self.names[i], self.doctypes[i], self.ref_names[i], int(self.token_counts[i]))
+			for i in keep
+		]
+
+		by_doctype = {}
+		for doctype, name in keys:
+			by_doctype.setdefault(doctype, []).append(name)
+
+		fresh = []
+		for doctype, names in by_doctype.items():
+			fresh.extend(frappe.get_all(
+				"AI Document Index",
+				filters={"reference_doctype": doctype, "reference_name": ["in", names]},
+				fields=["name", "reference_doctype", "reference_name", "token_count", "embedding"],
+				limit_page_length=0,
+			))
+
+		new_vectors, new_meta = _decode_rows(fresh, self.dim)
+		if new_meta:
+			vectors.append(new_vectors)
+			meta.extend(new_meta)
+
+		matrix = np.vstack(vectors) if vectors else None
+		return VectorIndex(matrix, meta, generation)
+
+	def rows_for_doctype(self, doctype):
+		"""Return row positions belonging to a doctype."""
+		np = _get_numpy()
+		if not len(self):
+			return np.array([], dtype=np.int64)
+		return np.nonzero(self.doctypes == doctype)[0]
+
+	def positions_for(self, names):
+		"""Map AI Document Index names to row positions (unknown names are skipped)."""
+		np = _get_numpy()
+		return np.array(
+			[self._positions[n] for n in names if n in self._positions],
+			dtype=np.int64,
+		)
+
+
+def get_vector_index():
+	"""Return this worker's index for the current site, synced with Redis.
+
+	Callers keep using the returned index for the whole search; a later sync
+	replaces it rather than changing it.
+	"""
+	site = getattr(frappe.local, "site", None) or ""
+
+	with _lock:
+		index = _indexes.get(site)
+		remote_gen, floor = _get_generation_and_floor()
+
+		if index is None or index.generation < floor:
+			index = VectorIndex.load(remote_gen)
+		elif index.generation < remote_gen:
+			changed = _get_changes_since(index.generation, remote_gen)
+			if len(changed) > MAX_INCREMENTAL_DOCS:
+				index = VectorIndex.load(remote_gen)
+			else:
+				index = index.with_documents(changed, remote_gen)
+		_indexes[site] = index
+
+		return index
+
+
+# Bump the generation and log the document in one step, so no worker can see the
+# new generation before its change-log entry
+_MARK_CHANGED = """
+local gen = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], gen, ARGV[1])
+local keep = tonumber(ARGV[2])
+if gen % 100 == 0 and gen > keep then
+	local floor = gen - keep
+	redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', floor)
+	redis.call('SET', KEYS[3], floor)
+end
+return gen
+"""
+
+_RESET = """
+local gen = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[3], gen)
+redis.call('DEL', KEYS[2])
+return gen
+"""
+
+
+def mark_document_changed(doctype, name):
+	"""Record that a document's chunks changed so every worker reloads them.
+
+	The change log is trimmed every 100 generations; workers behind the floor do a
+	full reload.
+	"""
+	try:
+		cache = frappe.cache()
+		cache.eval(_MARK_CHANGED, 3, *_keys(cache), f"{doctype}{_KEY_SEP}{name}", MAX_CHANGE_LOG)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Vector index invalidation failed: {e}")
+
+
+def reset_vector_index():
+	"""Force every worker to fully reload (e.g. after bulk deletes)."""
+	try:
+		cache = frappe.cache()
+		cache.eval(_RESET, 3, *_keys(cache))
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Vector index reset failed: {e}")
+
+
+def _keys(cache):
+	return (
+		cache.make_key(GENERATION_KEY),
+		cache.make_key(CHANGE_LOG_KEY),
+		cache.make_key(FLOOR_KEY),
+	)
+
+
+def _get_generation_and_floor():
+	"""Read the generation and floor in one round trip."""
+	try:
+		cache = frappe.cache()
+		gen, floor = cache.mget(cache.make_key(GENERATION_KEY), cache.make_key(FLOOR_KEY))
+		return int(gen or 0), int(floor or 0)
+	except Exception:
+		return 0, 0
+
+
+def _get_changes_since(local_gen, remote_gen):
+	"""Return the set of (doctype, name) changed in (local_gen, remote_gen]."""
+	cache = frappe.cache()
+	members = cache.zrangebyscore(cache.make_key(CHANGE_LOG_KEY), local_gen + 1, remote_gen)
+	changed = set()
+	for member in members:
+		if isinstance(member, bytes):
+			member = member.decode()
+		doctype, _, name = member.partition(_KEY_SEP)
+		changed.add((doctype, name))
+	return changed
+
+
+def _decode_rows(rows, dim=None):
+	"""Decode + normalize embeddings, dropping unreadable or off-dimension rows.
+
+	`dim` defaults to the dimension of the first readable row.
+	"""
+	np = _get_numpy()
+	vectors = []
+	meta = []
+	for row in rows:
+		vec = decode_embedding(row.embedding)
+		if vec is None or not vec.size:
+			continue
+		if dim is None:
+			dim = vec.shape[0]
+		if vec.shape[0] != dim:
+			continue
+		vectors.append(vec)
+		meta.append((row.name, row.reference_doctype, row.reference_name, row.token_count or 0))
+
+	if not vectors:
+		return None, []
+
+	matrix = np.vstack(vectors).astype(np.float32, copy=False)
+	norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+	norms[norms == 0] = 1.0
+	matrix /= norms
+	return matrix, meta
+
+
+def _get_numpy():
+	from oly_ai.core.rag.retriever import _get_numpy as get_np
+	return get_np()
@@ -0,0 +1,195 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Semantic Cache — reuse answers to similar questions, not only identical prompts.
+#
+# The exact cache (core/cache.py) keys on the full messages JSON, so a reworded
+# question or a slightly different RAG context is always a miss. Here each cached
+# answer is stored with the embedding of the query that produced it; a lookup embeds
+# the new query and returns the closest entry once cosine similarity clears the
+# AI Settings threshold.
+#
+# Entries are partitioned by scope — feature, model and the caller's permission
+# context (roles, plus document, version and rendered context for document
+# features) — so an answer never reaches a user with other roles or a different
+# document, nor outlives a new Communication or Comment on it. Each scope keeps at
+# most SEMANTIC_CACHE_MAX_ENTRIES; the least recently hit entry is evicted first.
+
+import hashlib
+import json
+import time
+
+import frappe
+
+from oly_ai.core.cache import get_query_embedding, normalize_query, raw_redis
+
+# Redis keys (site-scoped via frappe.cache().make_key):
+#   <SCOPE_KEY><scope>:entries  hash   entry id → {"query", "response", "cached_at", "embedding"}
+#   <SCOPE_KEY><scope>:lru      zset   entry id → last hit / store time
+SCOPE_KEY = "oly_ai:semcache:"
+SEMANTIC_CACHE_MAX_ENTRIES = 200
+DEFAULT_THRESHOLD = 0.95
+
+
+def is_enabled(settings=None):
+	"""Return True if both response caching and the semantic tier are switched on."""
+	settings = settings or frappe.get_cached_doc("AI Settings")
+	return bool(settings.enable_caching and settings.get("enable_semantic_cache"))
+
+
+def get_scope(feature, model, user=None, doctype=None, name=None, context=None):
+	"""Return the cache partition for a request.
+
+	Users only share entries when they hold the same roles; document features are
+	further pinned to the document and its current version. Pass the rendered
+	document context too: it also covers Communications and Comments, which arrive
+	without changing the document's modified timestamp.
+	"""
+	user = user or frappe.session.user
+	parts = [feature or "", model or "", ",".join(sorted(frappe.get_roles(user)))]
+	if doctype and name:
+		parts += [doctype, name, str(frappe.db.get_value(doctype, name, "modified") or "")]
+	if context:
+		parts.append(hashlib.sha256(context.encode()).hexdigest())
+	return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:32]
+
+
+def lookup(query, scope, settings=None):
+	"""Find a cached answer to a query similar to `query` within `scope`.
+
+	Returns:
+		frappe._dict {"response", "similarity", "entry"} or None on a miss.
+		"entry" identifies the cache entry for evict() / false-hit reports.
+	"""
+	settings = settings or frappe.get_cached_doc("AI Settings")
+	if not is_enabled(settings) or not query:
+		return None
+
+	try:
+		cache = frappe.cache()
+		entries_key, lru_key = _keys(cache, scope)
+		raw = raw_redis(cache).hgetall(entries_key)
+		if not raw:
+			return None
+
+		np = _get_numpy()
+		from oly_ai.core.provider import LLMProvider
+		from oly_ai.core.rag.codec import decode_embedding
+
+		ttl = (settings.cache_ttl_hours or 0) * 3600
+		now = time.time()
+		entries, ids, vectors, expired = {}, [], [], []
+		for entry_id, value in raw.items():
+			entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+			entry = json.loads(value)
+			if ttl and now - entry.get("cached_at", 0) > ttl:
+				expired.append(entry_id)
+				continue
+			vec = decode_embedding(entry.get("embedding"))
+			if vec is not None and vec.size:
+				entries[entry_id] = entry
+				ids.append(entry_id)
+				vectors.append(vec)
+		if expired:
+			_delete_entries(cache, entries_key, lru_key, expired)
+		if not vectors:
+			return None
+
+		query_vec = np.asarray(get_query_embedding(LLMProvider(settings), query), dtype=np.float32)
+		if any(v.shape != query_vec.shape for v in vectors):
+			# Embedding model changed since these were stored — compare like with like only
+			keep = [i for i, v in enumerate(vectors) if v.shape == query_vec.shape]
+			ids, vectors = [ids[i] for i in keep], [vectors[i] for i in keep]
+			if not vectors:
+				return None
+
+		matrix = np.vstack(vectors)
+		norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vec) or 1.0)
+		norms[norms == 0] = 1.0
+		scores = (matrix @ query_vec) / norms
+		best = int(np.argmax(scores))
+		similarity = float(scores[best])
+
+		threshold = settings.get("semantic_cache_threshold") or DEFAULT_THRESHOLD
+		if similarity < threshold:
+			return None
+
+		cache.zadd(lru_key, {ids[best]: now})
+		return frappe._dict(
+			response=entries[ids[best]].get("response"),
+			similarity=round(similarity, 4),
+			entry=f"{scope}:{ids[best]}",
+		)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Semantic cache lookup failed: {e}")
+		return None
+
+
+def store(query, scope, response, settings=None):
+	"""Cache `response` under the embedding of `query` in `scope`, evicting LRU entries over the cap."""
+	settings = settings or frappe.get_cached_doc("AI Settings")
+	if not is_enabled(settings) or not query:
+		return
+
+	try:
+		from oly_ai.core.provider import LLMProvider
+		from oly_ai.core.rag.codec import encode_embedding
+
+		# Usually free — lookup() already embedded this query into the embedding cache
+		vector = get_query_embedding(LLMProvider(settings), query)
+
+		cache = frappe.cache()
+		entries_key, lru_key = _keys(cache, scope)
+		entry_id = hashlib.sha256(normalize_query(query).encode()).hexdigest()[:16]
+		now = time.time()
+		pipe = cache.pipeline()
+		pipe.hset(entries_key, entry_id, json.dumps({
+			"query": query[:500],
+			"response": response,
+			"cached_at": now,
+			"embedding": encode_embedding(vector, "f32"),
+		}))
+		pipe.zadd(lru_key, {entry_id: now})
+		ttl_hours = settings.cache_ttl_hours or 0
+		if ttl_hours > 0:
+			# The whole scope lapses once nothing has been stored in it for a TTL
+			pipe.expire(entries_key, ttl_hours * 3600)
+			pipe.expire(lru_key, ttl_hours * 3600)
+		pipe.zcard(lru_key)
+		overflow = pipe.execute()[-1] - SEMANTIC_CACHE_MAX_ENTRIES
+
+		if overflow > 0:
+			stale = [
+				m.decode() if isinstance(m, bytes) else m
+				for m in cache.zrange(lru_key, 0, overflow - 1)
+			]
+			_delete_entries(cache, entries_key, lru_key, stale)
+	except Exception as e:
+		frappe.logger("oly_ai").debug(f"Semantic cache store failed: {e}")
+
+
+def evict(entry):
+	"""Remove one entry, given the "entry" value returned by lookup()."""
+	scope, _sep, entry_id = (entry or "").rpartition(":")
+	if not scope or not entry_id:
+		return
+	cache = frappe.cache()
+	_delete_entries(cache, *_keys(cache, scope), [entry_id])
+
+
+def _keys(cache, scope):
+	return (
+		cache.make_key(f"{SCOPE_KEY}{scope}:entries"),
+		cache.make_key(f"{SCOPE_KEY}{scope}:lru"),
+	)
+
+
+def _delete_entries(cache, entries_key, lru_key, entry_ids):
+	if entry_ids:
+		pipe = cache.pipeline()
+		pipe.hdel(entries_key, *entry_ids)
+		pipe.zrem(lru_key, *entry_ids)
+		pipe.execute()
+
+
+def _get_numpy():
+	from oly_ai.core.rag.retriever import _get_numpy as get_np
+	return get_np()
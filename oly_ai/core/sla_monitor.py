@@ -2,6 +2,8 @@
 # SLA Monitor — Scheduled job to detect overdue/at-risk Issues and notify agents
 # Runs every 30 minutes via scheduler_events cron
 
+import asyncio
+
 import frappe
 from frappe import _
 from frappe.utils import now_datetime, time_diff_in_hours, get_url_to_form
@@ -216,8 +218,10 @@ def _send_sla_notification(issue, subject, message):
 def _generate_escalation_suggestions(overdue_items):
 	"""Generate AI escalation suggestions for high-priority overdue issues.
 
-	Creates a summary comment on each issue with recommended actions.
+	Creates a summary comment on each issue with recommended actions. The LLM calls
+	are independent, so they run concurrently on the async provider path.
 	"""
+	pending = []
 	for item in overdue_items[:5]:  # Limit to 5 at a time
 		issue = item["issue"]
 		cache_key = f"oly_ai_escalation_{issue.name}"
@@ -228,24 +232,37 @@ def _generate_escalation_suggestions(overdue_items):
 		try:
 			from oly_ai.core.context import get_document_context
 			ctx = get_document_context("Issue", issue.name, max_length=3000)
+		except Exception as e:
+			frappe.log_error(
+				f"AI escalation suggestion failed for {issue.name}: {e}",
+				"AI SLA Monitor"
+			)
+			continue
 
-			from oly_ai.core.provider import LLMProvider
-			provider = LLMProvider()
+		pending.append((item, [
+			{"role": "system", "content": (
+				"You are an AI escalation assistant. Analyze this overdue support issue "
+				"and suggest 2-3 concrete actions to resolve it quickly. Be brief and actionable."
+			)},
+			{"role": "user", "content": (
+				f"This Issue is overdue by {item['hours_overdue']:.1f} hours "
+				f"(SLA: {item['sla_type']}).\n\n{ctx}\n\n"
+				f"Suggest escalation actions."
+			)},
+		]))
+
+	if not pending:
+		return
 
-			messages = [
-				{"role": "system", "content": (
-					"You are an AI escalation assistant. Analyze this overdue support issue "
-					"and suggest 2-3 concrete actions to resolve it quickly. Be brief and actionable."
-				)},
-				{"role": "user", "content": (
-					f"This Issue is overdue by {item['hours_overdue']:.1f} hours "
-					f"(SLA: {item['sla_type']}).\n\n{ctx}\n\n"
-					f"Suggest escalation actions."
-				)},
-			]
+	from oly_ai.core.provider import LLMProvider
+	responses = asyncio.run(_achat_all(LLMProvider(), [messages for _item, messages in pending]))
 
-			response = provider.chat(messages)
-			suggestion = response.get("content", "").strip()
+	for (item, _messages), response in zip(pending, responses):
+		issue = item["issue"]
+		try:
+			if isinstance(response, BaseException):
+				raise response
+			suggestion = (response.get("content") or "").strip()
 
 			if suggestion:
 				comment = frappe.get_doc({
@@ -269,3 +286,16 @@ def _generate_escalation_suggestions(overdue_items):
 				f"AI escalation suggestion failed for {issue.name}: {e}",
 				"AI SLA Monitor"
 			)
+
+
+async def _achat_all(provider, message_lists):
+	"""Run provider.achat for each message list concurrently; failures are returned, not raised."""
+	from oly_ai.core.http_pool import close_async_clients
+
+	try:
+		return await asyncio.gather(
+			*(provider.achat(messages) for messages in message_lists),
+			return_exceptions=True,
+		)
+	finally:
+		await close_async_clients()
@@ -3,10 +3,21 @@
 # All functions respect Frappe permissions of the requesting user.
 
 import json
+from concurrent.futures import ThreadPoolExecutor
+
 import frappe
 from frappe import _
 from frappe.utils import cstr, flt, cint
 
+# Tools without side effects — safe to run concurrently within one tool round
+READ_ONLY_TOOLS = ("search_documents", "get_document", "count_documents", "get_report", "get_list_summary",
+                   "web_search", "analyze_file", "read_webpage", "run_code", "analyze_sentiment")
+WRITE_TOOLS = ("create_document", "update_document", "submit_document", "cancel_document",
+               "delete_document", "send_communication", "add_comment")
+
+# Worker threads for the read-only calls of one round (each holds its own DB connection)
+MAX_PARALLEL_TOOLS = 4
+
 
 # ─── Tool Definitions (OpenAI function calling format) ─────────
 
@@ -473,6 +484,67 @@ def execute_tool(tool_name, arguments, user=None):
 	return json.dumps({"error": f"Unknown tool: {tool_name}"})
 
 
+def execute_tools(calls, user=None, max_workers=MAX_PARALLEL_TOOLS):
+	"""Execute one round of tool calls, running independent read-only calls in parallel.
+
+	Consecutive read-only calls share a bounded thread pool; each worker thread
+	opens its own site connection as `user`. Write and custom tools run serially
+	on the caller's connection, in order, between those batches.
+
+	Args:
+		calls: list of (tool_name, arguments) tuples
+		user: The user making the request (for permission checks)
+		max_workers: thread pool bound
+
+	Returns:
+		list[str]: JSON-encoded results, in the same order as `calls`
+	"""
+	user = user or frappe.session.user
+	results = [None] * len(calls)
+
+	batch = []
+	for i, (tool_name, arguments) in enumerate(calls):
+		if tool_name in READ_ONLY_TOOLS:
+			batch.append(i)
+			continue
+		_run_read_only(calls, batch, results, user, max_workers)
+		batch = []
+		results[i] = execute_tool(tool_name, arguments, user=user)
+	_run_read_only(calls, batch, results, user, max_workers)
+
+	return results
+
+
+def _run_read_only(calls, indexes, results, user, max_workers):
+	if len(indexes) < 2 or max_workers < 2:
+		for i in indexes:
+			results[i] = execute_tool(*calls[i], user=user)
+		return
+
+	site = frappe.local.site
+	sites_path = frappe.local.sites_path
+	with ThreadPoolExecutor(max_workers=min(max_workers, len(indexes))) as executor:
+		futures = {
+			i: executor.submit(_execute_tool_in_thread, site, sites_path, user, *calls[i])
+			for i in indexes
+		}
+		for i, future in futures.items():
+			results[i] = future.result()
+
+
+def _execute_tool_in_thread(site, sites_path, user, tool_name, arguments):
+	"""Run execute_tool on a fresh thread-local site context and DB connection."""
+	try:
+		frappe.init(site=site, sites_path=sites_path)
+		frappe.connect()
+		frappe.set_user(user)
+		return execute_tool(tool_name, arguments, user=user)
+	except Exception as e:
+		return json.dumps({"error": str(e)})
+	finally:
+		frappe.destroy()
+
+
 def _tool_search_documents(args, user):
 	"""Search for documents with permission checks."""
 	doctype = args["doctype"]
@@ -1183,10 +1255,8 @@ def get_available_tools(user=None, mode="ask"):
 	settings = frappe.get_cached_doc("AI Settings")
 
 	# Read-only tools (always available in agent/execute modes if data queries enabled)
-	read_tools = ["search_documents", "get_document", "count_documents", "get_report", "get_list_summary",
-	              "web_search", "analyze_file", "read_webpage", "run_code", "analyze_sentiment"]
-	write_tools = ["create_document", "update_document", "submit_document", "cancel_document",
-	               "delete_document", "send_communication", "add_comment"]
+	read_tools = READ_ONLY_TOOLS
+	write_tools = WRITE_TOOLS
 
 	# Only agent and execute modes get tools
 	if mode not in ("agent", "execute"):
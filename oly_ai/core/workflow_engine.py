@@ -188,7 +188,11 @@ def _step_ai_query(prompt, model_override, workflow):
 
 	# Track cost
 	from oly_ai.core.cost_tracker import track_usage
-	track_usage(model, result.get("tokens_input", 0), result.get("tokens_output", 0))
+	track_usage(
+		model, result.get("tokens_input", 0), result.get("tokens_output", 0),
+		tokens_cached=result.get("tokens_cached", 0),
+		tokens_cache_write=result.get("tokens_cache_write", 0),
+	)
 
 	return result.get("content", "")
 
@@ -83,6 +83,9 @@ scheduler_events = {
         "oly_ai.core.cost_tracker.generate_weekly_usage_report",
     ],
     "cron": {
+        "* * * * *": [
+            "oly_ai.api.train.process_auto_index_queue",
+        ],
         "*/15 * * * *": [
             "oly_ai.core.workflow_engine.run_scheduled_workflows",
         ],
@@ -95,11 +98,28 @@ scheduler_events = {
 # Auto-reindex hooks — triggered on document changes
 # Uses a wildcard (*) so it fires for ALL doctypes.
 # The handler checks if the DocType is in the indexed_doctypes list.
+# The cache hooks drop AI responses / contexts built from the changed document.
 doc_events = {
     "*": {
-        "on_update": "oly_ai.api.train.auto_index_on_update",
+        "on_update": [
+            "oly_ai.api.train.auto_index_on_update",
+            "oly_ai.core.cache.invalidate_document_cache",
+            "oly_ai.core.context.invalidate_document_context",
+        ],
         "after_insert": "oly_ai.api.train.auto_index_on_insert",
-        "on_trash": "oly_ai.api.train.auto_index_on_trash",
+        "on_trash": [
+            "oly_ai.api.train.auto_index_on_trash",
+            "oly_ai.core.cache.invalidate_document_cache",
+            "oly_ai.core.context.invalidate_document_context",
+        ],
+    },
+    # Company details are compiled into the chat system prompts
+    "Company": {
+        "on_update": "oly_ai.core.prompt_registry.invalidate_prompts",
+        "on_trash": "oly_ai.core.prompt_registry.invalidate_prompts",
+    },
+    "Global Defaults": {
+        "on_update": "oly_ai.core.prompt_registry.invalidate_prompts",
     },
     "Communication": {
         "after_insert": "oly_ai.core.email_handler.on_incoming_communication",
@@ -3,6 +3,7 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import now_datetime
 
 
 class AIChatSession(Document):
@@ -16,9 +17,71 @@ class AIChatSession(Document):
 			if not self._is_shared_with(frappe.session.user):
 				frappe.throw("You can only access your own chat sessions.")
 
+	def before_save(self):
+		# A windowed doc (memory.load_session_window) holds only the recent messages;
+		# a full save would delete every row outside the window.
+		if self.flags.message_window is not None:
+			frappe.throw("This session was loaded with a message window; use save_new_messages().")
+
 	def _is_shared_with(self, user):
 		"""Check if a user has been shared this session."""
 		for row in (self.shared_with or []):
 			if row.user == user:
 				return True
 		return False
+
+	def save_new_messages(self, tokens=0, cost=0, **fields):
+		"""Persist only the unsaved message rows and add to the totals atomically.
+
+		save() rewrites and re-validates every AI Chat Message row, which long chats
+		pay for on each turn. This inserts just the rows appended since the doc was
+		loaded (numbered after the highest stored idx, read under a row lock on the
+		session), then bumps total_tokens / total_cost with `x = x + %s` so
+		concurrent turns never lose each other's counts. Extra session columns
+		(e.g. title) can be set via **fields.
+		"""
+		self.validate()
+
+		now = now_datetime()
+		user = frappe.session.user
+
+		new_rows = [row for row in self.messages if not row.name]
+		if new_rows:
+			# Lock the session row until commit so concurrent turns (two tabs, a retry)
+			# number their rows one after the other instead of reusing an idx
+			frappe.db.get_value(self.doctype, self.name, "name", for_update=True)
+			last_idx = frappe.db.sql(
+				"""SELECT COALESCE(MAX(idx), 0) FROM `tabAI Chat Message`
+				WHERE parent = %s AND parenttype = %s AND parentfield = 'messages'""",
+				(self.name, self.doctype),
+			)[0][0]
+			for i, row in enumerate(new_rows, 1):
+				row.idx = last_idx + i
+				row.creation = row.modified = now
+				row.owner = row.modified_by = user
+				row.db_insert()
+
+		for fieldname in fields:
+			if not self.meta.has_field(fieldname):
+				frappe.throw(f"AI Chat Session has no field {fieldname}")
+
+		assignments = ", ".join(
+			["total_tokens = COALESCE(total_tokens, 0) + %(tokens)s",
+			 "total_cost = COALESCE(total_cost, 0) + %(cost)s",
+			 "modified = %(modified)s",
+			 "modified_by = %(modified_by)s"]
+			+ [f"`{fieldname}` = %({fieldname})s" for fieldname in fields]
+		)
+		frappe.db.sql(
+			f"UPDATE `tabAI Chat Session` SET {assignments} WHERE name = %(name)s",
+			dict(fields, tokens=tokens or 0, cost=cost or 0, modified=now, modified_by=user, name=self.name),
+		)
+
+		# Keep the in-memory doc in step so a later save() doesn't see a conflict
+		self.total_tokens, self.total_cost = frappe.db.get_value(
+			self.doctype, self.name, ["total_tokens", "total_cost"]
+		)
+		self.update(fields)
+		self.modified = now
+		self.modified_by = user
+		self._original_modified = now
@@ -1,8 +1,20 @@
 # Copyright (c) 2026, OLY Technologies and contributors
 # For license information, please see license.txt
 
+import frappe
 from frappe.model.document import Document
 
+FULLTEXT_INDEX = "chunk_text_fulltext"
+
 
 class AIDocumentIndex(Document):
 	pass
+
+
+def on_doctype_update():
+	# MATCH ... AGAINST keyword search over chunk text (see retriever._fulltext_search)
+	if frappe.db.db_type != "mariadb":
+		return
+	if frappe.db.sql("SHOW INDEX FROM `tabAI Document Index` WHERE Key_name = %s", FULLTEXT_INDEX):
+		return
+	frappe.db.sql_ddl(f"ALTER TABLE `tabAI Document Index` ADD FULLTEXT INDEX `{FULLTEXT_INDEX}` (chunk_text)")
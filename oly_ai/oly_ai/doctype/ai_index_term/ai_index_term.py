@@ -0,0 +1,18 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class AIIndexTerm(Document):
+	"""BM25 posting: how often a term occurs in one AI Document Index chunk."""
+	pass
+
+
+def on_doctype_update():
+	# Postings are looked up by term (query time), by chunk (chunk diffs) and by
+	# source document (reindex/delete)
+	frappe.db.add_index("AI Index Term", ["term", "chunk"])
+	frappe.db.add_index("AI Index Term", ["chunk"])
+	frappe.db.add_index("AI Index Term", ["reference_doctype", "reference_name"])
@@ -10,6 +10,15 @@ class AIPromptTemplate(Document):
 		if self.temperature_override and (self.temperature_override < 0 or self.temperature_override > 2):
 			frappe.throw("Temperature must be between 0 and 2")
 
+	def on_update(self):
+		# Chat system prompts are compiled from "Default Ask AI" and cached per worker
+		from oly_ai.core.prompt_registry import invalidate_prompts
+		invalidate_prompts()
+
+	def on_trash(self):
+		from oly_ai.core.prompt_registry import invalidate_prompts
+		invalidate_prompts()
+
 	@staticmethod
 	def get_template(feature, doctype=None):
 		"""Get the best matching prompt template for a feature + doctype combo."""
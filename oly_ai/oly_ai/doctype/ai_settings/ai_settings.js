@@ -30,6 +30,13 @@ function render_training_actions(frm) {
 			'<button class="btn btn-danger btn-sm" id="btn-clear-index">' +
 				'<i class="fa fa-trash"></i> Clear All Index Data' +
 			"</button>" +
+			(frm.doc.rag_search_mode === "Approximate (IVF)" ?
+				'<button class="btn btn-default btn-sm" id="btn-rebuild-ann">' +
+					'<i class="fa fa-sitemap"></i> Rebuild IVF Index' +
+				"</button>" +
+				'<button class="btn btn-default btn-sm" id="btn-eval-ann">' +
+					'<i class="fa fa-bullseye"></i> Evaluate Recall' +
+				"</button>" : "") +
 		"</div>"
 	);
 
@@ -120,6 +127,29 @@ function render_training_actions(frm) {
 		load_index_stats(frm);
 	});
 
+	$container.find("#btn-rebuild-ann").on("click", function () {
+		frappe.xcall("oly_ai.api.train.rebuild_ann_index").then(function () {
+			frappe.show_alert({ message: __("IVF index rebuild queued"), indicator: "blue" });
+		});
+	});
+
+	$container.find("#btn-eval-ann").on("click", function () {
+		frappe.xcall("oly_ai.api.train.evaluate_ann_recall", { nprobe: frm.doc.ann_nprobe || 8 }).then(function (r) {
+			if (r.status === "unavailable") {
+				frappe.msgprint(r.reason);
+				return;
+			}
+			frappe.msgprint({
+				title: __("IVF Recall"),
+				message:
+					__("Recall@{0}: <strong>{1}%</strong> over {2} sample queries", [r.k, (r.recall_at_k * 100).toFixed(1), r.samples]) + "<br>" +
+					__("Rows scanned: {0}% of the index", [r.avg_scanned_pct]) + "<br>" +
+					__("Avg search time: {0} ms exact vs {1} ms IVF", [r.exact_ms, r.ann_ms]),
+				indicator: "blue",
+			});
+		});
+	});
+
 	$container.find("#btn-clear-index").on("click", function () {
 		frappe.confirm(
 			__("This will delete ALL indexed data. The AI will lose all trained knowledge. Continue?"),
@@ -135,6 +165,7 @@ function render_training_actions(frm) {
 
 function index_doctypes_sequential(frm, doctypes, idx) {
 	if (idx >= doctypes.length) {
+		frappe.realtime.off("oly_ai_index_progress");
 		frappe.hide_progress();
 		frappe.show_alert({ message: __("Indexing complete!"), indicator: "green" });
 		load_index_stats(frm);
@@ -145,6 +176,18 @@ function index_doctypes_sequential(frm, doctypes, idx) {
 	var dt = doctypes[idx];
 	frappe.show_progress(__("Indexing..."), idx, doctypes.length, __("Indexing {0}...", [dt]));
 
+	// Per-document progress published by the batched indexing pipeline
+	frappe.realtime.off("oly_ai_index_progress");
+	frappe.realtime.on("oly_ai_index_progress", function (data) {
+		if (data.doctype !== dt || !data.total) return;
+		frappe.show_progress(
+			__("Indexing..."),
+			idx + data.processed / data.total,
+			doctypes.length,
+			__("Indexing {0}: {1} / {2} documents", [dt, data.processed, data.total])
+		);
+	});
+
 	frappe.xcall("oly_ai.api.train.index_doctype_full", { doctype: dt })
 		.then(function (r) {
 			frappe.show_alert({
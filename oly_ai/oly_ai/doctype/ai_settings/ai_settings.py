@@ -16,6 +16,14 @@ class AISettings(Document):
 		if not self.default_model:
 			frappe.throw("Default Model is required")
 
+	def on_update(self):
+		# The wildcard auto-index hooks cache which DocTypes to watch
+		from oly_ai.api.train import invalidate_auto_index_doctypes
+		invalidate_auto_index_doctypes()
+		# The global system prompt may have changed
+		from oly_ai.core.prompt_registry import invalidate_prompts
+		invalidate_prompts()
+
 	def is_configured(self):
 		"""Check if AI is properly configured with an API key."""
 		try:
@@ -60,11 +60,15 @@ function render_dashboard(page, data) {
 			<div class="stat-value">${format_tokens(s.input_tokens + s.output_tokens)}</div>
 			<div class="stat-label">Tokens This Month</div>
 			<div class="stat-sub">${format_tokens(s.input_tokens)} in • ${format_tokens(s.output_tokens)} out</div>
+			<div class="stat-sub">${s.prompt_cache_rate}% of input from prompt cache • $${s.prompt_cache_saved.toFixed(2)} saved</div>
 		</div>
 		<div class="ai-stat-card">
 			<div class="stat-value">${s.cache_rate}%</div>
 			<div class="stat-label">Cache Hit Rate</div>
 			<div class="stat-sub">${s.avg_response_time}s avg response</div>
+			<div class="stat-sub">${s.embedding_cache_rate}% of ${s.embedding_cache_lookups} query embeddings cached</div>
+			<div class="stat-sub">${s.context_cache_rate}% of ${s.context_cache_lookups} document contexts cached</div>
+			<div class="stat-sub">${s.semantic_cache_hits} semantic hits • ${s.semantic_cache_false_hits} reported wrong</div>
 		</div>
 	</div>`;
 
@@ -138,6 +142,26 @@ function render_dashboard(page, data) {
 		html += `</div></div>`;
 	}
 
+	// Provider HTTP connection pooling
+	if (data.provider_connections && data.provider_connections.length) {
+		html += `<div class="ai-dashboard-section">
+			<h3>Provider Connections</h3>
+			<table class="table table-sm">
+				<thead><tr><th>Host</th><th class="text-right">Requests</th><th class="text-right">Connections Opened</th><th class="text-right">Reuse</th><th class="text-right">Avg Connect</th><th class="text-right">Idle Sockets</th></tr></thead>
+				<tbody>`;
+		data.provider_connections.forEach((c) => {
+			html += `<tr>
+				<td>${c.host}</td>
+				<td class="text-right">${c.requests}</td>
+				<td class="text-right">${c.connections_opened}</td>
+				<td class="text-right">${c.reuse_rate}%</td>
+				<td class="text-right">${c.avg_connect_ms} ms</td>
+				<td class="text-right">${c.idle_sockets}</td>
+			</tr>`;
+		});
+		html += `</tbody></table></div>`;
+	}
+
 	// Recent logs
 	if (data.recent_logs.length) {
 		html += `<div class="ai-dashboard-section">
@@ -331,11 +331,11 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
       // If we already have streamed content, skip polling
       if (stream_buffer[task_id] && stream_buffer[task_id].length > 0) return;
       // Poll DB for new assistant message
-      frappe.xcall("oly_ai.api.chat.get_messages", { session_name: session_name })
-        .then(function (msgs) {
-          if (!msgs || msgs.length <= stream_poll_msg_count) return;
+      frappe.xcall("oly_ai.api.chat.get_messages", { session_name: session_name, limit: 1 })
+        .then(function (page) {
+          if (!page || page.total <= stream_poll_msg_count) return;
           // Found new message(s) — the worker finished!
-          var last = msgs[msgs.length - 1];
+          var last = page.messages[0];
           if (last.role === "assistant") {
             _stop_poll();
             var $el = $("#stream-content-" + task_id);
@@ -373,10 +373,10 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
   function _recover_from_db(task_id) {
     // One-shot: try to load last message from DB
     if (!current_session) return;
-    frappe.xcall("oly_ai.api.chat.get_messages", { session_name: current_session })
-      .then(function (msgs) {
-        if (!msgs || !msgs.length) return;
-        var last = msgs[msgs.length - 1];
+    frappe.xcall("oly_ai.api.chat.get_messages", { session_name: current_session, limit: 1 })
+      .then(function (page) {
+        if (!page || !page.messages.length) return;
+        var last = page.messages[0];
         if (last.role === "assistant") {
           var $el = $("#stream-content-" + task_id);
           if ($el.length) {
@@ -680,6 +680,7 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
 
   function new_chat() {
     current_session = null;
+    history_before_idx = null;
     // Reset sending state if stuck from a previous request
     if (sending) {
       _stop_poll();
@@ -695,6 +696,7 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
 
   function open_session(name) {
     current_session = name;
+    history_before_idx = null;
     clear_attachments();
     // Reset sending state if stuck from a previous request
     if (sending) {
@@ -718,14 +720,17 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
       callback: function (r) {
         if (current_session !== name) return;
         try {
-          var msgs = r && r.message;
+          // Newest page first; older pages load when scrolled to the top
+          var page = (r && r.message) || {};
+          var msgs = (page.messages || []).slice().reverse();
           $msgs.empty();
-          if (!msgs || !msgs.length) { show_welcome(); return; }
+          if (!msgs.length) { show_welcome(); return; }
           msgs.forEach(function (m) {
             if (m.role === "user") append_user_msg(m.content || "", m.idx);
             else append_ai_msg(m.content || "", m);
           });
           scroll_bottom();
+          history_before_idx = page.has_more ? page.next_before_idx : null;
           // Auto-switch model to match the session's last used model
           var last_model = null;
           for (var mi = msgs.length - 1; mi >= 0; mi--) {
@@ -1070,6 +1075,51 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
     setTimeout(function () { var el = $msgs[0]; if (el) el.scrollTop = el.scrollHeight; }, 60);
   }
 
+  // ── Older history — fetched a page at a time when scrolled near the top ──
+  var history_before_idx = null;
+  var history_loading = false;
+
+  function load_older_messages() {
+    if (!current_session || !history_before_idx || history_loading) return;
+    var name = current_session;
+    history_loading = true;
+    frappe.xcall("oly_ai.api.chat.get_messages", { session_name: name, before_idx: history_before_idx })
+      .then(function (page) {
+        if (current_session !== name) return;
+        var el = $msgs[0];
+        var prev_height = el.scrollHeight;
+        // Render the older page, then put the messages already shown back after it
+        var $shown = $msgs.children().detach();
+        page.messages.slice().reverse().forEach(function (m) {
+          if (m.role === "user") append_user_msg(m.content || "", m.idx);
+          else append_ai_msg(m.content || "", m);
+        });
+        $msgs.append($shown);
+        el.scrollTop += el.scrollHeight - prev_height;
+        history_before_idx = page.has_more ? page.next_before_idx : null;
+      })
+      .catch(function () {})
+      .then(function () { history_loading = false; });
+  }
+
+  $msgs.on("scroll", function () {
+    if (this.scrollTop < 80) load_older_messages();
+  });
+
+  function fetch_all_messages(name) {
+    // Walks every page (oldest first in the result) — used by export
+    var all = [];
+    function next(before_idx) {
+      var args = { session_name: name, limit: 200 };
+      if (before_idx) args.before_idx = before_idx;
+      return frappe.xcall("oly_ai.api.chat.get_messages", args).then(function (page) {
+        all = all.concat(page.messages || []);
+        return page.has_more ? next(page.next_before_idx) : all.reverse();
+      });
+    }
+    return next(null);
+  }
+
   // ── Approval Action Cards ──
   function render_action_cards(actions) {
     if (!actions || !actions.length) return;
@@ -1407,7 +1457,7 @@ frappe.pages["ask-ai"].on_page_load = function (wrapper) {
       frappe.show_alert({ message: __("No active conversation to export"), indicator: "orange" });
       return;
     }
-    frappe.xcall("oly_ai.api.chat.get_messages", { session_name: current_session }).then(function (msgs) {
+    fetch_all_messages(current_session).then(function (msgs) {
       if (!msgs || !msgs.length) {
         frappe.show_alert({ message: __("No messages to export"), indicator: "orange" });
         return;
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Build AI Index Term postings for chunks indexed before the BM25 term index existed.
+
+import frappe
+
+
+def execute():
+	"""Queue the background backfill — those chunks score cosine-only meanwhile."""
+	if not frappe.db.sql("SELECT 1 FROM `tabAI Document Index` WHERE IFNULL(token_count, 0) = 0 LIMIT 1"):
+		return
+
+	from oly_ai.core.rag.indexer import enqueue_term_index_backfill
+	enqueue_term_index_backfill()
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, OLY Technologies and contributors
+# Re-encode JSON embeddings in AI Document Index into the packed binary format.
+
+import frappe
+
+
+def execute():
+	"""Queue the background migration — retrieval reads both formats meanwhile."""
+	if not frappe.db.sql("SELECT 1 FROM `tabAI Document Index` WHERE embedding LIKE '[%%' LIMIT 1"):
+		return
+
+	from oly_ai.core.rag.indexer import enqueue_embedding_migration
+	enqueue_embedding_migration()
@@ -251,6 +251,7 @@ oly_ai.Panel = class {
     this.view = 'chat'; // 'chat' | 'history'
     this._stream_task = null;
     this._stream_buffer = "";
+    this._stream_seq = 0;
     this._safety_timer = null;
     this._active_request_id = null;
     this._history_filter = 'mine'; // 'mine' | 'shared' | 'all'
@@ -366,6 +367,10 @@ oly_ai.Panel = class {
       'overflow-wrap': 'break-word'
     });
     this.$container.append(this.$body);
+    // Older messages of the open session load a page at a time near the top
+    this.$body.on('scroll', function () {
+      if (this.scrollTop < 80) me._load_older_messages();
+    });
 
     // History view
     this.$history = $('<div class="oly-ai-history-view" style="flex:1;overflow-y:auto;padding:0;"></div>').hide();
@@ -1217,6 +1222,7 @@ oly_ai.Panel = class {
   // ── Session Management ──
   new_chat() {
     this.session = null;
+    this.history_before_idx = null;
     localStorage.removeItem('oly_ai_session');
     if (this.sending) this._stop_generation();
     this.$title.text(__("New Chat"));
@@ -1228,6 +1234,7 @@ oly_ai.Panel = class {
   _open_session(name) {
     var me = this;
     this.session = name;
+    this.history_before_idx = null;
     localStorage.setItem('oly_ai_session', name);
     if (this.sending) this._stop_generation();
     var s = this.sessions.find(function (x) { return x.name === name; });
@@ -1240,7 +1247,9 @@ oly_ai.Panel = class {
       callback: function (r) {
         if (me.session !== name) return;
         try {
-          var msgs = (r && r.message) || [];
+          // Newest page first; older pages load when scrolled to the top
+          var page = (r && r.message) || {};
+          var msgs = (page.messages || []).slice().reverse();
           me.$body.empty();
           if (!msgs.length) { me.show_welcome(); return; }
           msgs.forEach(function (m) {
@@ -1248,6 +1257,7 @@ oly_ai.Panel = class {
             else me._ai_msg_full(m.content || '', m);
           });
           me._scroll();
+          me.history_before_idx = page.has_more ? page.next_before_idx : null;
           // Auto-switch model to match session's last used model
           var last_model = null;
           for (var mi = msgs.length - 1; mi >= 0; mi--) {
@@ -1389,6 +1399,7 @@ oly_ai.Panel = class {
       }).then(function (r) {
         me._stream_task = r.task_id;
         me._stream_buffer = '';
+        me._stream_seq = 0;
         // Keep typing dots visible — add bubble styling only when first chunk replaces them
         $('#' + lid + ' .oly-ai-msg-content').html('<span id="panel-stream-' + r.task_id + '" class="ai-streaming-cursor"><div class="oly-ai-typing"><span></span><span></span><span></span></div></span>');
         me._scroll();
@@ -1448,71 +1459,124 @@ oly_ai.Panel = class {
   // ── Streaming ──
   _setup_streaming() {
     var me = this;
-    frappe.realtime.on("ai_chunk", function (data) {
-      if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
-      me._stream_buffer = (me._stream_buffer || "") + data.chunk;
-      var $el = $("#panel-stream-" + data.task_id);
-      if ($el.length) {
-        // On first chunk, add bubble styling to the content wrapper
-        var $content = $el.closest('.oly-ai-msg-content');
-        if (!$content.data('has-bubble')) {
-          $content.css({ background: 'var(--control-bg)', 'border-radius': '4px 18px 18px 18px', padding: '10px 14px', 'font-size': '0.8125rem', 'line-height': '1.6' });
-          $content.data('has-bubble', true);
-        }
-        $el.html(oly_ai.render_markdown(me._stream_buffer));
-        me._scroll();
-      }
-    });
-    frappe.realtime.on("ai_done", function (data) {
-      if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
-      var $el = $("#panel-stream-" + data.task_id);
-      if ($el.length) {
-        $el.removeClass("ai-streaming-cursor");
-        var content = data.content || me._stream_buffer || "";
-        var meta = [data.model, data.cost ? '$' + data.cost.toFixed(4) : ''].filter(Boolean).join(' · ');
-        var $content = $el.closest('.oly-ai-msg-content');
-        if (!$content.data('has-bubble')) {
-          $content.css({ background: 'var(--control-bg)', 'border-radius': '4px 18px 18px 18px', padding: '10px 14px', 'font-size': '0.8125rem', 'line-height': '1.6' });
-        }
-        $content.html(
-          oly_ai.render_markdown(content) +
-          '<div class="oly-ai-msg-footer" style="display:flex;align-items:center;gap:8px;margin-top:6px;padding-top:4px;border-top:1px solid var(--border-color);">' +
-            '<span class="oly-ai-copy-btn" style="display:inline-flex;align-items:center;gap:3px;cursor:pointer;color:var(--text-muted);font-size:0.75rem;" data-text="' + frappe.utils.escape_html(content) + '">' + ICON.copy + ' Copy</span>' +
-            '<span class="oly-ai-tts-btn" style="display:inline-flex;align-items:center;gap:3px;cursor:pointer;color:var(--text-muted);font-size:0.75rem;" title="Listen">' + ICON.speaker + '</span>' +
-            '<span class="oly-ai-fb-btn" data-fb="up" style="display:inline-flex;align-items:center;cursor:pointer;color:var(--text-muted);padding:2px;" title="Helpful">' + ICON.thumbs_up + '</span>' +
-            '<span class="oly-ai-fb-btn" data-fb="down" style="display:inline-flex;align-items:center;cursor:pointer;color:var(--text-muted);padding:2px;" title="Not helpful">' + ICON.thumbs_down + '</span>' +
-            (meta ? '<span class="oly-ai-msg-meta" style="margin-left:auto;font-size:0.6875rem;color:var(--text-muted);">' + meta + '</span>' : '') +
-          '</div>'
-        );
-        me._wire_copy();
-        if (data.pending_actions && data.pending_actions.length) me._render_action_cards(data.pending_actions);
-        if (data.session_title) me.$title.text(data.session_title);
+    frappe.realtime.on("ai_chunk", function (data) { me._on_stream_chunk(data); });
+    frappe.realtime.on("ai_done", function (data) { me._on_stream_done(data); });
+    frappe.realtime.on("ai_error", function (data) { me._on_stream_error(data); });
+    // Tool-call events aren't rendered here but still take a sequence number
+    frappe.realtime.on("ai_tool_call", function (data) { me._on_stream_tool_call(data); });
+    // After a socket reconnect, replay whatever was published while we were away
+    if (frappe.realtime.socket && frappe.realtime.socket.on) {
+      frappe.realtime.socket.on("connect", function () { me._resume_stream(); });
+    }
+  }
+
+  _resume_stream() {
+    var me = this;
+    var task_id = this._stream_task;
+    if (!task_id || this._resuming) return;
+    this._resuming = true;
+    frappe.xcall('oly_ai.api.stream.resume_stream', { task_id: task_id, after_seq: this._stream_seq || 0 })
+      .then(function (r) {
+        me._resuming = false;
+        if (!r || me._stream_task !== task_id) return;
+        var handlers = { ai_chunk: '_on_stream_chunk', ai_tool_call: '_on_stream_tool_call', ai_done: '_on_stream_done', ai_error: '_on_stream_error' };
+        (r.events || []).forEach(function (ev) {
+          if (handlers[ev.event]) me[handlers[ev.event]](ev.data);
+        });
+      })
+      .catch(function () { me._resuming = false; });
+  }
+
+  _on_stream_chunk(data) {
+    var me = this;
+    if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
+    if (data.seq) {
+      if (data.seq <= me._stream_seq) return; // already rendered (replay overlap)
+      if (data.seq > me._stream_seq + 1) { me._resume_stream(); return; } // missed events
+      me._stream_seq = data.seq;
+    }
+    me._stream_buffer = (me._stream_buffer || "") + data.chunk;
+    var $el = $("#panel-stream-" + data.task_id);
+    if ($el.length) {
+      // On first chunk, add bubble styling to the content wrapper
+      var $content = $el.closest('.oly-ai-msg-content');
+      if (!$content.data('has-bubble')) {
+        $content.css({ background: 'var(--control-bg)', 'border-radius': '4px 18px 18px 18px', padding: '10px 14px', 'font-size': '0.8125rem', 'line-height': '1.6' });
+        $content.data('has-bubble', true);
       }
-      me._stream_task = null;
-      me._stream_buffer = "";
-      me._set_sending(false);
-      me.$input.focus();
+      $el.html(oly_ai.render_markdown(me._stream_buffer));
       me._scroll();
-      me._load_sessions();
-    });
-    frappe.realtime.on("ai_error", function (data) {
-      if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
-      var $el = $("#panel-stream-" + data.task_id);
-      if ($el.length) {
-        var err_msg = frappe.utils.escape_html(data.error || 'Something went wrong');
-        $el.removeClass("ai-streaming-cursor").closest('.oly-ai-msg-content').html(
-          '<div class="oly-ai-msg-error">' + err_msg +
-          '<div class="oly-retry-btn" style="margin-top:6px;cursor:pointer;color:var(--primary-color);font-size:0.8rem;font-weight:600;">' + __('↻ Try again') + '</div></div>'
-        );
-        $el.closest('.oly-ai-msg-content').find('.oly-retry-btn').on('click', function () {
-          $(this).closest('[data-msg-idx]').remove();
-          me.send(me._last_message || '');
-        });
+    }
+  }
+
+  _on_stream_tool_call(data) {
+    if (!data || !this._stream_task || data.task_id !== this._stream_task || !data.seq) return;
+    if (data.seq > this._stream_seq + 1) { this._resume_stream(); return; }
+    this._stream_seq = Math.max(this._stream_seq, data.seq);
+  }
+
+  _on_stream_done(data) {
+    var me = this;
+    if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
+    // Terminal events carry the full result, so a gap before them doesn't matter
+    if (data.seq) {
+      if (data.seq <= me._stream_seq) return;
+      me._stream_seq = data.seq;
+    }
+    var $el = $("#panel-stream-" + data.task_id);
+    if ($el.length) {
+      $el.removeClass("ai-streaming-cursor");
+      var content = data.content || me._stream_buffer || "";
+      var meta = [data.model, data.cost ? '$' + data.cost.toFixed(4) : ''].filter(Boolean).join(' · ');
+      var $content = $el.closest('.oly-ai-msg-content');
+      if (!$content.data('has-bubble')) {
+        $content.css({ background: 'var(--control-bg)', 'border-radius': '4px 18px 18px 18px', padding: '10px 14px', 'font-size': '0.8125rem', 'line-height': '1.6' });
       }
-      me._stream_task = null;
-      me._stream_buffer = "";
-      me._set_sending(false);
-    });
+      $content.html(
+        oly_ai.render_markdown(content) +
+        '<div class="oly-ai-msg-footer" style="display:flex;align-items:center;gap:8px;margin-top:6px;padding-top:4px;border-top:1px solid var(--border-color);">' +
+          '<span class="oly-ai-copy-btn" style="display:inline-flex;align-items:center;gap:3px;cursor:pointer;color:var(--text-muted);font-size:0.75rem;" data-text="' + frappe.utils.escape_html(content) + '">' + ICON.copy + ' Copy</span>' +
+          '<span class="oly-ai-tts-btn" style="display:inline-flex;align-items:center;gap:3px;cursor:pointer;color:var(--text-muted);font-size:0.75rem;" title="Listen">' + ICON.speaker + '</span>' +
+          '<span class="oly-ai-fb-btn" data-fb="up" style="display:inline-flex;align-items:center;cursor:pointer;color:var(--text-muted);padding:2px;" title="Helpful">' + ICON.thumbs_up + '</span>' +
+          '<span class="oly-ai-fb-btn" data-fb="down" style="display:inline-flex;align-items:center;cursor:pointer;color:var(--text-muted);padding:2px;" title="Not helpful">' + ICON.thumbs_down + '</span>' +
+          (meta ? '<span class="oly-ai-msg-meta" style="margin-left:auto;font-size:0.6875rem;color:var(--text-muted);">' + meta + '</span>' : '') +
+        '</div>'
+      );
+      me._wire_copy();
+      if (data.pending_actions && data.pending_actions.length) me._render_action_cards(data.pending_actions);
+      if (data.session_title) me.$title.text(data.session_title);
+    }
+    me._stream_task = null;
+    me._stream_buffer = "";
+    me._set_sending(false);
+    me.$input.focus();
+    me._scroll();
+    me._load_sessions();
+  }
+
+  _on_stream_error(data) {
+    var me = this;
+    if (!data || !me._stream_task || data.task_id !== me._stream_task) return;
+    // Terminal events carry the full result, so a gap before them doesn't matter
+    if (data.seq) {
+      if (data.seq <= me._stream_seq) return;
+      me._stream_seq = data.seq;
+    }
+    var $el = $("#panel-stream-" + data.task_id);
+    if ($el.length) {
+      var err_msg = frappe.utils.escape_html(data.error || 'Something went wrong');
+      $el.removeClass("ai-streaming-cursor").closest('.oly-ai-msg-content').html(
+        '<div class="oly-ai-msg-error">' + err_msg +
+        '<div class="oly-retry-btn" style="margin-top:6px;cursor:pointer;color:var(--primary-color);font-size:0.8rem;font-weight:600;">' + __('↻ Try again') + '</div></div>'
+      );
+      $el.closest('.oly-ai-msg-content').find('.oly-retry-btn').on('click', function () {
+        $(this).closest('[data-msg-idx]').remove();
+        me.send(me._last_message || '');
+      });
+    }
+    me._stream_task = null;
+    me._stream_buffer = "";
+    me._set_sending(false);
   }
 
   // ── Action Cards ──
@@ -1719,6 +1783,30 @@ oly_ai.Panel = class {
     if (el) setTimeout(function () { el.scrollTop = el.scrollHeight; }, 50);
   }
 
+  _load_older_messages() {
+    var me = this;
+    var name = this.session;
+    if (!name || !this.history_before_idx || this._history_loading) return;
+    this._history_loading = true;
+    frappe.xcall("oly_ai.api.chat.get_messages", { session_name: name, before_idx: this.history_before_idx })
+      .then(function (page) {
+        if (me.session !== name) return;
+        var el = me.$body[0];
+        var prev_height = el.scrollHeight;
+        // Render the older page, then put the messages already shown back after it
+        var $shown = me.$body.children().detach();
+        page.messages.slice().reverse().forEach(function (m) {
+          if (m.role === 'user') me._user_msg(m.content || '', m.idx);
+          else me._ai_msg_full(m.content || '', m);
+        });
+        me.$body.append($shown);
+        el.scrollTop += el.scrollHeight - prev_height;
+        me.history_before_idx = page.has_more ? page.next_before_idx : null;
+      })
+      .catch(function () {})
+      .then(function () { me._history_loading = false; });
+  }
+
   // ── Voice: Recording ──
   _start_recording() {
     var me = this;
@@ -478,6 +478,39 @@ class TestRAGRetriever(FrappeTestCase):
 				result = retrieve("test query", doctype_filter="NonExistentDocType12345")
 				self.assertIsInstance(result, list)
 
+	def test_fulltext_fallback(self):
+		"""Embedding failure falls back to FULLTEXT search with normalized relevance."""
+		from oly_ai.core.rag.retriever import retrieve
+		rows = [
+			frappe._dict(chunk_text="Invoice total 5000", reference_doctype="Sales Invoice",
+				reference_name="SINV-1", relevance=4.0),
+			frappe._dict(chunk_text="Invoice draft", reference_doctype="Sales Invoice",
+				reference_name="SINV-2", relevance=1.0),
+		]
+		with patch("oly_ai.core.rag.retriever.frappe") as mock_frappe:
+			mock_frappe.db.db_type = "mariadb"
+			mock_frappe.db.sql.return_value = rows
+			with patch("oly_ai.core.rag.retriever.LLMProvider") as mock_provider:
+				mock_provider.return_value.get_embeddings.side_effect = Exception("provider down")
+				result = retrieve("invoice total", min_score=0.5)
+		against = mock_frappe.db.sql.call_args[0][1]["against"]
+		self.assertEqual(against, "invoice total")
+		self.assertEqual([r["reference_name"] for r in result], ["SINV-1"])
+		self.assertEqual(result[0]["score"], 1.0)
+
+	def test_fulltext_weak_top_match_stays_out(self):
+		"""The best FULLTEXT row still needs most of the query's keywords to pass min_score."""
+		from oly_ai.core.rag.retriever import _fulltext_search
+		rows = [
+			frappe._dict(chunk_text="Holiday list for the warehouse team", reference_doctype="Note",
+				reference_name="NOTE-1", relevance=0.3),
+		]
+		with patch("oly_ai.core.rag.retriever.frappe") as mock_frappe:
+			mock_frappe.db.db_type = "mariadb"
+			mock_frappe.db.sql.return_value = rows
+			result = _fulltext_search("warehouse stock valuation method", min_score=0.7)
+		self.assertEqual(result, [])
+
 
 class TestConfigurableToolRounds(FrappeTestCase):
 	"""Tests for configurable max tool rounds."""
@@ -746,27 +779,36 @@ class TestHybridRAG(FrappeTestCase):
 		# Single char tokens should be filtered
 		self.assertNotIn("a", tokens)
 
-	def test_bm25_loader(self):
-		"""BM25 class loads successfully."""
-		from oly_ai.core.rag.retriever import _get_bm25
-		BM25Class = _get_bm25()
-		self.assertIsNotNone(BM25Class, "rank_bm25 should be installed")
+	def test_bm25_postings(self):
+		"""Postings carry per-chunk term frequencies summing to the token count."""
+		from oly_ai.core.rag import bm25
+		counts = bm25.term_counts("invoice total invoice amount")
+		rows = bm25.build_postings("CHUNK-1", "Sales Invoice", "SINV-0001", counts)
+		self.assertEqual(sum(counts.values()), 4)
+		self.assertIn(("invoice", 2), [(r[1], r[2]) for r in rows])
+		self.assertTrue(all(r[3] == "CHUNK-1" and r[5] == "SINV-0001" for r in rows))
 
 	def test_bm25_scoring(self):
 		"""BM25 produces scores for matching documents."""
-		from oly_ai.core.rag.retriever import _get_bm25, _tokenize
-		BM25Class = _get_bm25()
-		if BM25Class is None:
-			self.skipTest("rank_bm25 not installed")
-
-		corpus = [
-			_tokenize("Sales Invoice for Customer A total amount 5000"),
-			_tokenize("Employee leave application pending approval"),
-			_tokenize("Purchase Order for supplier B delivery date March"),
+		from collections import Counter
+
+		from oly_ai.core.rag import bm25
+
+		texts = [
+			"Sales Invoice for Customer A total amount 5000",
+			"Employee leave application pending approval",
+			"Purchase Order for supplier B delivery date March",
 		]
-		bm25 = BM25Class(corpus)
-		query = _tokenize("sales invoice total amount")
-		scores = bm25.get_scores(query)
+		chunks = ["c0", "c1", "c2"]
+		corpus = [bm25.term_counts(t) for t in texts]
+		lengths = [sum(c.values()) for c in corpus]
+		doc_freqs = Counter(term for c in corpus for term in c)
+		term_freqs = {(chunk, term): tf for chunk, c in zip(chunks, corpus) for term, tf in c.items()}
+
+		query = bm25.tokenize("sales invoice total amount")
+		scores = bm25.bm25_scores(
+			query, chunks, lengths, len(chunks), sum(lengths) / len(lengths), doc_freqs, term_freqs
+		)
 		# First doc should score highest
 		self.assertGreater(scores[0], scores[1])
 		self.assertGreater(scores[0], scores[2])
@@ -1620,4 +1662,881 @@ class TestTelegramHandler(FrappeTestCase):
 		from oly_ai.hooks import doc_events
 		self.assertIn("Telegram Message", doc_events)
 		self.assertIn("after_insert", doc_events["Telegram Message"])
-		self.assertIn("telegram_handler", doc_events["Telegram Message"]["after_insert"])
\ No newline at end of file
+		self.assertIn("telegram_handler", doc_events["Telegram Message"]["after_insert"])
+
+# ═══════════════════════════════════════════════════════════════
+# Sprint 4: Performance — RAG, Caching & Streaming
+# ═══════════════════════════════════════════════════════════════
+
+class TestEmbeddingCodec(FrappeTestCase):
+	"""Tests for core/rag/codec.py — packed binary embedding storage."""
+
+	def test_float32_roundtrip_exact(self):
+		"""Float32 encoding round-trips without loss."""
+		from oly_ai.core.rag.codec import encode_embedding, decode_embedding
+		vec = [0.125, -0.5, 0.75, 1.0]
+		encoded = encode_embedding(vec, "f32")
+		self.assertTrue(encoded.startswith("ov1:f32:"))
+		self.assertEqual(decode_embedding(encoded).tolist(), vec)
+
+	def test_float16_and_int8_are_smaller_and_close(self):
+		"""Quantized formats shrink storage and stay close to the original."""
+		from oly_ai.core.rag.codec import encode_embedding, decode_embedding
+		vec = [((i * 37) % 101) / 100.0 - 0.5 for i in range(1536)]
+		f32 = encode_embedding(vec, "f32")
+		for fmt, tolerance in (("f16", 1e-3), ("i8", 1e-2)):
+			encoded = encode_embedding(vec, fmt)
+			self.assertLess(len(encoded), len(f32))
+			decoded = decode_embedding(encoded)
+			self.assertEqual(len(decoded), 1536)
+			self.assertLess(max(abs(a - b) for a, b in zip(decoded, vec)), tolerance)
+
+	def test_legacy_json_still_decodes(self):
+		"""Old JSON rows keep working until migrated."""
+		import json
+		from oly_ai.core.rag.codec import decode_embedding, is_legacy_json
+		value = json.dumps([0.1, 0.2, 0.3])
+		self.assertTrue(is_legacy_json(value))
+		self.assertEqual(len(decode_embedding(value)), 3)
+
+	def test_garbage_returns_none(self):
+		"""Unreadable values decode to None instead of raising."""
+		from oly_ai.core.rag.codec import decode_embedding
+		self.assertIsNone(decode_embedding(""))
+		self.assertIsNone(decode_embedding("ov1:f32:!!notbase64"))
+		self.assertIsNone(decode_embedding("not an embedding"))
+
+
+class TestVectorIndex(FrappeTestCase):
+	"""Tests for core/rag/vector_index.py — resident, incrementally refreshed index."""
+
+	def _row(self, name, doctype, ref, vec):
+		from oly_ai.core.rag.codec import encode_embedding
+		return frappe._dict(
+			name=name, reference_doctype=doctype, reference_name=ref,
+			embedding=encode_embedding(vec, "f32"),
+		)
+
+	def test_rows_are_normalized(self):
+		"""Loaded vectors are unit length so cosine is a plain dot product."""
+		from oly_ai.core.rag.vector_index import VectorIndex, _decode_rows
+		index = VectorIndex(*_decode_rows([self._row("r1", "Note", "N1", [3.0, 4.0])]))
+		self.assertAlmostEqual(float((index.matrix[0] ** 2).sum()), 1.0, places=5)
+
+	def test_refresh_replaces_only_changed_documents(self):
+		"""with_documents reloads the changed documents into a new index; the old one is untouched."""
+		from oly_ai.core.rag.vector_index import VectorIndex, _decode_rows
+		index = VectorIndex(*_decode_rows([
+			self._row("r1", "Note", "N1", [1.0, 0.0]),
+			self._row("r2", "Note", "N2", [0.0, 1.0]),
+		]))
+
+		fresh = [self._row("r3", "Note", "N1", [1.0, 1.0])]
+		with patch("oly_ai.core.rag.vector_index.frappe.get_all", return_value=fresh):
+			refreshed = index.with_documents({("Note", "N1")}, 1)
+
+		self.assertEqual(sorted(refreshed.names), ["r2", "r3"])
+		self.assertEqual(len(refreshed.positions_for(["r1", "r2", "r3"])), 2)
+		self.assertEqual(list(refreshed.rows_for_doctype("Note")), [0, 1])
+		# A search still running on the old index sees its own rows
+		self.assertEqual(index.names, ["r1", "r2"])
+		self.assertEqual(index.matrix.shape, (2, 2))
+
+
+class TestANNIndex(FrappeTestCase):
+	"""Tests for core/rag/ann.py — IVF approximate search."""
+
+	def test_kmeans_separates_clusters(self):
+		"""Well-separated clusters land in different IVF lists."""
+		import numpy as np
+		from oly_ai.core.rag.ann import _train_kmeans, _assign
+
+		rng = np.random.default_rng(0)
+		a = np.array([1.0, 0.0, 0.0]) + 0.01 * rng.normal(size=(50, 3))
+		b = np.array([0.0, 0.0, 1.0]) + 0.01 * rng.normal(size=(50, 3))
+		matrix = np.vstack([a, b]).astype(np.float32)
+		matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+		centroids = _train_kmeans(matrix, 2, 5)
+		lists = _assign(matrix, centroids)
+		self.assertEqual(len(set(lists[:50].tolist())), 1)
+		self.assertEqual(len(set(lists[50:].tolist())), 1)
+		self.assertNotEqual(lists[0], lists[50])
+
+	def test_probe_falls_back_for_small_index(self):
+		"""Small indexes skip IVF and keep every candidate."""
+		import numpy as np
+		from oly_ai.core.rag.ann import probe_candidates
+		from oly_ai.core.rag.vector_index import VectorIndex
+
+		candidates = np.arange(3)
+		result = probe_candidates(VectorIndex(), np.zeros(3, dtype=np.float32), candidates)
+		self.assertEqual(result.tolist(), [0, 1, 2])
+
+
+class TestEmbeddingCache(FrappeTestCase):
+	"""Tests for the query-embedding cache in core/cache.py."""
+
+	def test_normalize_query(self):
+		"""Case, whitespace and trailing punctuation do not change the key."""
+		from oly_ai.core.cache import get_embedding_cache_key
+		self.assertEqual(
+			get_embedding_cache_key("What is our  leave policy?", "m"),
+			get_embedding_cache_key("what is our leave policy", "m"),
+		)
+		self.assertNotEqual(
+			get_embedding_cache_key("leave policy", "m"),
+			get_embedding_cache_key("leave policy", "other-model"),
+		)
+
+	def test_repeat_query_skips_provider(self):
+		"""Second lookup of the same query is served from cache."""
+		from oly_ai.core.cache import get_query_embedding
+		provider = MagicMock()
+		provider.settings.embedding_model = f"test-model-{frappe.generate_hash(length=8)}"
+		provider.get_embeddings.return_value = [[0.1, 0.2, 0.3]]
+
+		first = get_query_embedding(provider, "What is our leave policy?")
+		second = get_query_embedding(provider, "what is our leave policy")
+		self.assertEqual(provider.get_embeddings.call_count, 1)
+		self.assertEqual(list(first), list(second))
+
+	def test_lookup_stats_read_back_from_redis(self):
+		"""Counters written by record_lookup are what get_lookup_stats sums."""
+		from frappe.utils import nowdate
+		from oly_ai.core import cache
+		stats_key = f"oly_ai:test:stats:{frappe.generate_hash(length=8)}:"
+		cache.record_lookup(stats_key, "hits")
+		cache.record_lookup(stats_key, "hits")
+		cache.record_lookup(stats_key, "misses")
+		self.assertEqual(cache.get_lookup_stats(stats_key), {"hits": 2, "misses": 1, "hit_rate": 66.7})
+		redis = frappe.cache()
+		redis.delete(redis.make_key(f"{stats_key}{nowdate()}"))
+
+
+class TestIndexingPipeline(FrappeTestCase):
+	"""Tests for the batched embedding pipeline in core/rag/indexer.py."""
+
+	def _jobs(self, count, chunks=3):
+		return [
+			frappe._dict(name=f"DOC-{j}", chunks=["word " * 100] * chunks,
+				embeddings=[None] * chunks, error=None)
+			for j in range(count)
+		]
+
+	def test_batches_span_documents(self):
+		"""Chunks from several documents are packed into the same request."""
+		from oly_ai.core.rag.indexer import _make_batches
+		batches = _make_batches(self._jobs(5), 4)
+		self.assertEqual([len(b) for b in batches], [4, 4, 4, 3])
+		self.assertEqual({job.name for job, _i in batches[0]}, {"DOC-0", "DOC-1"})
+
+	def test_failed_request_marks_its_documents(self):
+		"""A failed embeddings request errors only the documents it carried."""
+		from oly_ai.core.rag.indexer import _embed_jobs
+		jobs = self._jobs(2, chunks=2)
+
+		def get_embeddings(texts):
+			if len(texts) == 1:
+				raise Exception("rate limited")
+			return [[1.0, 0.0]] * len(texts)
+
+		provider = MagicMock()
+		provider.get_embeddings.side_effect = get_embeddings
+		settings = frappe._dict(embedding_batch_size=3, embedding_concurrency=2)
+		_embed_jobs(provider, jobs, settings)
+		# Batches: [DOC-0 x2, DOC-1 #0] succeeds, [DOC-1 #1] fails
+		self.assertEqual(provider.get_embeddings.call_count, 2)
+		self.assertIsNone(jobs[0].error)
+		self.assertEqual(jobs[1].error, "rate limited")
+
+	def test_edit_reembeds_only_changed_chunks(self):
+		"""Inserting words mid-document leaves the other chunks' rows in place."""
+		import random
+		from oly_ai.core.rag import indexer
+
+		rng = random.Random(1)
+		words = [f"w{rng.randrange(3000)}" for _ in range(6000)]
+		original = " ".join(words)
+		rows = [
+			frappe._dict(name=f"ROW-{i}", chunk_index=i, content_hash=indexer.compute_content_hash(c))
+			for i, c in enumerate(indexer.chunk_text(original))
+		]
+
+		with patch("oly_ai.core.rag.indexer.extract_document_text", return_value=original):
+			job, skipped = indexer._prepare_document("Wiki Page", "WP-1", rows)
+		self.assertIsNone(job)
+		self.assertEqual(skipped["reason"], "Content unchanged")
+
+		edited = " ".join(words[:3000] + ["inserted"] * 37 + words[3000:])
+		with patch("oly_ai.core.rag.indexer.extract_document_text", return_value=edited):
+			job, skipped = indexer._prepare_document("Wiki Page", "WP-1", rows)
+		self.assertLessEqual(len(job.embed_indexes), 3)
+		self.assertEqual(len(job.drop), len(job.embed_indexes))
+		self.assertEqual(len(job.keep), len(job.chunks) - len(job.embed_indexes))
+
+
+class TestAutoIndexQueue(FrappeTestCase):
+	"""Tests for the debounced auto-index queue in api/train.py."""
+
+	def test_repeat_saves_coalesce(self):
+		"""Saving the same document twice leaves one queue entry."""
+		from oly_ai.api import train
+		key = f"oly_ai:test:auto_index:{frappe.generate_hash(length=8)}"
+		cache = frappe.cache()
+		with patch.object(train, "AUTO_INDEX_QUEUE_KEY", key):
+			train._mark_dirty("Note", "NOTE-1")
+			train._mark_dirty("Note", "NOTE-1")
+			train._mark_dirty("Note", "NOTE-2")
+			self.assertEqual(cache.zcard(cache.make_key(key)), 2)
+		cache.delete(cache.make_key(key))
+
+	def test_drain_respects_debounce(self):
+		"""Entries newer than the debounce window stay queued."""
+		from oly_ai.api import train
+		key = f"oly_ai:test:auto_index:{frappe.generate_hash(length=8)}"
+		cache = frappe.cache()
+		settings = frappe._dict(auto_index_debounce=3600)
+		with patch.object(train, "AUTO_INDEX_QUEUE_KEY", key), \
+				patch("oly_ai.api.train.frappe.get_cached_doc", return_value=settings), \
+				patch("oly_ai.core.rag.indexer.index_documents") as mock_index:
+			train._mark_dirty("Note", "NOTE-1")
+			train.drain_auto_index_queue()
+			mock_index.assert_not_called()
+			self.assertEqual(cache.zcard(cache.make_key(key)), 1)
+		cache.delete(cache.make_key(key))
+
+	def test_failed_or_restamped_entries_stay_queued(self):
+		"""Only entries indexed successfully and not re-saved meanwhile leave the queue."""
+		from oly_ai.api import train
+		key = f"oly_ai:test:auto_index:{frappe.generate_hash(length=8)}"
+		cache = frappe.cache()
+		settings = frappe._dict(auto_index_debounce=0)
+		with patch.object(train, "AUTO_INDEX_QUEUE_KEY", key), \
+				patch("oly_ai.api.train.frappe.get_cached_doc", return_value=settings), \
+				patch("oly_ai.api.train.frappe.get_all", side_effect=lambda dt, filters, pluck: filters["name"][1]):
+			train._mark_dirty("Note", "NOTE-1")
+			train._mark_dirty("Note", "NOTE-2")
+			# The indexer reports per-document embedding failures in its result
+			with patch("oly_ai.core.rag.indexer.index_documents",
+					return_value={"indexed": 1, "skipped": 0, "errors": 1, "failed": ["NOTE-1"]}):
+				train.drain_auto_index_queue()
+			self.assertEqual(cache.zrange(cache.make_key(key), 0, -1), ["Note\x1fNOTE-1".encode()])
+
+			def resave(doctype, names):
+				train._mark_dirty("Note", "NOTE-1")
+				return {"indexed": 1, "skipped": 0, "errors": 0, "failed": []}
+
+			with patch("oly_ai.core.rag.indexer.index_documents", side_effect=resave):
+				train.drain_auto_index_queue()
+			self.assertEqual(cache.zcard(cache.make_key(key)), 1)
+
+			with patch("oly_ai.core.rag.indexer.index_documents",
+					return_value={"indexed": 1, "skipped": 0, "errors": 0, "failed": []}):
+				train.drain_auto_index_queue()
+			self.assertEqual(cache.zcard(cache.make_key(key)), 0)
+		cache.delete(cache.make_key(key))
+
+	def test_deleted_doctype_entries_are_dropped(self):
+		"""A DocType removed since its documents were queued doesn't block the drain."""
+		from oly_ai.api import train
+		key = f"oly_ai:test:auto_index:{frappe.generate_hash(length=8)}"
+		cache = frappe.cache()
+		settings = frappe._dict(auto_index_debounce=0)
+		with patch.object(train, "AUTO_INDEX_QUEUE_KEY", key), \
+				patch("oly_ai.api.train.frappe.get_cached_doc", return_value=settings), \
+				patch("oly_ai.core.rag.indexer.index_documents",
+					return_value={"indexed": 1, "skipped": 0, "errors": 0, "failed": []}) as mock_index:
+			train._mark_dirty(f"Gone {frappe.generate_hash(length=8)}", "X-1")
+			train._mark_dirty("User", "Administrator")
+			train.drain_auto_index_queue()
+			mock_index.assert_called_once_with("User", ["Administrator"])
+			self.assertEqual(cache.zcard(cache.make_key(key)), 0)
+		cache.delete(cache.make_key(key))
+
+	def test_auto_index_set_cached_until_invalidated(self):
+		"""The hook reads a cached frozenset; saving AI Settings refreshes it."""
+		from oly_ai.api import train
+		train.invalidate_auto_index_doctypes()
+		doctypes = train.get_auto_index_doctypes()
+		self.assertIsInstance(doctypes, frozenset)
+
+		with patch("oly_ai.api.train.frappe.get_cached_doc") as mock_settings:
+			self.assertIs(train.get_auto_index_doctypes(), doctypes)
+			mock_settings.assert_not_called()
+
+		train.invalidate_auto_index_doctypes()
+		with patch("oly_ai.api.train.frappe.get_cached_doc") as mock_settings:
+			mock_settings.return_value.get.return_value = [
+				frappe._dict(document_type="Note", enabled=1, auto_index=1),
+			]
+			self.assertEqual(train.get_auto_index_doctypes(), frozenset({"Note"}))
+		train.invalidate_auto_index_doctypes()
+
+
+class TestHTTPPool(FrappeTestCase):
+	"""Tests for core/http_pool.py — pooled provider sessions."""
+
+	def test_session_shared_per_origin(self):
+		"""Paths under the same host share one session; other hosts get their own."""
+		from oly_ai.core.http_pool import get_session
+		a = get_session("https://api.openai.com/v1")
+		b = get_session("https://api.openai.com/v1/embeddings")
+		c = get_session("https://api.anthropic.com")
+		self.assertIs(a, b)
+		self.assertIsNot(a, c)
+
+	def test_adapter_pool_sizes(self):
+		"""Sessions mount the instrumented adapter with tuned pool sizes."""
+		from oly_ai.core.http_pool import POOL_MAXSIZE, InstrumentedAdapter, get_session
+		adapter = get_session("https://api.openai.com").get_adapter("https://api.openai.com/v1")
+		self.assertIsInstance(adapter, InstrumentedAdapter)
+		self.assertEqual(adapter._pool_maxsize, POOL_MAXSIZE)
+
+	def test_counters_buffered_then_read_back(self):
+		"""Counters stay in process memory until a flush, then read back from Redis."""
+		from oly_ai.core import http_pool
+		from oly_ai.core.cache import raw_redis
+		host = f"{frappe.generate_hash(length=8)}.example.com"
+		http_pool.flush_pool_stats()
+		with patch("oly_ai.core.http_pool.frappe.cache") as cache:
+			http_pool._record(host, "requests", 1)
+			http_pool._record(host, "requests", 1)
+			http_pool._record(f"{host}:443", "connections", 1)
+			cache.assert_not_called()
+
+		stats = {s["host"]: s for s in http_pool.get_pool_stats()}
+		self.assertEqual(stats[host]["requests"], 2)
+		self.assertEqual(stats[host]["reuse_rate"], 50.0)
+		redis = frappe.cache()
+		raw_redis(redis).hdel(redis.make_key(http_pool.STATS_KEY), f"{host}|requests", f"{host}|connections")
+
+
+class TestAsyncProvider(FrappeTestCase):
+	"""Tests for the shared stream parsers and the async provider semaphores."""
+
+	def test_stream_parsers(self):
+		"""Sync and async streaming share parsers that emit chat_stream events."""
+		from oly_ai.core.provider import _AnthropicStreamParser, _OpenAIStreamParser
+		openai = _OpenAIStreamParser()
+		self.assertEqual(
+			openai.feed(b'data: {"choices": [{"delta": {"content": "Hi"}}]}'),
+			[{"type": "chunk", "content": "Hi"}],
+		)
+		self.assertEqual(openai.feed("data: [DONE]"), [])
+
+		anthropic = _AnthropicStreamParser()
+		anthropic.feed('data: {"type": "content_block_start", "content_block": {"type": "tool_use", "id": "t1", "name": "get_list"}}')
+		anthropic.feed('data: {"type": "content_block_delta", "delta": {"type": "input_json_delta", "partial_json": "{}"}}')
+		events = anthropic.feed('data: {"type": "content_block_stop"}')
+		self.assertEqual(events[0]["delta"][0]["id"], "t1")
+		self.assertEqual(events[0]["delta"][0]["function"]["arguments"], "{}")
+
+	def test_semaphore_per_provider_and_loop(self):
+		"""One semaphore per origin within a loop; a new loop gets a fresh one."""
+		import asyncio
+		from oly_ai.core.http_pool import get_provider_semaphore
+
+		async def pair():
+			return (
+				get_provider_semaphore("https://api.openai.com/v1", 4),
+				get_provider_semaphore("https://api.openai.com/v1/embeddings", 4),
+				get_provider_semaphore("https://api.anthropic.com", 4),
+			)
+
+		a, b, c = asyncio.run(pair())
+		self.assertIs(a, b)
+		self.assertIsNot(a, c)
+		d, _b, _c = asyncio.run(pair())
+		self.assertIsNot(a, d)
+
+	def test_escalation_calls_run_concurrently(self):
+		"""SLA escalation suggestions overlap their provider calls; a failure stays per issue."""
+		import asyncio
+		from oly_ai.core.sla_monitor import _achat_all
+		running = {"now": 0, "peak": 0}
+
+		async def achat(messages):
+			running["now"] += 1
+			running["peak"] = max(running["peak"], running["now"])
+			await asyncio.sleep(0.01)
+			running["now"] -= 1
+			if messages == "bad":
+				raise ValueError("provider down")
+			return {"content": messages}
+
+		results = asyncio.run(_achat_all(MagicMock(achat=achat), ["a", "bad", "c"]))
+		self.assertEqual(running["peak"], 3)
+		self.assertEqual(results[0], {"content": "a"})
+		self.assertIsInstance(results[1], ValueError)
+
+
+class TestParallelTools(FrappeTestCase):
+	"""Tests for core/tools.py execute_tools — one tool round."""
+
+	def test_results_keep_call_order(self):
+		"""Read-only calls run in threads; results line up with the calls; writes stay on the caller."""
+		import threading
+		import time as _time
+		from oly_ai.core import tools
+
+		caller = threading.current_thread()
+		write_threads = []
+
+		def fake_thread(site, sites_path, user, name, args):
+			_time.sleep(args["delay"])
+			return f"{name}:{args['n']}"
+
+		def fake_execute(name, args, user=None):
+			if name in tools.WRITE_TOOLS:
+				write_threads.append(threading.current_thread())
+			return f"{name}:{args['n']}"
+
+		calls = [
+			("search_documents", {"n": 1, "delay": 0.05}),
+			("web_search", {"n": 2, "delay": 0.0}),
+			("create_document", {"n": 3}),
+			("get_report", {"n": 4, "delay": 0.02}),
+			("read_webpage", {"n": 5, "delay": 0.0}),
+		]
+		with patch.object(tools, "_execute_tool_in_thread", side_effect=fake_thread) as mock_thread, \
+				patch.object(tools, "execute_tool", side_effect=fake_execute):
+			results = tools.execute_tools(calls, user="Administrator")
+
+		self.assertEqual(results, [f"{name}:{args['n']}" for name, args in calls])
+		self.assertEqual(mock_thread.call_count, 4)
+		self.assertEqual(write_threads, [caller])
+
+
+class TestStreamedToolCalls(FrappeTestCase):
+	"""Tests for api/stream.py — assembling streamed tool calls."""
+
+	def test_merge_fragmented_deltas(self):
+		"""OpenAI-style fragments and Anthropic-style complete deltas assemble per index."""
+		import json
+		from oly_ai.api.stream import _merge_tool_call_deltas
+		calls = {}
+		_merge_tool_call_deltas(calls, [{"index": 0, "id": "a", "function": {"name": "web_search", "arguments": '{"qu'}}])
+		_merge_tool_call_deltas(calls, [{"index": 1, "id": "b", "function": {"name": "get_report", "arguments": ""}}])
+		_merge_tool_call_deltas(calls, [{"index": 0, "function": {"arguments": 'ery": "x"}'}}])
+		_merge_tool_call_deltas(calls, [{"index": 1, "function": {"arguments": "{}"}}])
+		self.assertEqual(calls[0]["id"], "a")
+		self.assertEqual(json.loads(calls[0]["function"]["arguments"]), {"query": "x"})
+		self.assertEqual(calls[1]["function"]["name"], "get_report")
+		self.assertEqual(calls[1]["function"]["arguments"], "{}")
+
+
+class TestContextAssembly(FrappeTestCase):
+	"""Tests for core/context_assembly.py — parallel prompt context."""
+
+	def test_slow_source_times_out_without_blocking_others(self):
+		"""A source past its deadline is dropped; the others still land, within budget."""
+		import time as _time
+		from oly_ai.core import context_assembly as ca
+
+		def slow_rag(message):
+			_time.sleep(1)
+			return "late", [{"doctype": "Note"}]
+
+		with patch.object(ca, "_rag_source", side_effect=slow_rag), \
+				patch.object(ca, "_memories_source", return_value="m" * 10), \
+				patch.dict(ca.SOURCE_TIMEOUTS, {"rag": 0.2}), \
+				patch.dict(ca.SOURCE_BUDGETS, {"memories": 4}):
+			start = _time.perf_counter()
+			ctx = ca.assemble_context("hello", frappe.session.user)
+			elapsed = _time.perf_counter() - start
+
+		self.assertLess(elapsed, 0.9)
+		self.assertEqual(ctx.rag_context, "")
+		self.assertEqual(ctx.sources, [])
+		self.assertEqual(ctx.timings["rag"], "timeout")
+		self.assertTrue(ctx.user_memories.startswith("mmmm\n"))
+		self.assertIsInstance(ctx.timings["memories"], float)
+
+
+class TestChunkPublisher(FrappeTestCase):
+	"""Tests for api/stream.py ChunkPublisher — coalesced ai_chunk publishing."""
+
+	def test_chunk_publisher_coalesces(self):
+		"""Small deltas share one publish; sentence ends and flush() deliver the rest in order."""
+		from oly_ai.api.stream import ChunkPublisher
+		published = []
+		with patch("oly_ai.api.stream.frappe.publish_realtime",
+				side_effect=lambda event, data, user=None: published.append(data["chunk"])):
+			publisher = ChunkPublisher("task", "Administrator", interval_ms=60000)
+			for delta in ["Hel", "lo", " wor", "ld.", " Next", " bit"]:
+				publisher.add(delta)
+			publisher.flush()
+
+		self.assertEqual(published, ["Hel", "lo world.", " Next bit"])
+		self.assertEqual(publisher.stats(), {"deltas": 6, "publishes": 3, "chars": 21})
+
+	def test_resume_replays_after_seq(self):
+		"""Published events land in the task's replay buffer; resume returns those after a seq."""
+		from oly_ai.api.stream import ChunkPublisher, resume_stream
+		task_id = f"test-{frappe.generate_hash(length=8)}"
+		with patch("oly_ai.api.stream.frappe.publish_realtime"):
+			publisher = ChunkPublisher(task_id, frappe.session.user, interval_ms=60000)
+			for delta in ["One.", " Two.", " Three"]:
+				publisher.add(delta)
+			publisher.emit("ai_done", {"task_id": task_id, "content": "One. Two. Three"})
+
+		replay = resume_stream(task_id, after_seq=2)
+		self.assertFalse(replay["expired"])
+		self.assertEqual([e["seq"] for e in replay["events"]], [3, 4])
+		self.assertEqual(replay["events"][0]["data"]["chunk"], " Three")
+		self.assertEqual(replay["events"][1]["event"], "ai_done")
+		self.assertEqual(replay["last_seq"], 4)
+		self.assertTrue(resume_stream("missing-task")["expired"])
+
+
+class TestIncrementalSessionSave(FrappeTestCase):
+	"""Tests for AIChatSession.save_new_messages — append-only message persistence."""
+
+	def test_save_new_messages_appends_and_sums(self):
+		"""Only unsaved rows are inserted (after the stored idx) and totals accumulate."""
+		session = frappe.get_doc({"doctype": "AI Chat Session", "title": "Incremental"})
+		session.insert(ignore_permissions=True)
+
+		session.append("messages", {"role": "user", "content": "Hi"})
+		session.append("messages", {"role": "assistant", "content": "Hello", "cost": 0.5})
+		session.save_new_messages(tokens=10, cost=0.5, title="Greeting")
+
+		# A second, stale copy of the doc appends its own turn
+		other = frappe.get_doc("AI Chat Session", session.name)
+		other.append("messages", {"role": "user", "content": "Again"})
+		other.save_new_messages(tokens=5, cost=0.25)
+
+		session.append("messages", {"role": "assistant", "content": "Sure"})
+		session.save_new_messages(tokens=1)
+
+		saved = frappe.get_doc("AI Chat Session", session.name)
+		self.assertEqual([m.content for m in saved.messages], ["Hi", "Hello", "Again", "Sure"])
+		self.assertEqual([m.idx for m in saved.messages], [1, 2, 3, 4])
+		self.assertEqual(saved.total_tokens, 16)
+		self.assertAlmostEqual(saved.total_cost, 0.75)
+		self.assertEqual(saved.title, "Greeting")
+		self.assertEqual(session.total_tokens, 16)
+
+		saved.delete(ignore_permissions=True)
+
+
+class TestSessionWindow(FrappeTestCase):
+	"""Tests for core/memory.py load_session_window — tail-only history loading."""
+
+	def test_window_loads_tail_and_appends_after_it(self):
+		"""Only the last N messages are loaded; new turns still get the next idx."""
+		from oly_ai.core.memory import get_session_context, load_session_window
+		session = frappe.get_doc({"doctype": "AI Chat Session", "title": "Window"})
+		session.insert(ignore_permissions=True)
+		for i in range(20):
+			session.append("messages", {"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"})
+		session.save_new_messages()
+		frappe.db.set_value("AI Chat Session", session.name, "conversation_summary", "Earlier stuff")
+
+		windowed = load_session_window(session.name, window=4)
+		self.assertEqual([m.content for m in windowed.messages], ["m16", "m17", "m18", "m19"])
+		context = get_session_context(windowed)
+		self.assertIn("Earlier stuff", context[0]["content"])
+		self.assertEqual(len(context), 5)
+
+		windowed.append("messages", {"role": "user", "content": "m20"})
+		windowed.save_new_messages()
+		self.assertEqual(frappe.db.get_value("AI Chat Message", {"parent": session.name, "content": "m20"}, "idx"), 21)
+
+		# A full save would drop the unloaded rows
+		self.assertRaises(frappe.ValidationError, windowed.save)
+
+		frappe.delete_doc("AI Chat Session", session.name, ignore_permissions=True)
+
+
+class TestMessagePagination(FrappeTestCase):
+	"""Tests for api/chat.py get_messages — keyset pagination, newest first."""
+
+	def test_pages_walk_back_by_idx(self):
+		"""Pages come newest first and next_before_idx continues where the last page stopped."""
+		from oly_ai.api.chat import get_messages
+		session = frappe.get_doc({"doctype": "AI Chat Session", "title": "Pages"})
+		session.insert(ignore_permissions=True)
+		for i in range(5):
+			session.append("messages", {"role": "user", "content": f"m{i}"})
+		session.save_new_messages()
+
+		first = get_messages(session.name, limit=2)
+		self.assertEqual([m.content for m in first["messages"]], ["m4", "m3"])
+		self.assertTrue(first["has_more"])
+		self.assertEqual(first["total"], 5)
+
+		second = get_messages(session.name, before_idx=first["next_before_idx"], limit=2)
+		self.assertEqual([m.content for m in second["messages"]], ["m2", "m1"])
+
+		last = get_messages(session.name, before_idx=second["next_before_idx"], limit=2)
+		self.assertEqual([m.content for m in last["messages"]], ["m0"])
+		self.assertFalse(last["has_more"])
+		self.assertIsNone(last["next_before_idx"])
+
+		frappe.delete_doc("AI Chat Session", session.name, ignore_permissions=True)
+
+
+class TestSemanticCache(FrappeTestCase):
+	"""Tests for core/semantic_cache.py — similarity-matched cached answers."""
+
+	def test_similar_query_hits_within_scope_only(self):
+		"""A close paraphrase hits; unrelated queries, other scopes and evicted entries miss."""
+		from oly_ai.core import semantic_cache
+		settings = frappe._dict(
+			enable_caching=1, enable_semantic_cache=1,
+			semantic_cache_threshold=0.9, cache_ttl_hours=4,
+		)
+		vectors = {
+			"what is the leave policy": [1.0, 0.0, 0.0],
+			"leave policy please": [0.99, 0.1, 0.0],
+			"sales target": [0.0, 1.0, 0.0],
+		}
+		scope = f"test-{frappe.generate_hash(length=8)}"
+		with patch("oly_ai.core.semantic_cache.get_query_embedding",
+				side_effect=lambda provider, text: vectors[text]), \
+				patch("oly_ai.core.provider.LLMProvider"):
+			semantic_cache.store("what is the leave policy", scope, {"content": "20 days"}, settings)
+
+			hit = semantic_cache.lookup("leave policy please", scope, settings)
+			self.assertEqual(hit.response["content"], "20 days")
+			self.assertGreater(hit.similarity, 0.9)
+
+			self.assertIsNone(semantic_cache.lookup("sales target", scope, settings))
+			self.assertIsNone(semantic_cache.lookup("leave policy please", scope + "x", settings))
+
+			semantic_cache.evict(hit.entry)
+			self.assertIsNone(semantic_cache.lookup("leave policy please", scope, settings))
+
+	def test_overflow_evicts_several_entries_and_clear_removes_scope(self):
+		"""One store can evict several LRU entries; scope keys expire and clear_cache finds them."""
+		from oly_ai.core import cache as response_cache, semantic_cache
+		settings = frappe._dict(enable_caching=1, enable_semantic_cache=1, cache_ttl_hours=4)
+		scope = f"test-{frappe.generate_hash(length=8)}"
+		with patch("oly_ai.core.semantic_cache.get_query_embedding", return_value=[1.0, 0.0]), \
+				patch("oly_ai.core.provider.LLMProvider"):
+			for query in ("one", "two", "three"):
+				semantic_cache.store(query, scope, {"content": query}, settings)
+			with patch.object(semantic_cache, "SEMANTIC_CACHE_MAX_ENTRIES", 1):
+				semantic_cache.store("four", scope, {"content": "four"}, settings)
+
+		redis = frappe.cache()
+		entries_key, lru_key = semantic_cache._keys(redis, scope)
+		self.assertEqual(redis.hlen(entries_key), 1)
+		self.assertEqual(redis.zcard(lru_key), 1)
+		self.assertGreater(redis.ttl(entries_key), 0)
+		self.assertGreater(redis.ttl(lru_key), 0)
+
+		response_cache.clear_cache()
+		self.assertEqual(response_cache.raw_redis(redis).exists(entries_key, lru_key), 0)
+
+	def test_document_scope_follows_rendered_context(self):
+		"""A new Communication changes the context, and with it the ai_assist scope."""
+		from oly_ai.core import semantic_cache
+		before = semantic_cache.get_scope("Summarize", "m", "Administrator", "User", "Administrator",
+			context="Issue body")
+		after = semantic_cache.get_scope("Summarize", "m", "Administrator", "User", "Administrator",
+			context="Issue body\nCustomer reply")
+		self.assertNotEqual(before, after)
+
+
+class TestResponseCacheTags(FrappeTestCase):
+	"""Tests for the tagged, size-bounded response cache in core/cache.py."""
+
+	def test_document_update_drops_only_its_answers(self):
+		"""invalidate_document_cache removes the document's ai_assist entries and nothing else."""
+		from oly_ai.core import cache
+		settings = frappe._dict(enable_caching=1, cache_ttl_hours=1, cache_max_size_mb=8)
+		lead = f"LEAD-{frappe.generate_hash(length=8)}"
+		with patch("oly_ai.core.cache.frappe.get_cached_doc", return_value=settings):
+			cache.set_cached_response([{"q": lead}], "m", {"content": "summary"}, "Summarize",
+				tags=[cache.doc_tag("Lead", lead)])
+			cache.set_cached_response([{"q": lead}], "m", {"content": "answer"}, "Ask AI")
+
+			cache.invalidate_document_cache(frappe._dict(doctype="Lead", name=lead))
+
+			self.assertIsNone(cache.get_cached_response([{"q": lead}], "m", "Summarize"))
+			self.assertEqual(cache.get_cached_response([{"q": lead}], "m", "Ask AI")["content"], "answer")
+
+	def test_overwrite_counts_entry_bytes_once(self):
+		"""Re-caching the same key replaces its size in the byte total instead of adding to it."""
+		from oly_ai.core import cache
+		settings = frappe._dict(enable_caching=1, cache_ttl_hours=1, cache_max_size_mb=8)
+		redis = frappe.cache()
+		bytes_key = redis.make_key(cache.RESPONSE_BYTES_KEY)
+		lead = f"LEAD-{frappe.generate_hash(length=8)}"
+		with patch("oly_ai.core.cache.frappe.get_cached_doc", return_value=settings):
+			before = int(redis.get(bytes_key) or 0)
+			cache.set_cached_response([{"q": lead}], "m", {"content": "answer"}, "Ask AI")
+			once = int(redis.get(bytes_key) or 0)
+			cache.set_cached_response([{"q": lead}], "m", {"content": "answer"}, "Ask AI")
+			self.assertEqual(int(redis.get(bytes_key) or 0), once)
+			self.assertGreater(once, before)
+			cache._drop_responses(redis, [cache.get_cache_key([{"q": lead}], "m", "Ask AI")])
+
+	def test_dropped_entries_leave_their_tag_sets(self):
+		"""Evicting an entry removes it from its tag sets, so they stay bounded."""
+		from oly_ai.core import cache
+		settings = frappe._dict(enable_caching=1, cache_ttl_hours=0, cache_max_size_mb=8)
+		lead = f"LEAD-{frappe.generate_hash(length=8)}"
+		tag = cache.doc_tag("Lead", lead)
+		redis = frappe.cache()
+		with patch("oly_ai.core.cache.frappe.get_cached_doc", return_value=settings):
+			cache.set_cached_response([{"q": lead}], "m", {"content": "summary"}, "Summarize", tags=[tag])
+			self.assertTrue(cache.has_cached_doctype(cache.RESPONSE_DOCTYPES_KEY, "Lead"))
+
+			cache._drop_responses(redis, [cache.get_cache_key([{"q": lead}], "m", "Summarize")])
+			self.assertEqual(redis.scard(redis.make_key(f"{cache.RESPONSE_TAG_KEY}{tag}")), 0)
+
+
+class TestDocumentContextCache(FrappeTestCase):
+	"""Tests for the rendered-context cache in core/context.py."""
+
+	def test_context_cached_until_comment_invalidates(self):
+		"""Repeat calls reuse the rendered context; a Comment on the document drops it."""
+		from oly_ai.core import context
+		context.invalidate_document_context(frappe._dict(doctype="User", name="Administrator"))
+		with patch("oly_ai.core.context._build_document_context", return_value="ctx") as build:
+			context.get_document_context("User", "Administrator", max_length=1234)
+			context.get_document_context("User", "Administrator", max_length=1234)
+			self.assertEqual(build.call_count, 1)
+
+			# Different options are a separate entry
+			context.get_document_context("User", "Administrator", max_length=99)
+			self.assertEqual(build.call_count, 2)
+
+			context.invalidate_document_context(frappe._dict(
+				doctype="Comment", reference_doctype="User", reference_name="Administrator",
+			))
+			context.get_document_context("User", "Administrator", max_length=1234)
+			self.assertEqual(build.call_count, 3)
+
+	def test_cached_context_round_trips_through_redis(self):
+		"""The rendered context is stored under the made key and served from it."""
+		from oly_ai.core import context
+		from oly_ai.core.cache import raw_redis
+		redis = frappe.cache()
+		key = redis.make_key(f"{context.CONTEXT_CACHE_KEY}User:Administrator")
+		redis.delete(key)
+		with patch("oly_ai.core.context._build_document_context", return_value="rendered") as build:
+			self.assertEqual(context.get_document_context("User", "Administrator", max_length=321), "rendered")
+			self.assertEqual(list(raw_redis(redis).hvals(key)), [b"rendered"])
+			self.assertEqual(context.get_document_context("User", "Administrator", max_length=321), "rendered")
+			self.assertEqual(build.call_count, 1)
+		redis.delete(key)
+
+	def test_uncached_doctype_save_skips_redis(self):
+		"""Saves of doctypes never rendered as context don't touch Redis."""
+		from oly_ai.core import context
+		with patch("oly_ai.core.context.has_cached_doctype", return_value=False), \
+				patch("oly_ai.core.context.frappe.cache") as cache:
+			context.invalidate_document_context(frappe._dict(doctype="ToDo", name="T-1"))
+			cache.assert_not_called()
+
+
+class TestPromptRegistry(FrappeTestCase):
+	"""Tests for core/prompt_registry.py — compiled, cached system prompts."""
+
+	def test_prompts_compiled_once_until_invalidated(self):
+		"""Repeat lookups reuse the compiled prompt; invalidation recompiles it."""
+		from oly_ai.core import prompt_registry
+		prompt_registry.invalidate_prompts()
+		with patch("oly_ai.api.chat.get_system_prompt", side_effect=lambda mode: f"prompt:{mode}") as build:
+			first = prompt_registry.get_compiled_prompt("agent")
+			self.assertEqual(prompt_registry.get_prompt("agent"), "prompt:agent")
+			self.assertEqual(build.call_count, 1)
+			# Unknown modes share the "ask" prompt
+			self.assertEqual(prompt_registry.get_prompt("nonsense"), "prompt:ask")
+
+			prompt_registry.invalidate_prompts()
+			again = prompt_registry.get_compiled_prompt("agent")
+			self.assertEqual(build.call_count, 3)
+			self.assertEqual(first.prefix_hash, again.prefix_hash)
+
+
+class TestPromptCaching(FrappeTestCase):
+	"""Tests for provider prompt caching (cache breakpoints and cached-token pricing)."""
+
+	def _provider(self, provider_type):
+		from oly_ai.core.provider import LLMProvider
+		provider = LLMProvider.__new__(LLMProvider)
+		provider.provider_type = provider_type
+		provider.base_url = "https://example.com"
+		provider.api_key = "test"
+		provider.top_p = 1.0
+		return provider
+
+	def test_anthropic_breakpoint_after_stable_prefix(self):
+		"""The marked system prompt and the last tool get cache_control; later context does not."""
+		from oly_ai.core.provider import CACHE_BREAKPOINT
+		messages = [
+			{"role": "system", "content": "instructions", CACHE_BREAKPOINT: "abc"},
+			{"role": "user", "content": "hi"},
+			{"role": "system", "content": "rag context"},
+		]
+		tools = [{"type": "function", "function": {"name": "a"}}, {"type": "function", "function": {"name": "b"}}]
+		_url, _headers, payload = self._provider("Anthropic")._anthropic_request(messages, "claude", 100, 0.3, tools)
+
+		self.assertEqual(payload["system"][0]["cache_control"], {"type": "ephemeral"})
+		self.assertNotIn("cache_control", payload["system"][1])
+		self.assertEqual(payload["tools"][-1]["cache_control"], {"type": "ephemeral"})
+
+	def test_openai_marker_becomes_prompt_cache_key(self):
+		"""OpenAI gets a prompt_cache_key and never sees the marker key."""
+		from oly_ai.core.provider import CACHE_BREAKPOINT
+		messages = [{"role": "system", "content": "instructions", CACHE_BREAKPOINT: "abc"}]
+		_url, _headers, payload = self._provider("OpenAI")._openai_request(messages, "gpt-4o", 100, 0.3)
+		self.assertEqual(payload["prompt_cache_key"], "abc")
+		self.assertNotIn(CACHE_BREAKPOINT, payload["messages"][0])
+
+		_url, _headers, payload = self._provider("Custom")._openai_request(messages, "llama3.1", 100, 0.3)
+		self.assertNotIn("prompt_cache_key", payload)
+
+	def test_cached_tokens_are_discounted(self):
+		"""Cache reads cost a fraction of input; Anthropic usage counts them as input."""
+		from oly_ai.core.cost_tracker import estimate_cost
+		from oly_ai.core.provider import LLMProvider
+		result = LLMProvider._parse_anthropic_response({
+			"content": [{"type": "text", "text": "ok"}],
+			"usage": {"input_tokens": 100, "cache_read_input_tokens": 900, "output_tokens": 10},
+		})
+		self.assertEqual((result["tokens_input"], result["tokens_cached"]), (1000, 900))
+
+		model = "claude-3-7-sonnet-latest"
+		self.assertLess(
+			estimate_cost(model, 1_000_000, 0, tokens_cached=1_000_000),
+			estimate_cost(model, 1_000_000, 0),
+		)
+
+	def test_prompt_cache_stats_read_back_from_redis(self):
+		"""Counters written per request are what the dashboard totals read."""
+		from frappe.utils import today
+		from oly_ai.core import cost_tracker
+		stats_key = f"oly_ai:test:prompt_cache:{frappe.generate_hash(length=8)}:"
+		with patch.object(cost_tracker, "PROMPT_CACHE_STATS_KEY", stats_key):
+			cost_tracker._record_prompt_cache("claude-3-7-sonnet-latest", 1000, 900, 0)
+			stats = cost_tracker.get_prompt_cache_stats()
+		self.assertEqual((stats["input_tokens"], stats["cached_tokens"]), (1000, 900))
+		self.assertEqual(stats["cached_rate"], 90.0)
+		self.assertGreater(stats["saved_usd"], 0)
+		redis = frappe.cache()
+		redis.delete(redis.make_key(f"{stats_key}{today()}"))
+
+	def test_volatile_context_precedes_the_question(self):
+		"""Per-request context is folded into the final user turn, after the cached prefix."""
+		from oly_ai.api.chat import _build_llm_messages
+		from oly_ai.core.provider import CACHE_BREAKPOINT
+		ctx = frappe._dict(
+			rag_context="Leave policy: 20 days", user_memories="", mention_blocks=[],
+			page_context="", file_context="",
+		)
+		conversation = [{"role": "user", "content": "How many leave days?"}]
+		prompt = frappe._dict(text="instructions", prefix_hash="abc")
+		with patch("oly_ai.core.prompt_registry.get_compiled_prompt", return_value=prompt):
+			messages = _build_llm_messages("ask", conversation, ctx)
+
+		self.assertEqual(messages[0][CACHE_BREAKPOINT], "abc")
+		self.assertEqual(messages[-1]["role"], "user")
+		self.assertLess(messages[-1]["content"].index("Leave policy"), messages[-1]["content"].index("How many"))
+		self.assertEqual(conversation[0]["content"], "How many leave days?")